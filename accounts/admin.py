@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ClientProfile, ProviderProfile
+from .models import ClientProfile, Job, MediaBlob, ProviderProfile, Upload
 
 
 @admin.register(ClientProfile)
@@ -10,3 +10,22 @@ class ClientProfileAdmin(admin.ModelAdmin):
 @admin.register(ProviderProfile)
 class ProviderProfileAdmin(admin.ModelAdmin):
 	list_display = ('user', 'full_name', 'professional_email')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+	list_display = ('id', 'task', 'status', 'priority', 'attempts', 'run_at', 'finished_at')
+	list_filter = ('status', 'task')
+
+
+@admin.register(Upload)
+class UploadAdmin(admin.ModelAdmin):
+	list_display = ('id', 'user', 'target', 'filename', 'offset', 'size', 'status', 'expires_at')
+	list_filter = ('status', 'target')
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+	list_display = ('name', 'size', 'refcount', 'created_at')
+	search_fields = ('name', 'sha256')
+	readonly_fields = ('name', 'sha256', 'size', 'created_at')
@@ -1,14 +1,18 @@
 from django.urls import path
 from . import views
+from accounts import realtime
 
 urlpatterns = [
    
     path("login/", views.LoginApi.as_view(), name="api-login"),
     path("logout/", views.LogoutApi.as_view(), name="api-logout"),
+    path("logoutall/", views.LogoutAllApi.as_view(), name="api-logoutall"),
+    path("me/", views.MeAPIView.as_view(), name="api_me"),
     path("register/client/", views.ClientRegisterAPIView.as_view(), name="api-register-client"),
     path("register/provider/", views.ProviderRegisterAPIView.as_view(), name="api-register-provider"),
 
     path("providers/", views.ProviderListAPIView.as_view(), name="api_provider_list"),
+    path("providers/cache-stats/", views.ProviderCacheStatsAPIView.as_view(), name="api_provider_cache_stats"),
     
 
     path("providers/<int:pk>/", views.ProviderRetrieveAPIView.as_view(), name="api_provider_detail"),
@@ -39,7 +43,10 @@ urlpatterns = [
     path("requests/<int:pk>/reject/", views.RejectServiceRequestAPIView.as_view(), name="api_reject_request"),
 
  
+    path("inbox/", views.InboxAPIView.as_view(), name="api_inbox"),
     path("requests/<int:pk>/chat/", views.ChatAPIView.as_view(), name="api_chat"),
+    path("requests/<int:pk>/events/", realtime.chat_events, name="api_request_events"),
+    path("requests/<int:pk>/events/ticket/", views.RealtimeTicketAPIView.as_view(), name="api_request_events_ticket"),
     path("requests/<int:pk>/complete/", views.CompleteServiceAPIView.as_view(), name="api_complete_service"),
     path("requests/<int:pk>/review/", views.ReviewCreateAPIView.as_view(), name="api_review_service"),
     path('provider/reviews/', views.ProviderReviewsListAPIView.as_view(), name='provider-reviews'),
@@ -47,4 +54,10 @@ urlpatterns = [
 
     path("portfolio/add/", views.PortfolioAddAPIView.as_view(), name="api_portfolio_add"),
     path("portfolio/<int:pk>/delete/", views.PortfolioDeleteAPIView.as_view(), name="api_portfolio_delete"),
+
+
+    path("uploads/", views.UploadStartAPIView.as_view(), name="api_upload_start"),
+    path("uploads/<uuid:pk>/", views.UploadDetailAPIView.as_view(), name="api_upload_detail"),
+    path("uploads/<uuid:pk>/chunk/", views.UploadChunkAPIView.as_view(), name="api_upload_chunk"),
+    path("uploads/<uuid:pk>/finalize/", views.UploadFinalizeAPIView.as_view(), name="api_upload_finalize"),
 ]
\ No newline at end of file
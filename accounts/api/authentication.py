@@ -0,0 +1,234 @@
+"""
+Autenticação knox com cache em processo.
+
+O knox original busca os tokens pelo prefixo, compara o hash de cada um e, a
+cada request, percorre todos os tokens do usuário procurando expirados. Aqui o
+digest do token (a chave primária de ``AuthToken``) é procurado primeiro num
+LRU limitado ``digest -> (token_key, expiry, campos do usuário)``; só em caso
+de miss há uma consulta, direto pela chave primária e já com o usuário (JOIN).
+Num hit o usuário é montado dos campos guardados, sem consulta ao banco. As
+entradas vivem no máximo ``AUTH_TOKEN_CACHE_TTL`` segundos (e nunca além da
+expiração do token).
+
+A revogação vale para todos os processos: cada usuário tem um contador de
+versão (``auth:version:<pk>``) no cache compartilhado ``AUTH_TOKEN_CACHE_ALIAS``,
+e cada entrada guarda a versão lida antes de consultar o banco. Apagar um
+token (logout, logoutall, ``purge_expired_tokens``) ou salvar/apagar o
+usuário (ex.: desativado) remove as entradas deste processo na hora e, depois
+do commit, incrementa o contador (``revoke``); num hit com versão diferente o
+token é lido de novo do banco. Por alguns segundos depois de uma revogação,
+o que for lido do banco para aquele usuário não é guardado: a leitura pode ter
+acontecido antes do commit. O alias precisa apontar para um backend
+compartilhado entre os processos (Redis, Memcached, banco).
+
+Tokens expirados não são mais limpos durante o request: ``manage.py
+purge_expired_tokens`` os apaga em lotes.
+"""
+import binascii
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.models import get_token_model
+from rest_framework import exceptions
+
+from accounts.metrics import phase
+
+
+class TokenCache:
+    """LRU thread-safe com TTL por entrada; ``group`` permite remover várias de uma vez."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value, group = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, group=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, group)
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[2] is not None:
+            keys = self._groups.get(entry[2])
+            keys.discard(key)
+            if not keys:
+                del self._groups[entry[2]]
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def delete_group(self, group):
+        with self._lock:
+            for key in list(self._groups.get(group, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60),
+)
+
+
+# Depois de uma revogação, por quanto tempo um miss não vai para o cache (ver _load).
+REVOCATION_SETTLE_SECONDS = 10
+
+
+def _shared_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_pk):
+    return f'auth:version:{user_pk}'
+
+
+def _settling_key(user_pk):
+    return f'auth:settling:{user_pk}'
+
+
+def _seed():
+    # Se o contador for despejado, recomeça de um valor novo (e não de 1), para
+    # que nenhuma entrada guardada sob uma versão antiga volte a valer.
+    return int(time.time() * 1000)
+
+
+def revocation_version(user_pk):
+    cache = _shared_cache()
+    key = _version_key(user_pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def revocation_state(user_pk):
+    """``(versão, revogado há menos de REVOCATION_SETTLE_SECONDS)``."""
+    settling = _shared_cache().get(_settling_key(user_pk)) is not None
+    return revocation_version(user_pk), settling
+
+
+def bump_revocation(user_pk):
+    cache = _shared_cache()
+    # Marcado antes do incremento: quem ler a versão nova também vê a marca.
+    cache.set(_settling_key(user_pk), 1, timeout=REVOCATION_SETTLE_SECONDS)
+    try:
+        cache.incr(_version_key(user_pk))
+    except ValueError:
+        cache.add(_version_key(user_pk), _seed(), timeout=None)
+
+
+def revoke(user_pk, digest=None):
+    """
+    Tira do cache deste processo o token ``digest`` (ou todos os do usuário)
+    e, depois do commit, invalida as entradas do usuário nos outros processos.
+    """
+    if digest is None:
+        token_cache.delete_group(user_pk)
+    else:
+        token_cache.delete(digest)
+    transaction.on_commit(lambda: bump_revocation(user_pk), robust=True)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    invalid_message = _('Invalid token.')
+
+    def authenticate(self, request):
+        with phase('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, token):
+        token = token.decode('utf-8') if isinstance(token, bytes) else token
+        try:
+            digest = hash_token(token)
+        except (TypeError, binascii.Error):
+            raise exceptions.AuthenticationFailed(self.invalid_message)
+
+        cached = token_cache.get(digest)
+        if cached is None or cached[3] != revocation_version(cached[2]):
+            cached = self._load(digest)
+        token_key, expiry, user_values = cached[0], cached[1], cached[4]
+        if expiry is not None and expiry <= timezone.now():
+            token_cache.delete(digest)
+            raise exceptions.AuthenticationFailed(self.invalid_message)
+
+        # Instância nova a cada request (nada compartilhado entre threads), sem consulta.
+        User = get_user_model()
+        user = User.from_db(User.objects.db, self._user_fields(), user_values)
+        # LogoutView só precisa de .delete() (pela pk).
+        auth_token = get_token_model()(digest=digest, token_key=token_key, user=user, expiry=expiry)
+        auth_token._state.adding = False
+        return self.validate_user(auth_token)
+
+    @staticmethod
+    def _user_fields():
+        return [field.attname for field in get_user_model()._meta.concrete_fields]
+
+    def _load(self, digest):
+        fields = self._user_fields()
+        row = (
+            get_token_model().objects.filter(digest=digest)
+            .values_list('token_key', 'expiry', 'user_id', *[f'user__{name}' for name in fields]).first()
+        )
+        if row is None:
+            raise exceptions.AuthenticationFailed(self.invalid_message)
+        token_key, expiry, user_pk, user_values = row[0], row[1], row[2], row[3:]
+        version, settling = revocation_state(user_pk)
+        cached = (token_key, expiry, user_pk, version, user_values)
+        # Revogado há pouco: a consulta pode ter lido o banco antes do commit
+        # da revogação e a versão, depois. Vale só para este request.
+        if not settling:
+            ttl = None if expiry is None else (expiry - timezone.now()).total_seconds()
+            token_cache.set(digest, cached, ttl, group=user_pk)
+        return cached
+
+
+def purge_expired_tokens(batch_size=1000):
+    """Apaga os tokens expirados em lotes. Retorna quantos foram removidos."""
+    model = get_token_model()
+    now = timezone.now()
+    removed = 0
+    while True:
+        digests = list(model.objects.filter(expiry__lt=now).values_list('digest', flat=True)[:batch_size])
+        if not digests:
+            return removed
+        removed += model.objects.filter(digest__in=digests).delete()[0]
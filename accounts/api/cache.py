@@ -0,0 +1,160 @@
+"""
+Cache versionado das respostas públicas de prestadores.
+
+Cada prestador tem um contador de versão (``provider:<pk>``) e a listagem tem
+um contador próprio (``list``). As chaves das respostas embutem a versão, então
+invalidar é só incrementar o contador: as entradas antigas deixam de ser lidas
+e expiram pelo TTL. Os contadores são incrementados pelos signals de
+``ProviderProfile``, ``PortfolioPhoto`` e ``Review`` depois do commit.
+
+Com réplica de leitura (accounts/routers.py), uma resposta montada na réplica
+logo depois de um incremento pode trazer os dados anteriores à escrita e
+ficaria no cache sob a versão nova. Por isso, durante ``REPLICA_PIN_SECONDS``
+após o incremento, respostas lidas da réplica não são guardadas.
+
+O cache guarda os bytes já renderizados (JSON), nunca objetos de modelo. O
+backend é o alias ``PROVIDER_CACHE_ALIAS`` de ``CACHES``; hits e misses são
+contados no mesmo backend e expostos em ``/api/accounts/providers/cache-stats/``.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from accounts.routers import reading_replica, replica_alias
+
+
+LIST = 'list'
+STATS_KEYS = ('hit', 'miss')
+
+
+def get_cache():
+    return caches[getattr(settings, 'PROVIDER_CACHE_ALIAS', 'default')]
+
+
+def _version_key(scope):
+    return f'providers:version:{scope}'
+
+
+def _bumped_key(scope):
+    return f'providers:bumped:{scope}'
+
+
+def _seed():
+    # Se o contador for despejado do cache, recomeça de um valor novo, e não de 1,
+    # para nunca reencontrar respostas gravadas sob uma versão antiga.
+    return int(time.time() * 1000)
+
+
+def provider_scope(pk):
+    return f'provider:{pk}'
+
+
+def get_version(scope):
+    cache = get_cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump(*scopes):
+    cache = get_cache()
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.add(_version_key(scope), _seed(), timeout=None)
+    lag = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+    if replica_alias() and lag > 0:
+        cache.set_many({_bumped_key(scope): 1 for scope in scopes}, timeout=lag)
+
+
+def recently_bumped(scope):
+    """Se o escopo mudou há menos de ``REPLICA_PIN_SECONDS`` (a réplica pode não ter a escrita)."""
+    return get_cache().get(_bumped_key(scope)) is not None
+
+
+def invalidate_provider(provider_id):
+    """Invalida o detalhe do prestador e a listagem, depois do commit."""
+    transaction.on_commit(lambda: bump(provider_scope(provider_id), LIST), robust=True)
+
+
+def _count(view_name, outcome):
+    cache = get_cache()
+    key = f'providers:stats:{view_name}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    """``{view: {"hit": n, "miss": n, "ratio": float}}`` desde o último reset."""
+    cache = get_cache()
+    result = {}
+    for view_name in ('list', 'detail'):
+        keys = {outcome: f'providers:stats:{view_name}:{outcome}' for outcome in STATS_KEYS}
+        values = cache.get_many(keys.values())
+        counts = {outcome: values.get(key, 0) for outcome, key in keys.items()}
+        total = counts['hit'] + counts['miss']
+        result[view_name] = dict(counts, ratio=counts['hit'] / total if total else None)
+    return result
+
+
+def reset_stats():
+    get_cache().delete_many(
+        [f'providers:stats:{view_name}:{outcome}' for view_name in ('list', 'detail') for outcome in STATS_KEYS]
+    )
+
+
+class VersionedCacheMixin:
+    """
+    Para views GET públicas. A subclasse define ``cache_name`` e
+    ``get_cache_scope()``; a chave inclui a versão do escopo, a URL completa
+    (querystring, host) e o formato negociado. Só respostas 200 em JSON são
+    guardadas.
+    """
+    cache_name = None
+
+    def get_cache_scope(self):
+        raise NotImplementedError
+
+    def get_cache_key(self, request):
+        scope = self.get_cache_scope()
+        digest = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+        return f'providers:response:{scope}:{get_version(scope)}:{digest}'
+
+    def get(self, request, *args, **kwargs):
+        self._cache_key = None
+        if request.accepted_renderer.format == 'json':
+            self._cache_key = self.get_cache_key(request)
+            cached = get_cache().get(self._cache_key)
+            if cached is not None:
+                _count(self.cache_name, 'hit')
+                content_type, body = cached
+                response = HttpResponse(body, content_type=content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+            _count(self.cache_name, 'miss')
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_cache_key', None)
+        if key and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            if not (reading_replica() and recently_bumped(self.get_cache_scope())):
+                get_cache().set(
+                    key, (response['Content-Type'], response.content),
+                    timeout=getattr(settings, 'PROVIDER_CACHE_TTL', 300),
+                )
+            response['X-Cache'] = 'MISS'
+        return response
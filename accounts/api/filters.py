@@ -0,0 +1,77 @@
+import math
+
+from django.conf import settings
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+from accounts.geo import geocode, parse_place, within_radius
+from accounts.search import search_providers
+
+
+class ProviderSearchFilter(filters.BaseFilterBackend):
+    """Busca ``?search=`` pelo índice textual, ordenada por relevância."""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_providers(queryset, query)
+
+
+class ProviderDistanceFilter(filters.BaseFilterBackend):
+    """
+    Busca por proximidade. O ponto vem de ``?lat=&lng=`` ou de ``?near=Cidade, UF``;
+    ``?radius=`` em km (padrão ``GEO_DEFAULT_RADIUS_KM``). Sem ``search``, ordena
+    do mais próximo; com ``search``, mantém a ordem de relevância.
+    ``?city=&state=`` filtra pelo município (sem acento/caixa, via gazetteer).
+    """
+
+    def _float(self, request, name):
+        if name not in request.query_params:
+            raise ValidationError({name: ["Este parâmetro é obrigatório."]})
+        try:
+            value = float(request.query_params[name])
+        except ValueError:
+            raise ValidationError({name: ["Deve ser um número."]})
+        if not math.isfinite(value):
+            raise ValidationError({name: ["Deve ser um número finito."]})
+        return value
+
+    def get_point(self, request):
+        params = request.query_params
+        if 'lat' in params or 'lng' in params:
+            latitude, longitude = self._float(request, 'lat'), self._float(request, 'lng')
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValidationError({"lat": ["Coordenadas fora do intervalo."]})
+            return latitude, longitude
+        if params.get('near'):
+            point = geocode(*parse_place(params['near']))
+            if point is None:
+                raise ValidationError({"near": ["Município não encontrado."]})
+            return point
+        return None
+
+    def get_radius(self, request):
+        default = getattr(settings, 'GEO_DEFAULT_RADIUS_KM', 50)
+        if 'radius' not in request.query_params:
+            return default
+        radius = self._float(request, 'radius')
+        if radius <= 0:
+            raise ValidationError({"radius": ["Deve ser maior que zero."]})
+        return min(radius, getattr(settings, 'GEO_MAX_RADIUS_KM', 500))
+
+    def filter_queryset(self, request, queryset, view):
+        city = request.query_params.get('city', '').strip()
+        if city:
+            point = geocode(city, request.query_params.get('state', ''))
+            if point is not None:
+                queryset = queryset.filter(latitude=point[0], longitude=point[1])
+            else:
+                queryset = queryset.filter(city__iexact=city)
+
+        point = self.get_point(request)
+        if point is None:
+            return queryset
+        ranked = 'search_rank' in queryset.query.annotations
+        return within_radius(queryset, *point, self.get_radius(request), order=not ranked)
@@ -0,0 +1,172 @@
+import base64
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) sobre a ordenação do próprio queryset.
+
+    A posição é a tupla de valores das colunas de ordenação do último item
+    (ex.: ``(created_at, id)``), e a próxima página é buscada com
+    ``WHERE (created_at, id) < (...)``. Não há ``COUNT(*)``: a página N custa o
+    mesmo que a primeira. A chave primária é acrescentada à ordenação quando
+    não estiver presente, para que a posição seja única.
+
+    Colunas que aceitam NULL ficam na ordem nativa do banco (NULL é o menor
+    valor no SQLite/MySQL e o maior no Postgres), e o cursor trata NULL com
+    ``__isnull``, já que ``col < NULL`` não compara nada.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def get_page_size(self, request):
+        default = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 20
+        max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        return min(size, max_page_size) if size > 0 else default
+
+    def get_ordering(self, queryset):
+        ordering = [term for term in (queryset.query.order_by or queryset.model._meta.ordering) if isinstance(term, str)]
+        names = {term.lstrip('-') for term in ordering}
+        if not names & {'pk', queryset.model._meta.pk.name}:
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return [(term.lstrip('-'), term.startswith('-')) for term in ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+
+        order_by = [
+            ('-' if descending != reverse else '') + name
+            for name, descending in self.ordering
+        ]
+        queryset = queryset.order_by(*order_by)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def _after(self, position, reverse):
+        """``(a, b, c) > (x, y, z)`` expandido em OR/AND, respeitando a direção de cada coluna."""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.ordering):
+            term = self._beyond(name, descending != reverse, position[index])
+            if term is None:
+                continue
+            for previous, (previous_name, _) in enumerate(self.ordering[:index]):
+                term &= self._equal(previous_name, position[previous])
+            condition |= term
+        return condition
+
+    def _beyond(self, name, descending, value):
+        """Linhas depois de ``value`` na coluna; ``None`` se não há nenhuma."""
+        field = self._field(name)
+        nulls_last = field is not None and field.null and self.nulls_largest != descending
+        if value is None:
+            # Depois do NULL só vêm os valores quando o NULL está no começo.
+            return None if nulls_last else Q(**{f'{name}__isnull': False})
+        term = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+        return term | Q(**{f'{name}__isnull': True}) if nulls_last else term
+
+    def _equal(self, name, value):
+        return Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+    def _field(self, name):
+        if name == 'pk':
+            return self.model._meta.pk
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _position(self, obj):
+        return [getattr(obj, name) for name, _ in self.ordering]
+
+    def encode_cursor(self, position, reverse):
+        values = []
+        for value in position:
+            if isinstance(value, (datetime.date, datetime.time)):
+                value = value.isoformat()
+            elif isinstance(value, decimal.Decimal):
+                value = str(value)
+            values.append(value)
+        payload = json.dumps({'p': values, 'r': reverse}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            values, reverse = payload['p'], bool(payload.get('r'))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = []
+            for (name, _), value in zip(self.ordering, values):
+                field = self._field(name)
+                position.append(field.to_python(value) if field is not None else value)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,9 +1,57 @@
 from rest_framework import serializers
-from accounts.models import ServiceRequest, ProviderProfile, ClientProfile, ChatMessage, Review, PortfolioPhoto
+from accounts.models import ServiceRequest, ProviderProfile, ClientProfile, ChatMessage, Review, PortfolioPhoto, Upload
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.db import IntegrityError, transaction
-from django.db.models import Avg
+
+from accounts.geo import distance_km
+from accounts.images import placeholder, variant_urls
+from accounts.uploads import UploadError, attach, completed_upload
+
+# =======================================================
+# 📦 UPLOADS EM PARTES
+# =======================================================
+
+class UploadSerializer(serializers.ModelSerializer):
+    crc32 = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'target', 'filename', 'content_type', 'size', 'offset', 'crc32', 'sha256', 'status', 'expires_at']
+
+    def get_crc32(self, obj):
+        return f'{obj.crc32:08x}'
+
+class UploadReferenceField(serializers.UUIDField):
+    """Id de um upload concluído para o campo de arquivo ``source`` (destino ``target``)."""
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+        kwargs.setdefault('write_only', True)
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        pk = super().to_internal_value(data)
+        try:
+            return completed_upload(self.context['request'].user, pk, self.target)
+        except UploadError as exc:
+            raise serializers.ValidationError(str(exc))
+
+class AttachUploadsMixin:
+    """Grava o arquivo dos ``UploadReferenceField`` por nome e marca os uploads como anexados."""
+
+    def update(self, instance, validated_data):
+        uploads = [value for value in validated_data.values() if isinstance(value, Upload)]
+        for name, value in list(validated_data.items()):
+            if isinstance(value, Upload):
+                validated_data[name] = value.file
+        with transaction.atomic():
+            try:
+                attach(uploads)
+            except UploadError as exc:
+                raise serializers.ValidationError({"upload": [str(exc)]})
+            return super().update(instance, validated_data)
 
 # =======================================================
 # 👤 SERIALIZERS DE USUÁRIO
@@ -41,24 +89,30 @@ class ProviderSummarySerializer(serializers.ModelSerializer):
         model = ProviderProfile
         fields = ("id", "full_name", "profile_photo", "user")
 
-class ClientProfileSerializer(serializers.ModelSerializer):
+class ClientProfileSerializer(AttachUploadsMixin, serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     email = serializers.ReadOnlyField(source='user.email')
+    profile_photo_upload = UploadReferenceField('client.profile_photo', source='profile_photo')
+    identity_document_upload = UploadReferenceField('client.identity_document', source='identity_document')
     
     class Meta:
         model = ClientProfile
-        fields = ['id', 'full_name', 'username', 'email', 'cpf', 'phone', 'address', 'city', 'state', 'profile_photo', 'identity_document']
+        fields = ['id', 'full_name', 'username', 'email', 'cpf', 'phone', 'address', 'city', 'state', 'profile_photo', 'identity_document', 'profile_photo_upload', 'identity_document_upload']
         read_only_fields = ['id', 'username', 'email', 'cpf']
 
-class ProviderProfileUpdateSerializer(serializers.ModelSerializer):
+class ProviderProfileUpdateSerializer(AttachUploadsMixin, serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     email = serializers.ReadOnlyField(source='user.email')
     certifications_urls = serializers.SerializerMethodField()
     portfolio_photos = serializers.SerializerMethodField()
+    # Arquivos enviados em partes (/uploads/), anexados pelo id.
+    profile_photo_upload = UploadReferenceField('provider.profile_photo', source='profile_photo')
+    identity_document_upload = UploadReferenceField('provider.identity_document', source='identity_document')
+    certifications_upload = UploadReferenceField('provider.certifications', source='certifications')
     
     class Meta:
         model = ProviderProfile
-        fields = ['id', 'full_name', 'username', 'email', 'professional_email', 'phone', 'service_address', 'city', 'state', 'technical_qualification', 'profile_photo', 'identity_document', 'certifications', 'certifications_urls', 'portfolio_photos']
+        fields = ['id', 'full_name', 'username', 'email', 'professional_email', 'phone', 'service_address', 'city', 'state', 'technical_qualification', 'profile_photo', 'identity_document', 'certifications', 'certifications_urls', 'portfolio_photos', 'profile_photo_upload', 'identity_document_upload', 'certifications_upload']
         read_only_fields = ['id', 'username', 'email']
 
     def get_certifications_urls(self, obj):
@@ -79,6 +133,8 @@ class ProviderProfileUpdateSerializer(serializers.ModelSerializer):
             result.append({
                 'id': p.id,
                 'photo': photo_url,
+                'variants': variant_urls(p.photo_variants, request=self.context.get('request')),
+                'placeholder': placeholder(p.photo_variants),
                 'title': p.title or '',
                 'description': p.description or '',
             })
@@ -88,24 +144,50 @@ class ProviderProfileUpdateSerializer(serializers.ModelSerializer):
 
 
 class PortfolioPhotoSerializer(serializers.ModelSerializer):
+    photo_variants = serializers.SerializerMethodField()
+    photo_placeholder = serializers.SerializerMethodField()
+
     class Meta:
         model = PortfolioPhoto
-        fields = ['id', 'photo', 'title', 'description']
+        fields = ['id', 'photo', 'photo_variants', 'photo_placeholder', 'title', 'description']
+
+    def get_photo_variants(self, obj):
+        return variant_urls(obj.photo_variants, request=self.context.get('request'))
+
+    def get_photo_placeholder(self, obj):
+        return placeholder(obj.photo_variants)
 
 class ReviewPublicSerializer(serializers.ModelSerializer):
     """Mostra apenas o necessário da avaliação no perfil público."""
     client_name = serializers.ReadOnlyField(source='service_request.client.username') 
+    client_photo_variants = serializers.SerializerMethodField()
     class Meta:
         model = Review
-        fields = ['id', 'client_rating', 'client_comment', 'client_photo', 'client_reviewed_at', 'client_name']
+        fields = ['id', 'client_rating', 'client_comment', 'client_photo', 'client_photo_variants', 'client_reviewed_at', 'client_name']
+
+    def get_client_photo_variants(self, obj):
+        return variant_urls(obj.client_photo_variants, request=self.context.get('request'))
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('service_request__client')
 
 class ProviderListSerializer(serializers.ModelSerializer):
     """Leve: Para a lista de busca."""
     username = serializers.ReadOnlyField(source='user.username')
     email = serializers.ReadOnlyField(source='user.email')
+    average_rating = serializers.SerializerMethodField()
+    total_reviews = serializers.ReadOnlyField(source='rating_count')
+    distance_km = serializers.SerializerMethodField()
     class Meta:
         model = ProviderProfile
-        fields = ['id', 'full_name', 'username', 'email', 'professional_email', 'phone', 'service_address', 'city', 'state', 'technical_qualification', 'profile_photo']
+        fields = ['id', 'full_name', 'username', 'email', 'professional_email', 'phone', 'service_address', 'city', 'state', 'latitude', 'longitude', 'technical_qualification', 'profile_photo', 'average_rating', 'total_reviews', 'distance_km']
+
+    def get_average_rating(self, obj):
+        return obj.rating_average or 0
+
+    def get_distance_km(self, obj):
+        return distance_km(obj)
 
 class ProviderDetailSerializer(serializers.ModelSerializer):
     """Completo: Para a página de detalhes (inclui Portfolio e Reviews)."""
@@ -116,31 +198,38 @@ class ProviderDetailSerializer(serializers.ModelSerializer):
     portfolio_photos = PortfolioPhotoSerializer(many=True, read_only=True)
     reviews = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
-    total_reviews = serializers.SerializerMethodField()
+    total_reviews = serializers.ReadOnlyField(source='rating_count')
+    rating_histogram = serializers.ReadOnlyField()
     certifications_urls = serializers.SerializerMethodField()
+    profile_photo_variants = serializers.SerializerMethodField()
+    profile_photo_placeholder = serializers.SerializerMethodField()
 
     class Meta:
         model = ProviderProfile
         fields = [
             'id', 'full_name', 'username', 'email', 'professional_email', 
             'phone',
-            'service_address', 'city', 'state', 'technical_qualification', 'profile_photo',
+            'service_address', 'city', 'state', 'latitude', 'longitude', 'technical_qualification', 'profile_photo',
+            'profile_photo_variants', 'profile_photo_placeholder',
             'certifications',
             'certifications_urls',
-            'portfolio_photos', 'reviews', 'average_rating', 'total_reviews'
+            'portfolio_photos', 'reviews', 'average_rating', 'total_reviews', 'rating_histogram'
         ]
 
     def get_reviews(self, obj):
-       
-        reviews = Review.objects.filter(service_request__provider=obj, client_rating__isnull=False).order_by('-client_reviewed_at')
-        return ReviewPublicSerializer(reviews, many=True).data
+        reviews = ReviewPublicSerializer.setup_eager_loading(
+            Review.objects.filter(provider=obj, client_rating__isnull=False)
+        ).order_by('-client_reviewed_at', '-id')
+        return ReviewPublicSerializer(reviews, many=True, context=self.context).data
 
     def get_average_rating(self, obj):
-        avg = Review.objects.filter(service_request__provider=obj, client_rating__isnull=False).aggregate(Avg('client_rating'))
-        return avg['client_rating__avg'] or 0
+        return obj.rating_average or 0
+
+    def get_profile_photo_variants(self, obj):
+        return variant_urls(obj.profile_photo_variants, request=self.context.get('request'))
 
-    def get_total_reviews(self, obj):
-        return Review.objects.filter(service_request__provider=obj, client_rating__isnull=False).count()
+    def get_profile_photo_placeholder(self, obj):
+        return placeholder(obj.profile_photo_variants)
 
     def get_certifications_urls(self, obj):
         if not obj.certifications:
@@ -243,6 +332,23 @@ class LoginSerializer(serializers.Serializer):
             return data
         raise serializers.ValidationError("Credenciais inválidas.")
 
+class ProfileSummarySerializer(serializers.Serializer):
+    """Resumo comum a ClientProfile e ProviderProfile (endpoint /me)."""
+    id = serializers.IntegerField()
+    full_name = serializers.CharField()
+    city = serializers.CharField()
+    state = serializers.CharField()
+    profile_photo = serializers.ImageField()
+    profile_photo_variants = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
+    total_reviews = serializers.IntegerField(source='rating_count')
+
+    def get_profile_photo_variants(self, obj):
+        return variant_urls(obj.profile_photo_variants, request=self.context.get('request'))
+
+    def get_average_rating(self, obj):
+        return obj.rating_average or 0
+
 class ProviderRegisterResponseSerializer(serializers.Serializer):
     """Resposta de registro do prestador com dados completos do perfil."""
     user = UserSerializer(read_only=True)
@@ -263,13 +369,61 @@ class ProviderRegisterResponseSerializer(serializers.Serializer):
 class ChatMessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.ReadOnlyField(source='sender.username')
     is_me = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     class Meta:
         model = ChatMessage
         fields = ['id', 'sender', 'sender_name', 'content', 'created_at', 'is_read', 'is_me']
-        read_only_fields = ['id', 'sender', 'created_at', 'is_read']
+        read_only_fields = ['id', 'sender', 'created_at']
     def get_is_me(self, obj):
         request = self.context.get('request')
-        return obj.sender == request.user if (request and request.user) else False
+        return obj.sender_id == request.user.pk if (request and request.user) else False
+
+    def get_is_read(self, obj):
+        # read_upto: {remetente: marca de leitura do destinatário}
+        read_upto = self.context.get('read_upto', {})
+        return obj.id <= read_upto.get(obj.sender_id, 0)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('sender')
+
+class InboxEntrySerializer(serializers.ModelSerializer):
+    """Uma conversa na caixa de entrada; espera ``unread_count`` anotado."""
+    counterpart = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ServiceRequest
+        fields = ['id', 'status', 'description', 'counterpart', 'last_message', 'last_message_at', 'message_count', 'unread_count']
+
+    PREVIEW_LENGTH = 120
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('last_message', 'provider__user', 'client__client_profile')
+
+    def get_counterpart(self, obj):
+        request = self.context.get('request')
+        if request and obj.client_id == request.user.pk:
+            profile, user = obj.provider, obj.provider.user
+        else:
+            profile, user = getattr(obj.client, 'client_profile', None), obj.client
+        photo = profile.profile_photo if profile else None
+        return {
+            'user_id': user.pk,
+            'name': profile.full_name if profile else user.username,
+            'profile_photo': (request.build_absolute_uri(photo.url) if request else photo.url) if photo else None,
+        }
+
+    def get_last_message(self, obj):
+        message = obj.last_message
+        if message is None:
+            return None
+        content = message.content
+        if len(content) > self.PREVIEW_LENGTH:
+            content = content[:self.PREVIEW_LENGTH - 1] + '…'
+        return {'id': message.id, 'sender': message.sender_id, 'content': content, 'created_at': message.created_at}
 
 class ReviewSerializer(serializers.Serializer):
     rating = serializers.IntegerField(min_value=1, max_value=5)
@@ -322,11 +476,24 @@ class ServiceRequestDetailSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("id", "created_at", "updated_at")
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Carrega em um único JOIN tudo o que os campos aninhados acessam."""
+        return queryset.select_related(
+            'provider__user',
+            'client__provider_profile',
+            'client__client_profile',
+            'review',
+        )
+
     def _get_review(self, obj):
-        try:
-            return obj.review
-        except Review.DoesNotExist:
-            return None
+        # Memoizado na instância: os seis campos de avaliação leem a mesma review.
+        if not hasattr(obj, '_review_cache'):
+            try:
+                obj._review_cache = obj.review
+            except Review.DoesNotExist:
+                obj._review_cache = None
+        return obj._review_cache
 
     def get_client_has_reviewed(self, obj):
         rev = self._get_review(obj)
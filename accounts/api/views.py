@@ -1,15 +1,28 @@
+import hashlib
+import uuid
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, generics, permissions, filters
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework import status, generics, permissions
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.authentication import SessionAuthentication
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import login
-from knox.views import LoginView as KnoxLoginView, LogoutView
+from knox.views import LoginView as KnoxLoginView, LogoutAllView, LogoutView
 from knox.models import AuthToken
 from django.utils import timezone
-
-from accounts.models import ProviderProfile, ClientProfile, ServiceRequest, ChatMessage, Review, PortfolioPhoto
+from django.utils.http import parse_etags
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import ProviderProfile, ClientProfile, ServiceRequest, ChatMessage, ChatReadMarker, Review, PortfolioPhoto, Upload
+from accounts.realtime import issue_ticket
+from accounts.routers import ReadReplicaMixin
+from accounts.uploads import UploadError, append_chunk, attach, completed_upload, discard, finalize_upload, start_upload
 from .serializers import (
     ReviewPublicSerializer, ServiceRequestSerializer, ServiceRequestDetailSerializer,
     ClientRegisterSerializer, ProviderRegisterSerializer,
@@ -17,8 +30,13 @@ from .serializers import (
     ProviderListSerializer, ProviderDetailSerializer,
     ProviderProfileUpdateSerializer,
     ClientProfileSerializer,
-    ChatMessageSerializer, ReviewSerializer, PortfolioPhotoSerializer
+    ChatMessageSerializer, ReviewSerializer, PortfolioPhotoSerializer,
+    ProfileSummarySerializer, InboxEntrySerializer, UploadSerializer,
 )
+from .authentication import CachedTokenAuthentication
+from .cache import LIST, VersionedCacheMixin, provider_scope, reset_stats, stats
+from .filters import ProviderDistanceFilter, ProviderSearchFilter
+from .pagination import KeysetPagination
 
 # =======================================================
 # 🔐 VIEWS DE AUTENTICAÇÃO
@@ -48,6 +66,10 @@ class LogoutApi(LogoutView):
     """Logout e invalidação de Token."""
     pass
 
+class LogoutAllApi(LogoutAllView):
+    """Logout em todos os dispositivos: invalida todos os tokens do usuário."""
+    pass
+
 class ClientRegisterAPIView(generics.GenericAPIView):
     """Cadastro de Cliente."""
     serializer_class = ClientRegisterSerializer
@@ -76,31 +98,103 @@ class ProviderRegisterAPIView(generics.GenericAPIView):
             "token": AuthToken.objects.create(user)[1] 
         }, status=status.HTTP_201_CREATED)
 
+# =======================================================
+# 👤 INICIALIZAÇÃO DO APP (/me)
+# =======================================================
+
+def unread_messages(user):
+    """Mensagens recebidas por ``user`` depois da sua marca de leitura, em todas as conversas."""
+    read_upto = ChatReadMarker.objects.filter(
+        service_request=OuterRef('service_request'), user=user
+    ).values('last_read_message_id')[:1]
+    return ChatMessage.objects.filter(
+        Q(service_request__client=user) | Q(service_request__provider__user=user),
+        id__gt=Coalesce(Subquery(read_upto), 0),
+    ).exclude(sender=user)
+
+
+class MeAPIView(APIView):
+    """
+    Tudo o que o app precisa ao abrir, em uma chamada: usuário, papel,
+    resumo do perfil, contagem de solicitações pendentes/aceitas e total de
+    mensagens não lidas. Três consultas, independentemente do volume.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user = User.objects.select_related('provider_profile', 'client_profile').get(pk=request.user.pk)
+        profile = getattr(user, 'provider_profile', None) or getattr(user, 'client_profile', None)
+        role = 'provider' if hasattr(user, 'provider_profile') else 'client' if profile else None
+
+        counts = ServiceRequest.objects.filter(Q(provider__user=user) | Q(client=user)).aggregate(
+            received_pending=Count('pk', filter=Q(provider__user=user, status=ServiceRequest.STATUS_PENDING)),
+            received_accepted=Count('pk', filter=Q(provider__user=user, status=ServiceRequest.STATUS_ACCEPTED)),
+            sent_pending=Count('pk', filter=Q(client=user, status=ServiceRequest.STATUS_PENDING)),
+            sent_accepted=Count('pk', filter=Q(client=user, status=ServiceRequest.STATUS_ACCEPTED)),
+        )
+        unread = unread_messages(user).aggregate(
+            messages=Count('pk'), conversations=Count('service_request', distinct=True),
+        )
+
+        context = {'request': request}
+        return Response({
+            "user": UserSerializer(user, context=context).data,
+            "role": role,
+            "profile": ProfileSummarySerializer(profile, context=context).data if profile else None,
+            "requests": {
+                "received": {"pending": counts['received_pending'], "accepted": counts['received_accepted']},
+                "sent": {"pending": counts['sent_pending'], "accepted": counts['sent_accepted']},
+            },
+            "unread": unread,
+        })
+
+
 # =======================================================
 # 🔍 BUSCA DE PRESTADORES
 # =======================================================
 
-class ProviderListAPIView(generics.ListAPIView):
+class ProviderListAPIView(ReadReplicaMixin, VersionedCacheMixin, generics.ListAPIView):
     """Lista pública de prestadores com busca."""
     permission_classes = [permissions.AllowAny]
     serializer_class = ProviderListSerializer
-    queryset = ProviderProfile.objects.all()
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['full_name', 'technical_qualification', 'service_address']
+    queryset = ProviderProfile.objects.select_related('user').order_by('-ranking_score', 'id')
+    filter_backends = [ProviderSearchFilter, ProviderDistanceFilter]
+    cache_name = 'list'
 
+    def get_cache_scope(self):
+        return LIST
 
-class ProviderRetrieveAPIView(generics.RetrieveAPIView):
+
+class ProviderRetrieveAPIView(ReadReplicaMixin, VersionedCacheMixin, generics.RetrieveAPIView):
     """Detalhes públicos do prestador (Portfolio, Reviews, etc)."""
     permission_classes = [permissions.AllowAny]
     serializer_class = ProviderDetailSerializer
-    queryset = ProviderProfile.objects.all()
+    queryset = ProviderProfile.objects.select_related('user').prefetch_related('portfolio_photos')
+    cache_name = 'detail'
+
+    def get_cache_scope(self):
+        return provider_scope(self.kwargs['pk'])
+
+
+class ProviderCacheStatsAPIView(APIView):
+    """Hits/misses do cache de prestadores (GET) e reset dos contadores (DELETE)."""
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = None
+
+    def get(self, request):
+        return Response(stats())
+
+    def delete(self, request):
+        reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 class ProviderRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
     """Recupera e atualiza o perfil do prestador autenticado."""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ProviderProfileUpdateSerializer
-    # Garante suporte a upload de arquivos (certifications, profile_photo)
-    parser_classes = (MultiPartParser, FormParser)
+    # Garante suporte a upload de arquivos (certifications, profile_photo);
+    # JSON para anexar uploads em partes (*_upload) sem multipart.
+    parser_classes = (MultiPartParser, FormParser, JSONParser)
     
     def get_object(self):
         """Retorna o ProviderProfile do usuário autenticado."""
@@ -140,18 +234,31 @@ class PortfolioAddAPIView(APIView):
             or request.FILES.get('file')
             or request.FILES.get('image')
         )
-        if not photo_file:
-            return Response({"photo": ["Arquivo de foto é obrigatório (chaves aceitas: photo, file, image)."]}, status=status.HTTP_400_BAD_REQUEST)
+        # ...ou o id de um upload em partes já finalizado
+        upload = None
+        if not photo_file and request.data.get('upload'):
+            try:
+                upload = completed_upload(request.user, _upload_id(request.data['upload']), 'portfolio.photo')
+            except UploadError as exc:
+                return Response({"upload": [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        if not photo_file and upload is None:
+            return Response({"photo": ["Arquivo de foto é obrigatório (chaves aceitas: photo, file, image, upload)."]}, status=status.HTTP_400_BAD_REQUEST)
 
         title = request.data.get('title', '')
         description = request.data.get('description', '')
 
-        obj = PortfolioPhoto.objects.create(
-            provider=request.user.provider_profile,
-            photo=photo_file,
-            title=title,
-            description=description,
-        )
+        with transaction.atomic():
+            if upload is not None:
+                try:
+                    attach([upload])
+                except UploadError as exc:
+                    return Response({"upload": [str(exc)]}, status=exc.status)
+            obj = PortfolioPhoto.objects.create(
+                provider=request.user.provider_profile,
+                photo=photo_file or upload.file,
+                title=title,
+                description=description,
+            )
         return Response(PortfolioPhotoSerializer(obj).data, status=status.HTTP_201_CREATED)
 
 class PortfolioDeleteAPIView(APIView):
@@ -216,7 +323,9 @@ class ProviderRequestsListAPIView(generics.ListAPIView):
         if not hasattr(user, 'provider_profile'):
             return ServiceRequest.objects.none()
         
-        queryset = ServiceRequest.objects.filter(provider=user.provider_profile).order_by('-created_at')
+        queryset = ServiceRequestDetailSerializer.setup_eager_loading(
+            ServiceRequest.objects.filter(provider=user.provider_profile)
+        ).order_by('-created_at', '-id')
         
         # Filtro opcional por status
         status_filter = self.request.query_params.get('status', None)
@@ -232,7 +341,9 @@ class ClientRequestsListAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = ServiceRequest.objects.filter(client=user).order_by('-created_at')
+        queryset = ServiceRequestDetailSerializer.setup_eager_loading(
+            ServiceRequest.objects.filter(client=user)
+        ).order_by('-created_at', '-id')
         
         # Filtro opcional por status
         status_filter = self.request.query_params.get('status', None)
@@ -244,7 +355,7 @@ class ClientRequestsListAPIView(generics.ListAPIView):
 class ServiceRequestDetailAPIView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ServiceRequestDetailSerializer
-    queryset = ServiceRequest.objects.all()
+    queryset = ServiceRequestDetailSerializer.setup_eager_loading(ServiceRequest.objects.all())
 
     def get_object(self):
         sr = super().get_object()
@@ -271,7 +382,7 @@ class AcceptServiceRequestAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, pk):
-        sr = get_object_or_404(ServiceRequest, pk=pk)
+        sr = get_object_or_404(ServiceRequestDetailSerializer.setup_eager_loading(ServiceRequest.objects.all()), pk=pk)
         
         # Verifica se o usuário é o prestador desta solicitação
         if not (hasattr(request.user, 'provider_profile') and request.user.provider_profile == sr.provider):
@@ -302,7 +413,7 @@ class RejectServiceRequestAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, pk):
-        sr = get_object_or_404(ServiceRequest, pk=pk)
+        sr = get_object_or_404(ServiceRequestDetailSerializer.setup_eager_loading(ServiceRequest.objects.all()), pk=pk)
         
         # Verifica se o usuário é o prestador desta solicitação
         if not (hasattr(request.user, 'provider_profile') and request.user.provider_profile == sr.provider):
@@ -333,23 +444,58 @@ class RejectServiceRequestAPIView(APIView):
 # =======================================================
 
 class ChatAPIView(APIView):
+    # Sessão também: sem push (WSGI), a página do chat consulta ``?since=`` daqui.
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
-        """Lista mensagens de uma solicitação."""
-        sr = get_object_or_404(ServiceRequest, pk=pk)
+        """
+        Lista mensagens de uma solicitação.
+
+        ``?since=<id>`` retorna apenas mensagens posteriores a ``id`` (sincronização
+        incremental). A leitura é registrada avançando a marca do usuário até a
+        última mensagem recebida na página, sem escrever nada quando ela não anda.
+        Responde 304 quando ``If-None-Match`` bate com o ETag da página.
+        """
+        sr = get_object_or_404(ServiceRequest.objects.select_related('provider'), pk=pk)
         
         is_provider = hasattr(request.user, 'provider_profile') and request.user.provider_profile == sr.provider
         is_client = request.user == sr.client
         if not (is_provider or is_client):
             return Response({"error": "Não permitido"}, status=status.HTTP_403_FORBIDDEN)
 
-        # Marcar lidas
-        ChatMessage.objects.filter(service_request=sr).exclude(sender=request.user).update(is_read=True)
-
-        messages = sr.messages.all().order_by('created_at')
-        serializer = ChatMessageSerializer(messages, many=True, context={'request': request})
-        return Response(serializer.data)
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({"since": ["Deve ser o id de uma mensagem."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = ChatMessageSerializer.setup_eager_loading(
+            sr.messages.filter(id__gt=since)
+        ).order_by('created_at', 'id')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+
+        # Marcar lidas: avança a marca d'água só se chegou mensagem nova da outra parte
+        markers = dict(sr.read_markers.values_list('user_id', 'last_read_message_id'))
+        last_received = max((m.id for m in page if m.sender_id != request.user.pk), default=0)
+        if last_received > markers.get(request.user.pk, 0):
+            ChatReadMarker.advance(sr, request.user, last_received)
+            markers[request.user.pk] = last_received
+
+        read_upto = {
+            sr.client_id: markers.get(sr.provider.user_id, 0),
+            sr.provider.user_id: markers.get(sr.client_id, 0),
+        }
+        etag = '"%s"' % hashlib.sha1(
+            f"{request.user.pk}|{request.get_full_path()}|{[m.id for m in page]}|{sorted(markers.items())}".encode()
+        ).hexdigest()
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        serializer = ChatMessageSerializer(page, many=True, context={'request': request, 'read_upto': read_upto})
+        response = paginator.get_paginated_response(serializer.data)
+        response['ETag'] = etag
+        return response
 
     def post(self, request, pk):
         """Envia mensagem."""
@@ -366,6 +512,67 @@ class ChatAPIView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class RealtimeTicketAPIView(APIView):
+    """
+    Ticket de uso único para o SSE/WebSocket da conversa
+    (``?ticket=``), no lugar do token knox na URL.
+    """
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        sr = get_object_or_404(ServiceRequest.objects.select_related('provider'), pk=pk)
+        if request.user != sr.client and request.user.pk != sr.provider.user_id:
+            return Response({"error": "Não permitido"}, status=status.HTTP_403_FORBIDDEN)
+        return Response(
+            {"ticket": issue_ticket(request.user, sr.pk), "expires_in": getattr(settings, 'REALTIME_TICKET_TTL', 30)},
+            status=status.HTTP_201_CREATED,
+        )
+
+class InboxAPIView(generics.ListAPIView):
+    """
+    Conversas do usuário (como cliente ou prestador) com ao menos uma
+    mensagem, da atividade mais recente para a mais antiga, com a prévia da
+    última mensagem e o total não lido. Uma consulta por página: o resumo vem
+    das colunas de ``ServiceRequest`` e o não lido de uma subconsulta
+    correlacionada a partir da marca de leitura.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = InboxEntrySerializer
+
+    def get_sides(self, user):
+        """
+        Lados em que o usuário participa. Com um lado só, a ordem vem pronta
+        do índice parcial ``sr_client_inbox_idx``/``sr_provider_inbox_idx``;
+        o OR (quem é prestador e também contrata) ordena só as conversas dele.
+        """
+        provider_id, is_client = User.objects.filter(pk=user.pk).values_list(
+            'provider_profile',
+            Exists(ServiceRequest.objects.filter(client=OuterRef('pk'), last_message_at__isnull=False)),
+        ).get()
+        if provider_id is None:
+            return Q(client=user)
+        if not is_client:
+            return Q(provider_id=provider_id)
+        return Q(client=user) | Q(provider_id=provider_id)
+
+    def get_queryset(self):
+        user = self.request.user
+        read_upto = ChatReadMarker.objects.filter(
+            service_request=OuterRef('pk'), user=user
+        ).values('last_read_message_id')[:1]
+        unread = (
+            ChatMessage.objects.filter(service_request=OuterRef('pk'), id__gt=OuterRef('read_upto'))
+            .exclude(sender=user)
+            .order_by().values('service_request').annotate(n=Count('pk')).values('n')[:1]
+        )
+        return InboxEntrySerializer.setup_eager_loading(
+            ServiceRequest.objects.filter(self.get_sides(user), last_message_at__isnull=False)
+        ).annotate(
+            read_upto=Coalesce(Subquery(read_upto), 0),
+            unread_count=Coalesce(Subquery(unread), 0),
+        ).order_by('-last_message_at', '-id')
+
 # =======================================================
 # ✅ FINALIZAÇÃO E AVALIAÇÃO
 # =======================================================
@@ -425,12 +632,14 @@ class ReviewCreateAPIView(APIView):
             else:
                 return Response({"error": "Usuário inválido"}, status=status.HTTP_403_FORBIDDEN)
 
-            review.save()
+            # Review e agregados do perfil (signals) na mesma transação
+            with transaction.atomic():
+                review.save()
             return Response({"message": "Avaliação enviada!"}, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class ProviderReviewsListAPIView(generics.ListAPIView):
+class ProviderReviewsListAPIView(ReadReplicaMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ReviewPublicSerializer
     
@@ -438,7 +647,89 @@ class ProviderReviewsListAPIView(generics.ListAPIView):
         user = self.request.user
         if not hasattr(user, 'provider_profile'):
             return Review.objects.none()
-        return Review.objects.filter(
-            service_request__provider=user.provider_profile,
+        return ReviewPublicSerializer.setup_eager_loading(Review.objects.filter(
+            provider=user.provider_profile,
             client_rating__isnull=False
-        ).order_by('-client_reviewed_at')
+        )).order_by('-client_reviewed_at', '-id')
+
+
+# =======================================================
+# 📦 UPLOADS EM PARTES (RETOMÁVEIS)
+# =======================================================
+
+def _upload_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise UploadError("Id de upload inválido.")
+
+def _upload_response(upload, status_code=status.HTTP_200_OK):
+    # Upload-Offset permite retomar só com um HEAD/GET.
+    return Response(UploadSerializer(upload).data, status=status_code, headers={'Upload-Offset': str(upload.offset)})
+
+class UploadStartAPIView(APIView):
+    """Inicia um upload: ``target``, ``filename``, ``size`` (bytes) e ``content_type`` opcional."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            upload = start_upload(
+                request.user, request.data.get('target'), request.data.get('filename'),
+                request.data.get('size'), request.data.get('content_type', ''),
+            )
+        except UploadError as exc:
+            return Response({"error": str(exc)}, status=exc.status)
+        return _upload_response(upload, status.HTTP_201_CREATED)
+
+class UploadDetailAPIView(APIView):
+    """Estado do upload (offset para retomar); DELETE cancela."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        return _upload_response(get_object_or_404(Upload, pk=pk, user=request.user))
+
+    def delete(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk, user=request.user)
+        if upload.status == Upload.STATUS_ATTACHED:
+            return Response({"error": "Upload já anexado."}, status=status.HTTP_409_CONFLICT)
+        discard(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class UploadChunkAPIView(APIView):
+    """
+    Recebe uma parte no corpo cru (PUT), no offset de ``Upload-Offset`` (ou
+    ``?offset=``). ``X-Chunk-SHA256`` (hex) confere a parte. Sem parsers: o
+    corpo é lido em blocos direto do stream para o storage.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = ()
+
+    def put(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk, user=request.user)
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.query_params.get('offset', '')))
+        except ValueError:
+            return Response({"error": "Informe o offset (header Upload-Offset ou ?offset=)."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not length:
+            return Response({"error": "Content-Length obrigatório."}, status=status.HTTP_411_LENGTH_REQUIRED)
+        try:
+            append_chunk(upload, offset, request.stream, length, sha256=request.headers.get('X-Chunk-SHA256'))
+        except UploadError as exc:
+            return Response({"error": str(exc), "offset": upload.offset}, status=exc.status)
+        return _upload_response(upload)
+
+class UploadFinalizeAPIView(APIView):
+    """Junta as partes; ``crc32`` (hex) opcional confere o arquivo inteiro."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk, user=request.user)
+        try:
+            finalize_upload(upload, crc32=request.data.get('crc32'))
+        except UploadError as exc:
+            return Response({"error": str(exc), "offset": upload.offset}, status=exc.status)
+        return _upload_response(upload)
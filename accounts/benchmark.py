@@ -0,0 +1,394 @@
+"""
+Benchmark dos endpoints (``manage.py benchmark_endpoints``).
+
+Cada rota de ``accounts/api/api_urls.py`` e ``accounts/urls.py`` tem um ou
+mais cenários em ``SCENARIOS``, executados pelo test client sobre a massa de
+``accounts/seed.py`` em cada tamanho de ``BENCHMARK_SIZES``. Por cenário são
+medidos p50/p95 de latência, número de consultas, tempo de banco e tamanho da
+resposta.
+
+Cada iteração roda numa transação desfeita no final, então cenários que
+escrevem (aceitar, avaliar, enviar mensagem...) sempre partem do mesmo
+estado. O cache de respostas de prestadores é limpo antes de cada iteração:
+o que se mede é o caminho pelo banco.
+
+``check`` compara o resultado com ``BENCHMARK_BUDGETS`` e com um resultado
+anterior (baseline) e devolve as violações.
+"""
+import math
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from knox.models import AuthToken
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import PortfolioPhoto, ProviderProfile, ServiceRequest
+from .search import get_backend
+from .seed import DEFAULT_PASSWORD, MarketplaceSeeder
+from .uploads import append_chunk, start_upload
+
+
+# Rotas fora do benchmark, com o motivo.
+SKIPPED_ROUTES = {
+    'api_request_events': "SSE: a resposta é um stream que não termina",
+}
+
+DEFAULT_SIZES = {
+    'small': {'providers': 50, 'clients': 200, 'requests': 2000},
+    'medium': {'providers': 500, 'clients': 3000, 'requests': 50000},
+    'large': {'providers': 5000, 'clients': 50000, 'requests': 1000000},
+}
+
+
+def sizes():
+    return getattr(settings, 'BENCHMARK_SIZES', DEFAULT_SIZES)
+
+
+def _png():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), (200, 120, 40)).save(buffer, 'PNG')
+    return SimpleUploadedFile('benchmark.png', buffer.getvalue(), content_type='image/png')
+
+
+UPLOAD_BYTES = b'%PDF-1.4 benchmark\n' * 4096
+
+
+class Subjects:
+    """Objetos usados pelos cenários: o prestador e o cliente com mais solicitações e as dele(s)."""
+
+    def __init__(self):
+        busiest = ServiceRequest.objects.values('provider').annotate(n=Count('pk')).order_by('-n', 'provider')[0]
+        self.provider = ProviderProfile.objects.select_related('user').get(pk=busiest['provider'])
+        top_client = ServiceRequest.objects.values('client').annotate(n=Count('pk')).order_by('-n', 'client')[0]
+        self.client = User.objects.get(pk=top_client['client'])
+
+        requests = ServiceRequest.objects.filter(provider=self.provider).select_related('client').order_by('pk')
+        self.chat_request = requests.filter(
+            status__in=[ServiceRequest.STATUS_ACCEPTED, ServiceRequest.STATUS_COMPLETED]
+        ).order_by('-message_count', 'pk').first()
+        self.pending_request = requests.filter(status=ServiceRequest.STATUS_PENDING).first()
+        self.accepted_request = requests.filter(status=ServiceRequest.STATUS_ACCEPTED).first()
+        self.completed_request = requests.filter(status=ServiceRequest.STATUS_COMPLETED).first()
+
+        self.portfolio_photo = PortfolioPhoto.objects.filter(provider=self.provider).first()
+        if self.portfolio_photo is None:
+            self.portfolio_photo = PortfolioPhoto.objects.create(provider=self.provider, photo='portfolio/benchmark.jpg')
+        self.admin = User.objects.filter(is_superuser=True).first() or User.objects.create_superuser(
+            'benchmark_admin', 'benchmark_admin@example.com', DEFAULT_PASSWORD,
+        )
+        # Um upload ainda sem partes e outro com todas, pronto para finalizar.
+        self.fresh_upload = start_upload(self.provider.user, 'provider.certifications', 'benchmark.pdf', len(UPLOAD_BYTES))
+        self.full_upload = start_upload(self.provider.user, 'provider.certifications', 'benchmark.pdf', len(UPLOAD_BYTES))
+        append_chunk(self.full_upload, 0, BytesIO(UPLOAD_BYTES), len(UPLOAD_BYTES))
+        self._tokens = {}
+
+    def token(self, user):
+        if user.pk not in self._tokens:
+            self._tokens[user.pk] = AuthToken.objects.create(user)[1]
+        return self._tokens[user.pk]
+
+
+class Scenario:
+    """
+    Uma requisição medida. ``user``, ``args`` e ``data`` recebem os
+    ``Subjects``; ``session`` autentica por cookie (views HTML) em vez de token.
+    ``expect`` fixa o status esperado (ex.: 302 de formulário aceito); sem ele,
+    qualquer status abaixo de 400 passa. ``content_type`` envia ``data`` como
+    corpo cru e ``headers`` são headers extras (chaves no formato do META).
+    """
+
+    def __init__(self, route, label='', method='get', user=None, session=False, args=None, query='', data=None,
+                 format=None, expect=None, content_type=None, headers=None):
+        self.route = route
+        self.label = label
+        self.method = method
+        self.user = user
+        self.session = session
+        self.args = args
+        self.query = query
+        self.data = data
+        self.format = format
+        self.expect = expect
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    @property
+    def key(self):
+        return f'{self.route}:{self.label}' if self.label else self.route
+
+    def path(self, subjects):
+        url = reverse(self.route, args=self.args(subjects) if self.args else None)
+        return f'{url}?{self.query}' if self.query else url
+
+
+def _provider(s):
+    return s.provider.user
+
+
+def _client(s):
+    return s.client
+
+
+def _chat_client(s):
+    return s.chat_request.client
+
+
+# Os formulários HTML validam a senha (AUTH_PASSWORD_VALIDATORS); a da API não.
+FORM_PASSWORD = 'Xq7-marceneiro-2025'
+
+
+def _registration(s, **extra):
+    return {
+        'username': 'benchmark_new', 'email': 'benchmark_new@example.com', 'full_name': 'Novo Usuário',
+        'phone': '(11) 90000-0000', 'city': 'Campinas', 'state': 'SP', **extra,
+    }
+
+
+SCENARIOS = [
+    # ---- API: autenticação e cadastro ----
+    Scenario('api-login', method='post', format='json',
+             data=lambda s: {'username': s.provider.user.username, 'password': DEFAULT_PASSWORD}),
+    Scenario('api-logout', method='post', user=_provider),
+    Scenario('api-logoutall', method='post', user=_provider),
+    Scenario('api_me', 'provider', user=_provider),
+    Scenario('api_me', 'client', user=_client),
+    Scenario('api-register-client', method='post', format='json', data=lambda s: _registration(
+        s, password=DEFAULT_PASSWORD, password2=DEFAULT_PASSWORD, cpf='00000000000', address='Rua A, 1')),
+    Scenario('api-register-provider', method='post', format='json', data=lambda s: _registration(
+        s, password=DEFAULT_PASSWORD, password2=DEFAULT_PASSWORD, professional_email='novo@example.com',
+        service_address='Rua A, 1', technical_qualification='Eletricista')),
+    # ---- API: prestadores ----
+    Scenario('api_provider_list'),
+    Scenario('api_provider_list', 'search', query='search=eletricista'),
+    Scenario('api_provider_list', 'near', query='near=São Paulo, SP&radius=300'),
+    Scenario('api_provider_cache_stats', user=lambda s: s.admin),
+    Scenario('api_provider_detail', args=lambda s: [s.provider.pk]),
+    Scenario('api_provider_update', user=_provider),
+    Scenario('api_provider_update', 'patch', method='patch', user=_provider, format='multipart',
+             data=lambda s: {'phone': '(11) 90000-0000'}),
+    Scenario('api_client_detail', user=_client, args=lambda s: [s.client.client_profile.pk]),
+    Scenario('api_client_detail', 'patch', method='patch', user=_client, format='json',
+             args=lambda s: [s.client.client_profile.pk], data=lambda s: {'phone': '(11) 90000-0000'}),
+    # ---- API: solicitações ----
+    Scenario('api_create_request', method='post', user=_client, format='json',
+             args=lambda s: [s.provider.pk], data=lambda s: {'description': 'Benchmark'}),
+    Scenario('api_provider_requests', user=_provider),
+    Scenario('api_provider_requests', 'completed', user=_provider, query='status=completed'),
+    Scenario('api_client_requests', user=_client),
+    Scenario('api_request_detail', user=_provider, args=lambda s: [s.chat_request.pk]),
+    Scenario('api_accept_request', method='post', user=_provider, args=lambda s: [s.pending_request.pk]),
+    Scenario('api_reject_request', method='post', user=_provider, args=lambda s: [s.pending_request.pk]),
+    Scenario('api_complete_service', method='post', user=lambda s: s.accepted_request.client,
+             args=lambda s: [s.accepted_request.pk]),
+    Scenario('api_review_service', method='post', user=lambda s: s.completed_request.client, format='json',
+             args=lambda s: [s.completed_request.pk], data=lambda s: {'rating': 5, 'comment': 'Ótimo'}),
+    Scenario('provider-reviews', user=_provider),
+    # ---- API: chat ----
+    Scenario('api_inbox', 'provider', user=_provider),
+    Scenario('api_inbox', 'client', user=_client),
+    Scenario('api_chat', user=_chat_client, args=lambda s: [s.chat_request.pk]),
+    Scenario('api_request_events_ticket', method='post', user=_chat_client, args=lambda s: [s.chat_request.pk]),
+    Scenario('api_chat', 'post', method='post', user=_chat_client, format='json',
+             args=lambda s: [s.chat_request.pk], data=lambda s: {'content': 'Olá!'}),
+    # ---- API: portfólio ----
+    Scenario('api_portfolio_add', method='post', user=_provider, format='multipart',
+             data=lambda s: {'photo': _png(), 'title': 'Benchmark'}),
+    Scenario('api_portfolio_delete', method='delete', user=_provider, args=lambda s: [s.portfolio_photo.pk]),
+    # ---- API: uploads em partes ----
+    Scenario('api_upload_start', method='post', user=_provider, format='json', data=lambda s: {
+        'target': 'provider.certifications', 'filename': 'benchmark.pdf', 'size': len(UPLOAD_BYTES)}),
+    Scenario('api_upload_detail', user=_provider, args=lambda s: [s.fresh_upload.pk]),
+    Scenario('api_upload_chunk', method='put', user=_provider, args=lambda s: [s.fresh_upload.pk],
+             data=lambda s: UPLOAD_BYTES, content_type='application/offset+octet-stream',
+             headers={'HTTP_UPLOAD_OFFSET': '0'}),
+    Scenario('api_upload_finalize', method='post', user=_provider, args=lambda s: [s.full_upload.pk]),
+
+    # ---- HTML ----
+    Scenario('register'),
+    Scenario('register_choice'),
+    Scenario('register_client'),
+    Scenario('register_client', 'post', method='post', expect=302, data=lambda s: _registration(
+        s, password1=FORM_PASSWORD, password2=FORM_PASSWORD, cpf='00000000000')),
+    Scenario('register_provider'),
+    Scenario('register_provider', 'post', method='post', expect=302, data=lambda s: _registration(
+        s, password1=FORM_PASSWORD, password2=FORM_PASSWORD, professional_email='novo@example.com')),
+    Scenario('login'),
+    Scenario('login', 'post', method='post',
+             data=lambda s: {'username': s.provider.user.username, 'password': DEFAULT_PASSWORD}, expect=302),
+    Scenario('logout', method='post', user=_provider, session=True, expect=302),
+    Scenario('my_profile', 'provider', user=_provider, session=True),
+    Scenario('my_profile', 'client', user=_client, session=True),
+    Scenario('provider_detail', args=lambda s: [s.provider.pk]),
+    Scenario('client_detail', args=lambda s: [s.client.username]),
+    Scenario('create_request', user=_client, session=True, args=lambda s: [s.provider.pk]),
+    Scenario('create_request', 'post', method='post', user=_client, session=True,
+             args=lambda s: [s.provider.pk], data=lambda s: {'description': 'Benchmark'}, expect=302),
+    Scenario('provider_requests', user=_provider, session=True),
+    Scenario('client_requests', user=_client, session=True),
+    Scenario('request_detail', user=_provider, session=True, args=lambda s: [s.chat_request.pk]),
+    Scenario('request_detail', 'accept', method='post', user=_provider, session=True,
+             args=lambda s: [s.pending_request.pk], data=lambda s: {'action': 'accept'}, expect=302),
+    Scenario('chat_view', user=_chat_client, session=True, args=lambda s: [s.chat_request.pk]),
+    Scenario('chat_view', 'post', method='post', user=_chat_client, session=True,
+             args=lambda s: [s.chat_request.pk], data=lambda s: {'content': 'Olá!'}, expect=302),
+    Scenario('complete_service', method='post', user=lambda s: s.accepted_request.client, session=True,
+             args=lambda s: [s.accepted_request.pk], expect=302),
+    Scenario('review_service', user=lambda s: s.completed_request.client, session=True,
+             args=lambda s: [s.completed_request.pk]),
+    Scenario('review_service', 'post', method='post', user=lambda s: s.completed_request.client, session=True,
+             args=lambda s: [s.completed_request.pk], data=lambda s: {'rating': 5, 'comment': 'Ótimo'}, expect=302),
+    Scenario('manage_portfolio', user=_provider, session=True),
+    Scenario('manage_portfolio', 'add', method='post', user=_provider, session=True,
+             data=lambda s: {'action': 'add', 'photo': _png(), 'title': 'Benchmark'}, expect=302),
+    Scenario('search', query='q=eletricista'),
+]
+
+
+def _route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def missing_scenarios():
+    """Rotas de accounts sem cenário (nem motivo em ``SKIPPED_ROUTES``)."""
+    from .api import api_urls
+    from . import urls
+    covered = {scenario.route for scenario in SCENARIOS} | set(SKIPPED_ROUTES)
+    routes = [*_route_names(api_urls.urlpatterns), *_route_names(urls.urlpatterns)]
+    return sorted(set(routes) - covered)
+
+
+def percentile(values, fraction):
+    """Percentil pelo método nearest-rank."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _client_for(scenario, subjects):
+    # Erros viram status 500 no resultado, em vez de interromper a medição.
+    client = APIClient(raise_request_exception=False)
+    user = scenario.user(subjects) if scenario.user else None
+    if user is not None and scenario.session:
+        client.force_login(user)
+    elif user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Token {subjects.token(user)}')
+    return client
+
+
+def measure(scenario, subjects, iterations=20, warmup=2):
+    client = _client_for(scenario, subjects)
+    cookies = client.cookies
+    path = scenario.path(subjects)
+    provider_cache = caches[getattr(settings, 'PROVIDER_CACHE_ALIAS', 'default')]
+    timings, db_times, queries, lengths, statuses = [], [], [], [], set()
+    for iteration in range(warmup + iterations):
+        provider_cache.clear()
+        # Logout e login trocam o cookie de sessão; cada iteração volta ao original.
+        client.cookies = cookies.__class__(cookies)
+        kwargs = {}
+        if scenario.data:
+            kwargs['data'] = scenario.data(subjects)
+        if scenario.format:
+            kwargs['format'] = scenario.format
+        if scenario.content_type:
+            kwargs['content_type'] = scenario.content_type
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(client, scenario.method)(path, **kwargs, **scenario.headers)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        if iteration < warmup:
+            continue
+        timings.append(elapsed * 1000)
+        db_times.append(sum(float(query['time']) for query in captured.captured_queries) * 1000)
+        queries.append(len(captured.captured_queries))
+        lengths.append(len(response.content) if not response.streaming else 0)
+        statuses.add(response.status_code)
+    return {
+        'route': scenario.route,
+        'scenario': scenario.key,
+        'method': scenario.method.upper(),
+        'path': path,
+        'status': sorted(statuses),
+        'expected': scenario.expect,
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'db_ms': round(percentile(db_times, 0.50), 3),
+        'queries': max(queries),
+        'bytes': max(lengths),
+    }
+
+
+def reset_data():
+    call_command('flush', interactive=False, verbosity=0)
+    get_backend().clear()
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def run_benchmarks(size_names, iterations=20, warmup=2, only=None, seed=1, end=None, log=None):
+    """Gera a massa de cada tamanho e mede todos os cenários (ou só os de ``only``)."""
+    log = log or (lambda message: None)
+    scenarios = [s for s in SCENARIOS if not only or s.route in only or s.key in only]
+    results = []
+    for size in size_names:
+        reset_data()
+        log(f"[{size}] gerando dados...")
+        MarketplaceSeeder(seed=seed, end=end, **sizes()[size]).run()
+        subjects = Subjects()
+        for scenario in scenarios:
+            result = measure(scenario, subjects, iterations=iterations, warmup=warmup)
+            result['size'] = size
+            results.append(result)
+            log(
+                f"[{size}] {result['scenario']:<40} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                f"{result['queries']:3d} consultas  {result['bytes']:8d} B  {result['status']}"
+            )
+    return results
+
+
+def _budget(scenario_key, route):
+    budgets = getattr(settings, 'BENCHMARK_BUDGETS', {})
+    return {**budgets.get('*', {}), **budgets.get(route, {}), **budgets.get(scenario_key, {})}
+
+
+def check(results, baseline=None, tolerance=0.25, metrics=('queries', 'p95_ms', 'bytes')):
+    """
+    Violações de orçamento (das ``metrics``), respostas de erro e regressões
+    contra ``baseline`` (lista de resultados anterior): mais consultas, ou p95
+    acima de ``tolerance`` e de ``BENCHMARK_NOISE_MS``.
+    """
+    noise = getattr(settings, 'BENCHMARK_NOISE_MS', 2)
+    previous = {(row['size'], row['scenario']): row for row in baseline or []}
+    failures = []
+    for row in results:
+        name = f"[{row['size']}] {row['scenario']}"
+        errors = [code for code in row['status'] if code >= 400 or row['expected'] not in (None, code)]
+        if errors:
+            failures.append(f"{name}: respondeu {errors}")
+        for metric, limit in _budget(row['scenario'], row['route']).items():
+            if metric in metrics and row[metric] > limit:
+                failures.append(f"{name}: {metric} = {row[metric]} acima do orçamento {limit}")
+        old = previous.get((row['size'], row['scenario']))
+        if old is None:
+            continue
+        if row['queries'] > old['queries']:
+            failures.append(f"{name}: {row['queries']} consultas (baseline {old['queries']})")
+        if row['p95_ms'] > old['p95_ms'] * (1 + tolerance) and row['p95_ms'] - old['p95_ms'] > noise:
+            failures.append(f"{name}: p95 {row['p95_ms']} ms (baseline {old['p95_ms']} ms)")
+    return failures
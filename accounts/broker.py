@@ -0,0 +1,144 @@
+"""
+Pub/sub de eventos em tempo real (chat e status das solicitações).
+
+- ``InMemoryBroker``: entrega direta entre threads/event loop do mesmo processo;
+  suficiente para um único worker ASGI.
+- ``DatabaseBroker``: para vários processos sem serviço externo. ``publish``
+  grava o evento em ``BrokerEvent`` e cada processo roda um único poller que
+  repassa os eventos novos aos seus assinantes locais.
+
+O backend é escolhido por ``REALTIME_BROKER`` (caminho pontuado da classe).
+``publish`` pode ser chamado de código síncrono; ``subscribe`` é assíncrono.
+"""
+import asyncio
+import contextlib
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BrokerEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+def request_channel(service_request_id):
+    return f'request:{service_request_id}'
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        self._deliver(channel, event)
+
+    def _deliver(self, channel, event):
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # Event loop já encerrado; o assinante some no finally de subscribe().
+                pass
+
+    def channels(self):
+        with self._lock:
+            return [channel for channel, subscribers in self._subscribers.items() if subscribers]
+
+    def _on_subscribe(self, loop):
+        pass
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, channel):
+        """Uso: ``async with broker.subscribe(canal) as queue: evento = await queue.get()``."""
+        loop = asyncio.get_running_loop()
+        entry = (loop, asyncio.Queue())
+        with self._lock:
+            self._subscribers[channel].add(entry)
+        self._on_subscribe(loop)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(entry)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class DatabaseBroker(InMemoryBroker):
+    def __init__(self):
+        super().__init__()
+        self.poll_interval = getattr(settings, 'REALTIME_POLL_INTERVAL', 0.5)
+        self.retention = timedelta(seconds=getattr(settings, 'REALTIME_EVENT_RETENTION', 300))
+        self._poller = None
+
+    def publish(self, channel, event):
+        BrokerEvent.objects.create(channel=channel, payload=event)
+
+    def _on_subscribe(self, loop):
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll())
+
+    @staticmethod
+    def _latest_id():
+        close_old_connections()
+        return BrokerEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    @staticmethod
+    def _fetch(after, channels):
+        close_old_connections()
+        return list(
+            BrokerEvent.objects.filter(id__gt=after, channel__in=channels)
+            .order_by('id').values_list('id', 'channel', 'payload')
+        )
+
+    def _prune(self):
+        close_old_connections()
+        BrokerEvent.objects.filter(created_at__lt=timezone.now() - self.retention).delete()
+
+    async def _poll(self):
+        last_id = await sync_to_async(self._latest_id)()
+        last_prune = timezone.now()
+        while self.channels():
+            await asyncio.sleep(self.poll_interval)
+            channels = self.channels()
+            if not channels:
+                break
+            try:
+                rows = await sync_to_async(self._fetch)(last_id, channels)
+                for event_id, channel, payload in rows:
+                    last_id = event_id
+                    self._deliver(channel, payload)
+                if timezone.now() - last_prune > self.retention:
+                    last_prune = timezone.now()
+                    await sync_to_async(self._prune)()
+            except Exception:
+                logger.exception("Falha ao buscar eventos do DatabaseBroker")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, 'REALTIME_BROKER', 'accounts.broker.InMemoryBroker')
+            _broker = import_string(path)()
+        return _broker
+
+
+def publish_on_commit(channel, event):
+    """Publica depois do commit, para que o assinante nunca veja dados não gravados."""
+    transaction.on_commit(lambda: get_broker().publish(channel, event), robust=True)
@@ -0,0 +1,32 @@
+"""
+Resumo do chat em ``ServiceRequest`` (``last_message``, ``last_message_at``,
+``message_count``), para a caixa de entrada listar conversas sem agregar
+``ChatMessage``. Mensagem nova aplica um UPDATE incremental; remoção recalcula.
+"""
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def record_message(message):
+    ServiceRequest = global_apps.get_model('accounts', 'ServiceRequest')
+    ServiceRequest.objects.filter(pk=message.service_request_id).update(
+        last_message=message, last_message_at=message.created_at, message_count=F('message_count') + 1,
+    )
+
+
+def refresh_chat_summaries(queryset=None, apps=global_apps):
+    """Recalcula o resumo das solicitações de ``queryset`` (padrão: todas)."""
+    ServiceRequest = apps.get_model('accounts', 'ServiceRequest')
+    ChatMessage = apps.get_model('accounts', 'ChatMessage')
+    if queryset is None:
+        queryset = ServiceRequest.objects.all()
+    messages = ChatMessage.objects.filter(service_request=OuterRef('pk')).order_by()
+    latest = messages.order_by('-created_at', '-id')
+    return queryset.update(
+        last_message=Subquery(latest.values('pk')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+        message_count=Coalesce(
+            Subquery(messages.values('service_request').annotate(n=Count('pk')).values('n')[:1]), Value(0)
+        ),
+    )
@@ -0,0 +1,256 @@
+"""
+Entrega dos arquivos de ``MEDIA_ROOT`` (``media_view``, em ``MEDIA_URL``).
+
+O Django decide (acesso, ETag, 304, cabeçalhos de cache) e os bytes saem por
+um backend configurável em ``MEDIA_SENDFILE_BACKEND``:
+
+- ``NginxSendfile``: ``X-Accel-Redirect`` para ``MEDIA_SENDFILE_PREFIX``
+  (uma ``location internal`` do nginx apontando para o ``MEDIA_ROOT``);
+- ``ApacheSendfile``: ``X-Sendfile`` com o caminho absoluto (mod_xsendfile);
+- ``PythonSendfile`` (padrão): ``FileResponse``, que o servidor WSGI entrega
+  com ``sendfile`` quando oferece ``wsgi.file_wrapper`` (ex.: gunicorn).
+
+Nos dois primeiros o servidor da frente atende ``Range``; no ``FileResponse``
+o intervalo (um só, ``bytes=a-b``) é tratado aqui.
+
+Arquivos dos campos de ``MEDIA_PRIVATE_FIELDS`` (documentos de identidade) e
+os uploads em andamento só são entregues ao dono e à equipe, com
+``Cache-Control: private``. Os públicos com nome por conteúdo
+(accounts/storage.py) nunca mudam e são marcados ``immutable``; os demais
+ficam ``MEDIA_CACHE_MAX_AGE`` segundos no cache.
+
+Os arquivos são enviados por usuários e saem da origem do próprio site: só
+imagens raster (``INLINE_TYPES``) são exibidas inline. Qualquer outro tipo
+(HTML, SVG, XML, PDF...) vai como ``attachment``, e toda resposta leva
+``Content-Security-Policy: sandbox``, para que um "certificado" ``.html`` ou
+``.svg`` nunca rode como conteúdo ativo do site. Os cabeçalhos são gravados
+aqui, então valem também para o nginx e o Apache.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+import uuid
+from urllib.parse import quote
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.functional import cached_property
+from django.utils.http import content_disposition_header, http_date
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+from .api.authentication import CachedTokenAuthentication
+from .models import Upload
+from .storage import NAME_DIGEST_LENGTH
+
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Únicos tipos entregues inline; o resto é baixado como anexo.
+INLINE_TYPES = frozenset({'image/jpeg', 'image/png', 'image/webp', 'image/gif'})
+UPLOADS_PREFIX = 'uploads/'
+_CONTENT_NAME = re.compile(r'^[0-9a-f]{%d}$' % NAME_DIGEST_LENGTH)
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class PythonSendfile:
+    """``FileResponse``; o servidor WSGI usa ``sendfile`` se tiver ``wsgi.file_wrapper``."""
+    handles_range = False
+
+    def response(self, request, name, path, stat_result, content_type, byte_range=None):
+        file = open(path, 'rb')
+        if byte_range is None:
+            return FileResponse(file, content_type=content_type)
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(_FileRange(file, end - start + 1), content_type=content_type, status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat_result.st_size}'
+        return response
+
+
+class NginxSendfile:
+    """``X-Accel-Redirect``: o nginx lê o arquivo e atende ``Range``."""
+    handles_range = True
+
+    def response(self, request, name, path, stat_result, content_type, byte_range=None):
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_SENDFILE_PREFIX', '/protected-media/')
+        # O nginx decodifica a URI: espaços, acentos, ``%`` e ``?`` precisam ir codificados.
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+        return response
+
+
+class ApacheSendfile:
+    """``X-Sendfile`` (mod_xsendfile) com o caminho absoluto."""
+    handles_range = True
+
+    def response(self, request, name, path, stat_result, content_type, byte_range=None):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+
+class _FileRange:
+    """Lê no máximo ``length`` bytes a partir da posição atual; ``fileno`` permite ``sendfile``."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.name = file.name
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def get_backend():
+    return import_string(getattr(settings, 'MEDIA_SENDFILE_BACKEND', 'accounts.delivery.PythonSendfile'))()
+
+
+class PrivateMedia:
+    """Prefixos privados e quem pode ler cada arquivo neles."""
+
+    @cached_property
+    def fields(self):
+        return [
+            apps.get_model(label)._meta.get_field(field_name)
+            for label, field_name in getattr(settings, 'MEDIA_PRIVATE_FIELDS', ())
+        ]
+
+    @cached_property
+    def prefixes(self):
+        return tuple(field.upload_to for field in self.fields) + (UPLOADS_PREFIX,)
+
+    def is_private(self, name):
+        return name.startswith(self.prefixes)
+
+    def can_read(self, user, name):
+        if not user.is_authenticated:
+            return False
+        if user.is_staff:
+            return True
+        for field in self.fields:
+            if name.startswith(field.upload_to) and field.model.objects.filter(**{field.name: name, 'user': user}).exists():
+                return True
+        uploads = Upload.objects.filter(user=user)
+        if name.startswith(UPLOADS_PREFIX + 'parts/'):
+            # uploads/parts/<id>/...
+            try:
+                upload_id = uuid.UUID(name.split('/')[2])
+            except (IndexError, ValueError):
+                return False
+            parts = uploads.filter(pk=upload_id).values_list('parts', flat=True).first()
+            return name in (parts or ())
+        return uploads.filter(file=name).exists()
+
+
+private_media = PrivateMedia()
+
+
+def _authenticated_user(request):
+    """Usuário da sessão ou, para o app, do token knox no ``Authorization``."""
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        result = CachedTokenAuthentication().authenticate(Request(request))
+    except AuthenticationFailed:
+        return request.user
+    return result[0] if result else request.user
+
+
+def _etag(name, stat_result):
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    if _CONTENT_NAME.match(stem):
+        return f'"{stem}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _byte_range(request, etag, size):
+    """``(início, fim)`` do ``Range``; ``None`` para o arquivo inteiro; ``False`` se insatisfazível."""
+    header = request.headers.get('Range')
+    if not header or request.method != 'GET':
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range.strip() != etag:
+        # O arquivo mudou (ou If-Range com data): entrega inteiro.
+        return None
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Vários intervalos ou formato desconhecido: entrega o arquivo inteiro.
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def media_view(request, name):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    name = posixpath.normpath(name).lstrip('/')
+    if any(part.startswith('.') for part in name.split('/')):
+        raise Http404
+    try:
+        path = default_storage.path(name)
+        stat_result = os.stat(path)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+
+    private = private_media.is_private(name)
+    if private and not private_media.can_read(_authenticated_user(request), name):
+        # 404 e não 403: não revela que o documento existe.
+        raise Http404
+
+    etag = _etag(name, stat_result)
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat_result.st_mtime))
+    if response is None:
+        backend = get_backend()
+        byte_range = None if backend.handles_range else _byte_range(request, etag, stat_result.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat_result.st_size}'
+            return response
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = backend.response(request, name, path, stat_result, content_type, byte_range)
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(stat_result.st_mtime)
+        response['X-Content-Type-Options'] = 'nosniff'
+        response['Content-Security-Policy'] = 'sandbox'
+        if content_type not in INLINE_TYPES:
+            response['Content-Disposition'] = content_disposition_header(True, posixpath.basename(name))
+    response['ETag'] = etag
+
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie', 'Authorization'))
+    elif _CONTENT_NAME.match(os.path.splitext(posixpath.basename(name))[0]):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600))
+    return response
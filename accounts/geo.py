@@ -0,0 +1,133 @@
+"""
+Geolocalização de prestadores por município, sem PostGIS.
+
+As coordenadas vêm de um gazetteer offline (CSV ``uf,municipio,latitude,
+longitude`` em ``GAZETTEER_PATH``; o ``accounts/data/municipios.csv`` traz os
+5.570 municípios do IBGE, com a sede nas capitais e grandes cidades e o
+centroide da malha municipal nos demais). O perfil é geocodificado no
+``save()`` a partir de ``city``/``state``.
+
+A busca por raio usa o índice ``(latitude, longitude)``: primeiro um
+bounding box (faixa de latitude no índice, longitude filtrada nele), depois a
+distância equiretangular exata em SQL puro — só aritmética, então funciona
+em qualquer banco e serve também para ordenar.
+"""
+import csv
+import functools
+import math
+import re
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField
+
+from .search import fold
+
+
+KM_PER_DEGREE = 111.32
+
+STATES = {
+    'AC': 'Acre', 'AL': 'Alagoas', 'AP': 'Amapá', 'AM': 'Amazonas', 'BA': 'Bahia',
+    'CE': 'Ceará', 'DF': 'Distrito Federal', 'ES': 'Espírito Santo', 'GO': 'Goiás',
+    'MA': 'Maranhão', 'MT': 'Mato Grosso', 'MS': 'Mato Grosso do Sul', 'MG': 'Minas Gerais',
+    'PA': 'Pará', 'PB': 'Paraíba', 'PR': 'Paraná', 'PE': 'Pernambuco', 'PI': 'Piauí',
+    'RJ': 'Rio de Janeiro', 'RN': 'Rio Grande do Norte', 'RS': 'Rio Grande do Sul',
+    'RO': 'Rondônia', 'RR': 'Roraima', 'SC': 'Santa Catarina', 'SP': 'São Paulo',
+    'SE': 'Sergipe', 'TO': 'Tocantins',
+}
+_STATE_KEYS = {fold(uf): uf for uf in STATES} | {fold(name): uf for uf, name in STATES.items()}
+_PLACE_SEPARATOR = re.compile(r'\s*(?:,|/|\s-\s)\s*')
+
+
+def _key(text):
+    return ' '.join(fold(text).split())
+
+
+def normalize_state(state):
+    """Sigla da UF a partir da sigla ou do nome ("são paulo" -> "SP"); '' se desconhecida."""
+    return _STATE_KEYS.get(_key(state), '')
+
+
+@functools.lru_cache(maxsize=None)
+def municipalities():
+    """Linhas do gazetteer: ``[(uf, município, lat, lng), ...]``, na ordem do arquivo."""
+    path = getattr(settings, 'GAZETTEER_PATH', settings.BASE_DIR / 'accounts' / 'data' / 'municipios.csv')
+    with open(path, newline='', encoding='utf-8') as fh:
+        return [
+            (row['uf'].upper(), row['municipio'], float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(fh)
+        ]
+
+
+@functools.lru_cache(maxsize=None)
+def gazetteer():
+    """``{(uf, município normalizado): (lat, lng)}`` e o índice só por nome."""
+    by_state, by_name = {}, {}
+    for uf, municipio, latitude, longitude in municipalities():
+        name = _key(municipio)
+        by_state[(uf, name)] = (latitude, longitude)
+        by_name.setdefault(name, []).append((latitude, longitude))
+    return by_state, by_name
+
+
+def geocode(city, state=''):
+    """Coordenadas do município, ou None. Sem UF, só resolve nomes que não se repetem."""
+    name = _key(city)
+    if not name:
+        return None
+    by_state, by_name = gazetteer()
+    uf = normalize_state(state)
+    if uf:
+        return by_state.get((uf, name))
+    matches = by_name.get(name, [])
+    return matches[0] if len(matches) == 1 else None
+
+
+def parse_place(text):
+    """"Campinas, SP", "Campinas/SP" ou "Campinas - SP" -> ("Campinas", "SP")."""
+    parts = _PLACE_SEPARATOR.split((text or '').strip(), maxsplit=1)
+    return (parts[0], parts[1]) if len(parts) == 2 else (parts[0], '')
+
+
+def bounding_box(latitude, longitude, radius_km):
+    delta_lat = radius_km / KM_PER_DEGREE
+    delta_lng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lng, longitude + delta_lng
+
+
+def within_radius(queryset, latitude, longitude, radius_km, order=True):
+    """
+    Filtra por distância e anota ``distance_sq`` (graus², longitude já
+    corrigida pela latitude de referência). Ordena do mais próximo se ``order``.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    scale = math.cos(math.radians(latitude))
+    distance_sq = ExpressionWrapper(
+        (F('latitude') - latitude) * (F('latitude') - latitude)
+        + (F('longitude') - longitude) * (F('longitude') - longitude) * (scale * scale),
+        output_field=FloatField(),
+    )
+    queryset = queryset.filter(
+        latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng),
+    ).annotate(distance_sq=distance_sq).filter(distance_sq__lte=(radius_km / KM_PER_DEGREE) ** 2)
+    return queryset.order_by('distance_sq', 'pk') if order else queryset
+
+
+def distance_km(obj):
+    distance_sq = getattr(obj, 'distance_sq', None)
+    return None if distance_sq is None else round(math.sqrt(distance_sq) * KM_PER_DEGREE, 1)
+
+
+def geocode_providers(queryset, batch_size=500):
+    """Regrava latitude/longitude de ``queryset`` (aceita modelos históricos). Retorna quantos têm coordenadas."""
+    located = 0
+    batch = []
+    for provider in queryset.only('pk', 'city', 'state').iterator(chunk_size=batch_size):
+        provider.latitude, provider.longitude = geocode(provider.city, provider.state) or (None, None)
+        located += provider.latitude is not None
+        batch.append(provider)
+        if len(batch) >= batch_size:
+            queryset.model.objects.bulk_update(batch, ['latitude', 'longitude'])
+            batch = []
+    if batch:
+        queryset.model.objects.bulk_update(batch, ['latitude', 'longitude'])
+    return located
@@ -0,0 +1,224 @@
+"""
+Variantes redimensionadas (WebP e JPEG) das imagens enviadas.
+
+Cada campo de imagem de ``IMAGE_FIELDS`` tem um JSONField ``<campo>_variants``
+no mesmo modelo, no formato::
+
+    {"source": "portfolio/foto.jpg", "width": 4032, "height": 3024,
+     "webp": {"320": "portfolio/variants/foto_320w.webp", ...},
+     "jpeg": {"320": "portfolio/variants/foto_320w.jpg", ...},
+     "placeholder": {"color": "#a0522d", "preview": "data:image/jpeg;base64,..."}}
+
+O ``placeholder`` (cor dominante e uma prévia de ~20 px embutida) é calculado
+junto com as variantes; com ele e as dimensões a página reserva o espaço e
+pinta o bloco antes de baixar a imagem (``placeholder``, tag ``picture``).
+
+As variantes são geradas fora do request: o signal de post_save enfileira
+``process_image`` na fila de tarefas (accounts/jobs.py). O comando
+``generate_image_variants`` processa o acervo existente em paralelo.
+"""
+import base64
+import os
+import posixpath
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .jobs import enqueue
+
+
+IMAGE_FIELDS = (
+    ('accounts.PortfolioPhoto', 'photo'),
+    ('accounts.ProviderProfile', 'profile_photo'),
+    ('accounts.ClientProfile', 'profile_photo'),
+    ('accounts.Review', 'client_photo'),
+)
+
+# Enviado após gravar variantes (o UPDATE não dispara post_save): sender, pk, field_name.
+variants_stored = Signal()
+
+FORMATS = (
+    ('webp', 'WEBP', 'webp'),
+    ('jpeg', 'JPEG', 'jpg'),
+)
+
+
+def variant_widths():
+    return tuple(getattr(settings, 'IMAGE_VARIANT_WIDTHS', (160, 320, 640, 1280)))
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def _variant_name(source, width, extension):
+    directory, filename = posixpath.split(source)
+    stem = os.path.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}_{width}w.{extension}')
+
+
+def _encode(image, pil_format, quality=None):
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    quality = quality or getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+    image.save(buffer, pil_format, quality=quality, optimize=pil_format == 'JPEG')
+    return buffer.getvalue()
+
+
+def dominant_color(image):
+    """Cor mais frequente numa redução para 64 px com paleta de 8 cores, em ``#rrggbb``."""
+    small = image.convert('RGB').resize((64, 64), Image.BOX).quantize(colors=8)
+    _, index = max(small.getcolors())
+    red, green, blue = small.getpalette()[index * 3:index * 3 + 3]
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def preview_data_uri(image):
+    """Prévia minúscula (lado maior ``IMAGE_PLACEHOLDER_SIZE`` px) como data URI JPEG."""
+    size = getattr(settings, 'IMAGE_PLACEHOLDER_SIZE', 20)
+    preview = image.copy()
+    preview.thumbnail((size, size), Image.LANCZOS)
+    encoded = _encode(preview, 'JPEG', quality=getattr(settings, 'IMAGE_PLACEHOLDER_QUALITY', 50))
+    return 'data:image/jpeg;base64,' + base64.b64encode(encoded).decode('ascii')
+
+
+def render_variants(source, storage=default_storage):
+    """
+    Gera e grava as variantes de ``source`` (nome no storage). Não acessa o
+    banco, então pode rodar em outro processo. Larguras maiores que a
+    original são ignoradas. Se uma largura falha, as já gravadas nesta
+    chamada são apagadas antes de o erro subir: a próxima tentativa grava
+    todas de novo e nada fica órfão.
+    """
+    with storage.open(source, 'rb') as fh:
+        image = ImageOps.exif_transpose(Image.open(fh))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    variants = {
+        'source': source, 'width': image.width, 'height': image.height,
+        'placeholder': {'color': dominant_color(image), 'preview': preview_data_uri(image)},
+    }
+    for key, _, _ in FORMATS:
+        variants[key] = {}
+    saved = []
+    try:
+        for width in variant_widths():
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for key, pil_format, extension in FORMATS:
+                name = _variant_name(source, width, extension)
+                saved.append(storage.save(name, ContentFile(_encode(resized, pil_format))))
+                variants[key][str(width)] = saved[-1]
+    except Exception:
+        for name in saved:
+            storage.delete(name)
+        raise
+    return variants
+
+
+def store_variants(model_label, pk, field_name, variants, storage=default_storage):
+    """
+    Grava o resultado, desde que o campo ainda aponte para o mesmo arquivo.
+
+    Cada ``storage.save`` de ``render_variants`` conta uma referência no blob
+    (accounts/storage.py), mesmo quando o conteúdo é o de antes. Depois do
+    commit são devolvidas as variantes que o resultado substitui ou, se o
+    campo mudou nesse meio tempo, as que acabaram de ser geradas.
+    """
+    from .media import delete_on_commit, variant_names
+    from .storage import is_content_addressed
+
+    model = apps.get_model(model_label)
+    key = variants_field(field_name)
+    source = variants['source']
+    with transaction.atomic():
+        current = list(
+            model.objects.select_for_update().filter(pk=pk, **{field_name: source}).values_list(key, flat=True)
+        )
+        if current:
+            updated = model.objects.filter(pk=pk).update(**{key: variants})
+            previous = current[0] or {}
+            # Variantes de outra origem já saíram com o arquivo (media.replaced_files).
+            stale = variant_names(previous) if previous.get('source') == source else []
+            if not is_content_addressed(storage):
+                # Num storage comum, o mesmo nome é o mesmo arquivo, regravado.
+                fresh = set(variant_names(variants))
+                stale = [name for name in stale if name not in fresh]
+        else:
+            updated = 0
+            stale = variant_names(variants)
+        delete_on_commit(stale, storage=storage)
+    if updated:
+        variants_stored.send(sender=model, pk=pk, field_name=field_name)
+    return updated
+
+
+def process_image(model_label, pk, field_name, source):
+    """
+    Tarefa da fila; erros sobem para que o worker tente de novo. Não faz
+    nada se o campo já aponta para outro arquivo ou se o resultado já está
+    gravado (o worker caiu depois do ``store_variants``).
+    """
+    model = apps.get_model(model_label)
+    stored = list(model.objects.filter(pk=pk, **{field_name: source}).values_list(variants_field(field_name), flat=True))
+    if not stored or ((stored[0] or {}).get('source') == source and 'placeholder' in stored[0]):
+        return
+    store_variants(model_label, pk, field_name, render_variants(source))
+
+
+def schedule_variants(instance, field_name):
+    """Agenda a geração se o arquivo mudou; limpa as variantes se ele foi removido."""
+    file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field(field_name)) or {}
+    if not file:
+        if variants:
+            type(instance).objects.filter(pk=instance.pk).update(**{variants_field(field_name): {}})
+            setattr(instance, variants_field(field_name), {})
+        return
+    if variants.get('source') == file.name:
+        return
+    enqueue(process_image, model_label=instance._meta.label, pk=instance.pk, field_name=field_name, source=file.name)
+
+
+def variant_urls(variants, storage=default_storage, request=None):
+    """``{"webp": {"320": url, ...}, "jpeg": {...}}`` a partir do JSON salvo."""
+    result = {}
+    for key, _, _ in FORMATS:
+        urls = {}
+        for width, name in (variants or {}).get(key, {}).items():
+            url = storage.url(name)
+            urls[width] = request.build_absolute_uri(url) if request else url
+        result[key] = urls
+    return result
+
+
+def placeholder(variants):
+    """``{"width", "height", "color", "preview"}`` para a API; ``None`` se ainda não processada."""
+    variants = variants or {}
+    if 'placeholder' not in variants:
+        return None
+    return {'width': variants['width'], 'height': variants['height'], **variants['placeholder']}
+
+
+def srcset(variants, key='webp', include_source=False, storage=default_storage):
+    """Valor do atributo ``srcset`` para um formato (opcionalmente com a original no topo)."""
+    variants = variants or {}
+    entries = sorted(variants.get(key, {}).items(), key=lambda item: int(item[0]))
+    candidates = [f'{storage.url(name)} {width}w' for width, name in entries]
+    if include_source and variants.get('source'):
+        candidates.append(f"{storage.url(variants['source'])} {variants['width']}w")
+    return ', '.join(candidates)
@@ -0,0 +1,229 @@
+"""
+Fila de tarefas em segundo plano guardada no próprio banco (modelo ``Job``).
+
+``enqueue(func, **kwargs)`` grava a tarefa na transação de quem chama: se o
+request fizer rollback a tarefa some junto, e o worker só a enxerga depois do
+commit. O worker (``manage.py run_jobs``) reivindica tarefas com um UPDATE
+condicional, que funciona em SQLite e Postgres sem trava externa, executa
+``func(**kwargs)`` e, em caso de erro, reagenda com backoff exponencial até
+``max_attempts``.
+
+A reivindicação é um lease: enquanto a tarefa roda, uma thread de heartbeat
+renova ``locked_at`` a cada ``JOB_HEARTBEAT_INTERVAL`` segundos. Só tarefas
+sem heartbeat há mais de ``JOB_LOCK_TIMEOUT`` segundos (worker morto) voltam
+para a fila, então uma tarefa longa não é executada duas vezes.
+
+Hoje só a geração de variantes de imagem passa pela fila. Continuam no
+request, de propósito: gravar o arquivo original enviado (ele só existe no
+upload e a resposta devolve a URL) e publicar o status da solicitação, que é
+um ``publish_on_commit`` (um INSERT ou uma entrega em memória).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task_path(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, *, priority=0, delay=None, max_attempts=None, **kwargs):
+    """
+    Agenda ``func(**kwargs)``. ``func`` é uma função de módulo (ou o caminho
+    pontuado dela) e ``kwargs`` precisa ser serializável em JSON.
+    """
+    return Job.objects.create(
+        task=func if isinstance(func, str) else task_path(func),
+        kwargs=kwargs,
+        priority=priority,
+        run_at=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or _setting('JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def retry_delay(attempts):
+    """Backoff exponencial com jitter: ~base, 2×base, 4×base... até o teto."""
+    base = _setting('JOB_RETRY_BACKOFF', 10)
+    ceiling = _setting('JOB_RETRY_BACKOFF_MAX', 3600)
+    seconds = min(ceiling, base * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=seconds * random.uniform(0.5, 1.0))
+
+
+def heartbeat_interval():
+    """Intervalo do heartbeat, sempre bem abaixo do ``JOB_LOCK_TIMEOUT``."""
+    return min(_setting('JOB_HEARTBEAT_INTERVAL', 60), _setting('JOB_LOCK_TIMEOUT', 600) / 3)
+
+
+class Heartbeat:
+    """Renova o lease de uma tarefa em execução numa thread própria (``with Heartbeat(job):``)."""
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or heartbeat_interval()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job.pk}', daemon=True)
+
+    def beat(self):
+        """Renova ``locked_at``; retorna 0 se o lease já não é deste worker."""
+        return Job.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by, status=Job.STATUS_RUNNING).update(
+            locked_at=timezone.now(),
+        )
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if not self.beat():
+                        logger.warning("Tarefa %s (#%s) perdeu o lease", self.job.task, self.job.pk)
+                        return
+                except OperationalError:
+                    logger.warning("Banco ocupado ao renovar o lease da tarefa #%s", self.job.pk, exc_info=True)
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class Worker:
+    """Executa tarefas em ``concurrency`` threads; cada thread tem sua conexão."""
+
+    def __init__(self, concurrency=None, poll_interval=None, name=None):
+        self.concurrency = concurrency or _setting('JOB_CONCURRENCY', 2)
+        self.poll_interval = poll_interval if poll_interval is not None else _setting('JOB_POLL_INTERVAL', 1.0)
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stop_event = threading.Event()
+
+    # ---- fila ----
+
+    def claim(self, owner):
+        """Reivindica a próxima tarefa pronta (maior prioridade, mais antiga)."""
+        now = timezone.now()
+        candidates = list(
+            Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+            .order_by('-priority', 'run_at', 'id')
+            .values_list('id', flat=True)[:self.concurrency * 2]
+        )
+        for pk in candidates:
+            claimed = Job.objects.filter(pk=pk, status=Job.STATUS_QUEUED).update(
+                status=Job.STATUS_RUNNING, locked_by=owner, locked_at=now, attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return Job.objects.get(pk=pk)
+        return None
+
+    def execute(self, job):
+        owner = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status=Job.STATUS_RUNNING)
+        try:
+            with Heartbeat(job):
+                import_string(job.task)(**job.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            if job.attempts >= job.max_attempts:
+                logger.error("Tarefa %s (#%s) falhou de vez:\n%s", job.task, job.pk, error)
+                updated = owner.update(status=Job.STATUS_FAILED, last_error=error, locked_by='', locked_at=None,
+                                       finished_at=timezone.now())
+            else:
+                logger.warning("Tarefa %s (#%s) falhou, nova tentativa agendada:\n%s", job.task, job.pk, error)
+                updated = owner.update(status=Job.STATUS_QUEUED, last_error=error, locked_by='', locked_at=None,
+                                       run_at=timezone.now() + retry_delay(job.attempts))
+            succeeded = False
+        else:
+            updated = owner.update(status=Job.STATUS_DONE, locked_by='', locked_at=None, finished_at=timezone.now())
+            succeeded = True
+        if not updated:
+            # O lease expirou (heartbeat não conseguiu renovar) e outro worker já responde pela tarefa.
+            logger.warning("Tarefa %s (#%s) terminou sem o lease; resultado descartado", job.task, job.pk)
+        return succeeded
+
+    def run_one(self, owner):
+        """Executa uma tarefa, se houver. Retorna True se algo foi executado."""
+        close_old_connections()
+        job = self.claim(owner)
+        if job is None:
+            return False
+        self.execute(job)
+        return True
+
+    # ---- manutenção ----
+
+    def release_stale(self):
+        """Devolve à fila (ou falha) tarefas cujo heartbeat parou: o worker morreu."""
+        limit = timezone.now() - timedelta(seconds=_setting('JOB_LOCK_TIMEOUT', 600))
+        stale = Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=limit)
+        error = "Worker não concluiu a tarefa dentro de JOB_LOCK_TIMEOUT."
+        stale.filter(attempts__gte=F('max_attempts')).update(
+            status=Job.STATUS_FAILED, last_error=error, locked_by='', locked_at=None, finished_at=timezone.now(),
+        )
+        return stale.update(status=Job.STATUS_QUEUED, last_error=error, locked_by='', locked_at=None)
+
+    def prune(self):
+        """Apaga tarefas concluídas mais antigas que ``JOB_RETENTION`` segundos."""
+        limit = timezone.now() - timedelta(seconds=_setting('JOB_RETENTION', 7 * 24 * 3600))
+        return Job.objects.filter(status=Job.STATUS_DONE, finished_at__lt=limit).delete()[0]
+
+    # ---- laço ----
+
+    def _loop(self, owner, burst):
+        while not self.stop_event.is_set():
+            try:
+                if self.run_one(owner):
+                    continue
+            except OperationalError:
+                # SQLite ocupado por outro escritor: tenta de novo no próximo ciclo.
+                logger.warning("Banco ocupado ao buscar tarefas", exc_info=True)
+            if burst:
+                break
+            self.stop_event.wait(self.poll_interval)
+        close_old_connections()
+
+    def run(self, burst=False):
+        """Bloqueia até ``stop()`` (ou até esvaziar a fila, com ``burst``)."""
+        self.release_stale()
+        self.prune()
+        threads = [
+            threading.Thread(target=self._loop, args=(f'{self.name}/{index}', burst), name=f'job-worker-{index}')
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        interval = _setting('JOB_LOCK_TIMEOUT', 600) / 2
+        next_maintenance = time.monotonic() + interval
+        while any(thread.is_alive() for thread in threads):
+            if self.stop_event.wait(1.0):
+                break
+            if time.monotonic() >= next_maintenance:
+                next_maintenance = time.monotonic() + interval
+                self.release_stale()
+                self.prune()
+        for thread in threads:
+            thread.join()
+        close_old_connections()
+
+    def stop(self):
+        self.stop_event.set()
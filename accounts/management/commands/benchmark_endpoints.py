@@ -0,0 +1,71 @@
+import json
+import tempfile
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from accounts.benchmark import check, missing_scenarios, run_benchmarks, sizes
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede latência (p50/p95), consultas e tamanho da resposta de todas as rotas de accounts, "
+        "num banco de teste com dados gerados. Falha se passar do orçamento ou regredir contra um baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=getattr(settings, 'BENCHMARK_DEFAULT_SIZES', ['small']))
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', nargs='+', help="Rotas (nome da URL) ou cenários (rota:rótulo) a medir.")
+        parser.add_argument('--output', help="Grava o resultado em JSON neste arquivo.")
+        parser.add_argument('--baseline', help="JSON de uma execução anterior para comparar.")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Piora aceita no p95 contra o baseline (0.25 = 25%%).")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        unknown = [size for size in options['sizes'] if size not in sizes()]
+        if unknown:
+            raise CommandError(f"Tamanho(s) desconhecido(s): {', '.join(unknown)}. Disponíveis: {', '.join(sizes())}.")
+        missing = missing_scenarios()
+        if missing:
+            raise CommandError(f"Rotas sem cenário de benchmark: {', '.join(missing)}.")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as fh:
+                baseline = json.load(fh)['results']
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        databases = runner.setup_databases()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                results = run_benchmarks(
+                    options['sizes'], iterations=options['iterations'], warmup=options['warmup'],
+                    only=options['only'], seed=options['seed'], end=datetime(2025, 1, 1, tzinfo=timezone.utc),
+                    log=self.stdout.write,
+                )
+        finally:
+            runner.teardown_databases(databases)
+            teardown_test_environment()
+
+        failures = check(results, baseline, options['tolerance'])
+        if options['output']:
+            report = {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'database': settings.DATABASES['default']['ENGINE'],
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+                'sizes': {size: sizes()[size] for size in options['sizes']},
+                'results': results,
+                'failures': failures,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultado gravado em {options['output']}.")
+        if failures:
+            raise CommandError("Benchmark reprovado:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} medição(ões) dentro do orçamento."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from accounts.storage import dedupe_media
+
+
+class Command(BaseCommand):
+    help = "Migra a mídia existente para nomes por conteúdo (deduplicando) e monta as contagens de referência."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Só conta o que seria migrado.")
+
+    def handle(self, *args, **options):
+        stats = dedupe_media(
+            batch_size=options['batch_size'], dry_run=options['dry_run'],
+            log=lambda message: self.stdout.write(message),
+        )
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{stats['files']} arquivo(s) migrado(s), {stats['references']} referência(s) atualizada(s), "
+            f"{stats['missing']} ausente(s), {stats['bytes_saved']} bytes economizados."
+        ))
@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from accounts.images import IMAGE_FIELDS, render_variants, store_variants, variants_field
+
+
+class Command(BaseCommand):
+    help = "Gera as variantes WebP/JPEG das imagens já enviadas, em paralelo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Processos (padrão: nº de CPUs).")
+        parser.add_argument('--force', action='store_true', help="Regera mesmo as imagens já processadas.")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def _pending(self, model, field_name, force):
+        queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+        rows = queryset.order_by('pk').values_list('pk', field_name, variants_field(field_name))
+        for pk, source, variants in rows.iterator(chunk_size=2000):
+            # Sem placeholder: processada antes de ele existir.
+            if force or (variants or {}).get('source') != source or 'placeholder' not in (variants or {}):
+                yield pk, source
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            for label, field_name in IMAGE_FIELDS:
+                model = apps.get_model(label)
+                pending = list(self._pending(model, field_name, options['force']))
+                for start in range(0, len(pending), options['batch_size']):
+                    futures = {
+                        executor.submit(render_variants, source): pk
+                        for pk, source in pending[start:start + options['batch_size']]
+                    }
+                    for future in as_completed(futures):
+                        try:
+                            variants = future.result()
+                        except Exception as exc:
+                            failed += 1
+                            self.stderr.write(f"{label} #{futures[future]}: {exc}")
+                            continue
+                        store_variants(label, futures[future], field_name, variants)
+                        done += 1
+                self.stdout.write(f"{label}.{field_name}: {len(pending)} imagem(ns) na fila.")
+        self.stdout.write(self.style.SUCCESS(f"Variantes geradas: {done} imagem(ns), {failed} falha(s)."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from accounts.api.cache import LIST, bump, provider_scope
+from accounts.geo import gazetteer, geocode_providers, municipalities
+from accounts.models import ProviderProfile
+
+
+class Command(BaseCommand):
+    help = "Recalcula latitude/longitude de todos os prestadores (ex.: após trocar o GAZETTEER_PATH)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        municipalities.cache_clear()
+        gazetteer.cache_clear()
+        located = geocode_providers(ProviderProfile.objects.all(), batch_size=options['batch_size'])
+        # bulk_update não dispara post_save: invalida o cache das respostas aqui.
+        ids = list(ProviderProfile.objects.values_list('pk', flat=True))
+        bump(LIST, *(provider_scope(pk) for pk in ids))
+        total = len(ids)
+        self.stdout.write(self.style.SUCCESS(f"{located} de {total} prestador(es) geolocalizado(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.api.authentication import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Apaga em lotes os tokens knox expirados (rodar periodicamente, ex.: cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        removed = purge_expired_tokens(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{removed} token(s) expirado(s) removido(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.uploads import purge_uploads
+
+
+class Command(BaseCommand):
+    help = "Remove os uploads em partes vencidos, com as partes e arquivos não anexados (rodar periodicamente, ex.: cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        removed = purge_uploads(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{removed} upload(s) vencido(s) removido(s)."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from accounts.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recalcula as médias e histogramas de avaliação de prestadores e clientes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        providers, clients = rebuild_rating_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Agregados recalculados: {providers} prestador(es), {clients} cliente(s) com avaliações."
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import ProviderProfile
+from accounts.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o índice de busca de prestadores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        with transaction.atomic():
+            count = backend.rebuild(ProviderProfile.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} prestador(es) indexado(s) com {type(backend).__name__}."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from accounts.ranking import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = "Recalcula o score de ranking dos prestadores marcados como desatualizados (rodar periodicamente, ex.: cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recalcula todos, não só os desatualizados.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        refreshed, changed = refresh_rankings(full=options['all'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{refreshed} ranking(s) recalculado(s), {changed} score(s) alterado(s)."))
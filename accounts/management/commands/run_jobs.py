@@ -0,0 +1,24 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from accounts.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = "Executa as tarefas em segundo plano da fila em banco."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None, help="Threads (padrão: JOB_CONCURRENCY).")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Segundos entre consultas com a fila vazia.")
+        parser.add_argument('--burst', action='store_true', help="Sai quando a fila esvaziar.")
+
+    def handle(self, *args, **options):
+        worker = Worker(concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+        self.stdout.write(f"Worker {worker.name} com {worker.concurrency} thread(s).")
+        try:
+            worker.run(burst=options['burst'])
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stdout.write(self.style.SUCCESS("Worker encerrado."))
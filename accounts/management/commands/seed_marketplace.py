@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.seed import DEFAULT_PASSWORD, MarketplaceSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos (prestadores, clientes, solicitações, chats e avaliações) para testes de carga. "
+        "Determinístico: a mesma --seed e os mesmos parâmetros geram os mesmos dados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--providers', type=int, default=200)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=10000, help="Solicitações de serviço no total.")
+        parser.add_argument('--messages', type=int, default=6, help="Média de mensagens por conversa.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--media', action='store_true', help="Gera imagens de placeholder (perfil, portfólio, avaliações).")
+        parser.add_argument('--media-variety', type=int, default=12, help="Imagens distintas por tipo, reaproveitadas.")
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help="Senha de todos os usuários gerados.")
+        parser.add_argument('--prefix', default='seed', help="Prefixo dos usernames gerados.")
+        parser.add_argument(
+            '--end', default='2025-01-01',
+            help="Data (AAAA-MM-DD) em que termina o histórico gerado; fixa para os dados serem reprodutíveis.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            end = datetime.fromisoformat(options['end']).replace(tzinfo=timezone.utc)
+        except ValueError:
+            raise CommandError("--end deve estar no formato AAAA-MM-DD.")
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Já existem usuários com o prefixo '{prefix}_'; use outro --prefix ou um banco novo.")
+
+        seeder = MarketplaceSeeder(
+            providers=options['providers'], clients=options['clients'], requests=options['requests'],
+            messages=options['messages'], seed=options['seed'], batch_size=options['batch_size'],
+            media=options['media'], media_variety=options['media_variety'], password=options['password'],
+            prefix=prefix, end=end, log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        counts = seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            "Gerados: {providers} prestador(es), {clients} cliente(s), {portfolio} foto(s) de portfólio, "
+            "{requests} solicitação(ões), {messages} mensagem(ns), {reviews} avaliação(ões).".format(**counts)
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from accounts.media import sweep_media
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga do MEDIA_ROOT os arquivos que nenhum registro referencia e corrige as contagens dos blobs. "
+        "Continua de onde a execução anterior parou (rodar periodicamente, ex.: cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=None, help="Para depois de N lotes (retoma na próxima).")
+        parser.add_argument('--dry-run', action='store_true', help="Só conta o que seria apagado.")
+        parser.add_argument('--restart', action='store_true', help="Ignora o ponto de parada e começa do início.")
+        parser.add_argument('--grace', type=int, default=None, help="Idade mínima (s) de um arquivo sem referência.")
+
+    def handle(self, *args, **options):
+        stats = sweep_media(
+            batch_size=options['batch_size'], max_batches=options['max_batches'], dry_run=options['dry_run'],
+            restart=options['restart'], grace=options['grace'], log=lambda message: self.stdout.write(message),
+        )
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        status = "varredura concluída" if stats['finished'] else "varredura parcial (rode de novo para continuar)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{status}: {stats['scanned']} arquivo(s), {stats['deleted']} órfão(s) "
+            f"({stats['bytes']} bytes), {stats['recounted']} contagem(ns) corrigida(s)."
+        ))
@@ -0,0 +1,262 @@
+"""
+Limpeza de arquivos de mídia órfãos.
+
+Dois mecanismos:
+
+- ``delete_on_commit``: apaga arquivos depois do commit. Os signals usam para
+  o arquivo (e as variantes) de uma linha removida ou de um campo substituído
+  (``remember_files`` guarda os nomes como vieram do banco);
+- ``sweep_media`` (comando ``sweep_media``): percorre o ``MEDIA_ROOT`` em
+  ordem, em lotes de ``batch_size`` arquivos, e confere cada um contra todos
+  os FileField/ImageField, as variantes (``<campo>_variants``) e os uploads
+  em andamento. O que não é referenciado e tem mais de ``MEDIA_SWEEP_GRACE``
+  segundos é apagado; nos blobs (accounts/storage.py) a contagem de
+  referências é corrigida. O ponto de parada fica em
+  ``MEDIA_SWEEP_STATE_FILE``, então uma execução interrompida (ou limitada
+  por ``max_batches``) continua de onde parou.
+
+Entradas que começam com ponto (``.incoming``, o próprio estado) são ignoradas.
+"""
+import json
+import os
+import time
+import uuid
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+
+from .images import FORMATS, IMAGE_FIELDS, variants_field
+from .models import MediaBlob, Upload
+from .storage import file_fields
+
+# Nomes por consulta ao procurar variantes no JSON (cada nome vira dois LIKE).
+VARIANT_LOOKUP_CHUNK = 100
+
+
+def delete_on_commit(names, storage=default_storage):
+    """Apaga ``names`` do storage só depois do commit; num rollback os arquivos continuam válidos."""
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: [storage.delete(name) for name in names], robust=True)
+
+
+def variant_names(variants):
+    # Só os formatos: ``placeholder`` também é um dict, mas de cor e data URI.
+    names = []
+    for key, _, _ in FORMATS:
+        names.extend(name for name in ((variants or {}).get(key) or {}).values() if isinstance(name, str))
+    return names
+
+
+def _file_attnames(model):
+    return [field.attname for field in model._meta.concrete_fields if field.get_internal_type() in ('FileField', 'ImageField')]
+
+
+def _variant_attnames(model):
+    return {field_name: variants_field(field_name) for label, field_name in IMAGE_FIELDS if model._meta.label == label}
+
+
+def remember_files(instance):
+    """
+    Guarda os nomes de arquivo e as variantes gravados no banco, lendo o
+    ``__dict__`` (sem consulta e sem carregar campos adiados). Linhas novas
+    ainda não têm arquivo gravado.
+    """
+    if instance.pk is None:
+        instance._stored_files = {}
+        return
+    values = instance.__dict__
+    variant_attnames = _variant_attnames(type(instance))
+    instance._stored_files = {
+        attname: (getattr(values[attname], 'name', values[attname]), values.get(variant_attnames.get(attname)))
+        for attname in _file_attnames(type(instance)) if attname in values
+    }
+
+
+def replaced_files(instance):
+    """Arquivos (com as variantes) que a linha deixou de referenciar desde ``remember_files``."""
+    names = []
+    for attname, (old, variants) in getattr(instance, '_stored_files', {}).items():
+        current = getattr(instance, attname)
+        if old and old != (current.name if current else None):
+            names.append(old)
+            if (variants or {}).get('source') == old:
+                names.extend(variant_names(variants))
+    return names
+
+
+def instance_files(instance):
+    """Todos os arquivos (com as variantes) referenciados pela linha."""
+    names = []
+    variant_attnames = _variant_attnames(type(instance))
+    for attname in _file_attnames(type(instance)):
+        file = getattr(instance, attname)
+        if file:
+            names.append(file.name)
+            variants = getattr(instance, variant_attnames.get(attname, ''), None) or {}
+            if variants.get('source') == file.name:
+                names.extend(variant_names(variants))
+    return names
+
+
+# =======================================================
+# 🧹 VARREDURA DO MEDIA_ROOT
+# =======================================================
+
+def _key(name):
+    return name.split('/')
+
+
+def walk(root, start_after=None):
+    """Caminhos relativos (com ``/``) em ordem, depois de ``start_after``, sem entradas com ponto."""
+    cursor = _key(start_after) if start_after else None
+
+    def visit(directory, prefix):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                key = _key(name)
+                # Pula diretórios inteiros antes do cursor.
+                if cursor is None or key >= cursor[:len(key)]:
+                    yield from visit(entry.path, name + '/')
+            elif entry.is_file(follow_symlinks=False) and (cursor is None or _key(name) > cursor):
+                yield name
+
+    yield from visit(root, '')
+
+
+def references(names):
+    """``Counter`` nome -> quantas referências no banco, para os ``names`` informados."""
+    names = list(names)
+    counts = Counter()
+    for model, field in file_fields():
+        rows = model.objects.filter(**{f'{field.name}__in': names}).values_list(field.name, flat=True)
+        counts.update(rows)
+
+    # Variantes sempre ficam num diretório ``variants`` (images._variant_name).
+    candidates = [name for name in names if '/variants/' in name]
+    wanted = set(candidates)
+    for label, field_name in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        key = variants_field(field_name)
+        for start in range(0, len(candidates), VARIANT_LOOKUP_CHUNK):
+            # Filtro grosso no texto do JSON; a conferência exata é feita em Python.
+            text = Q()
+            for name in candidates[start:start + VARIANT_LOOKUP_CHUNK]:
+                text |= Q(variants_text__contains=name) | Q(variants_text__contains=json.dumps(name)[1:-1])
+            rows = model.objects.annotate(variants_text=Cast(key, TextField())).filter(text).values_list(field_name, key)
+            for source, variants in rows:
+                if (variants or {}).get('source') == source:
+                    counts.update(name for name in variant_names(variants) if name in wanted)
+
+    wanted = set(names)
+    counts.update(
+        Upload.objects.filter(status=Upload.STATUS_COMPLETE, file__in=names).values_list('file', flat=True)
+    )
+    part_uploads = {name.split('/')[2] for name in names if name.startswith('uploads/parts/') and name.count('/') >= 3}
+    if part_uploads:
+        pending = Upload.objects.filter(pk__in=_uuids(part_uploads), status=Upload.STATUS_PENDING)
+        for parts in pending.values_list('parts', flat=True):
+            counts.update(name for name in parts if name in wanted)
+    return counts
+
+
+def _uuids(values):
+    valid = []
+    for value in values:
+        try:
+            valid.append(uuid.UUID(value))
+        except ValueError:
+            pass
+    return valid
+
+
+def _read_state(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh).get('cursor')
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_state(path, cursor):
+    if cursor is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump({'cursor': cursor}, fh)
+    os.replace(tmp, path)
+
+
+def _state_file():
+    return getattr(settings, 'MEDIA_SWEEP_STATE_FILE', None) or os.path.join(settings.MEDIA_ROOT, '.media_sweep.json')
+
+
+def _sweep_batch(batch, storage, grace, dry_run, stats):
+    counts = references(batch)
+    blobs = dict(MediaBlob.objects.filter(name__in=batch).values_list('name', 'refcount'))
+    now = time.time()
+    for name in batch:
+        count = counts.get(name, 0)
+        stats['scanned'] += 1
+        if name in blobs and count and count != blobs[name]:
+            stats['recounted'] += 1
+            if not dry_run:
+                # Compare-and-set: um save concorrente muda o refcount e a correção é descartada.
+                MediaBlob.objects.filter(name=name, refcount=blobs[name]).update(refcount=count)
+            continue
+        if count or now - os.path.getmtime(storage.path(name)) < grace:
+            # Recém-gravado (blob ou não): a linha que o referencia pode não ter sido confirmada.
+            continue
+        stats['deleted'] += 1
+        stats['bytes'] += storage.size(name)
+        if dry_run:
+            continue
+        if name in blobs and not MediaBlob.objects.filter(name=name, refcount=blobs[name]).delete()[0]:
+            stats['deleted'] -= 1
+            continue
+        storage.delete(name)
+
+
+def sweep_media(batch_size=500, max_batches=None, dry_run=False, restart=False, grace=None,
+                storage=default_storage, log=None):
+    """
+    Varre o ``MEDIA_ROOT`` a partir do último ponto de parada. Retorna
+    ``{'scanned', 'deleted', 'bytes', 'recounted', 'finished'}``. Em
+    ``dry_run`` nada é apagado e o ponto de parada não muda.
+    """
+    grace = getattr(settings, 'MEDIA_SWEEP_GRACE', 24 * 3600) if grace is None else grace
+    state_file = _state_file()
+    cursor = None if restart else _read_state(state_file)
+    stats = {'scanned': 0, 'deleted': 0, 'bytes': 0, 'recounted': 0, 'finished': False}
+    files = walk(storage.location, cursor)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batch = [name for _, name in zip(range(batch_size), files)]
+        if not batch:
+            stats['finished'] = True
+            cursor = None
+            break
+        _sweep_batch(batch, storage, grace, dry_run, stats)
+        cursor = batch[-1]
+        batches += 1
+        if not dry_run:
+            _write_state(state_file, cursor)
+        if log:
+            log(f"{stats['scanned']} arquivo(s) conferido(s), {stats['deleted']} órfão(s); último: {cursor}")
+    if not dry_run:
+        _write_state(state_file, cursor)
+    return stats
@@ -0,0 +1,371 @@
+"""
+Instrumentação por request: ``Server-Timing`` e ``/metrics`` (Prometheus).
+
+``PerformanceMiddleware`` mede, para cada request:
+
+- ``db``: número de consultas e tempo total no banco, por um
+  ``execute_wrapper`` em todas as conexões;
+- ``auth``: autenticação por token (``CachedTokenAuthentication``);
+- ``view``: da chamada da view até ela devolver a resposta. Nas views da API
+  inclui os serializers, que o DRF avalia dentro da view; ``app`` é a parte da
+  view fora do banco, de templates e da autenticação (serializers, forms e
+  regras em Python);
+- ``template``: renderização de templates, pelo backend ``DjangoTemplates``
+  deste módulo;
+- ``render``: renderização tardia da resposta (JSON do DRF, ``TemplateResponse``);
+- ``total`` e o tamanho do corpo da resposta.
+
+Os valores vão no header ``Server-Timing`` (com ``METRICS_SERVER_TIMING``) e
+em histogramas por rota, com o nome da URL resolvida como rótulo
+(``api_provider_detail``, ``chat_view``...). ``metrics_view`` expõe os
+histogramas no formato texto do Prometheus.
+
+``/metrics`` só responde aos IPs de ``METRICS_ALLOWED_IPS``. Atrás de um
+proxy no mesmo host o REMOTE_ADDR é o do proxy, então esse filtro sozinho não
+basta: com ``METRICS_TOKEN`` o coletor precisa mandar
+``Authorization: Bearer <token>``; sem ele, requests que passaram por um proxy
+(com ``X-Forwarded-For``) são recusados e a coleta deve ir direto na porta da
+aplicação.
+
+O registro (``METRICS_REGISTRY``) é em memória: cada processo tem o seu, e
+com vários workers cada um deve ser coletado separadamente.
+"""
+import contextlib
+import contextvars
+import hmac
+import ipaddress
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+from django.template.backends.django import Template as BaseTemplate
+from django.utils.module_loading import import_string
+
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DEFAULT_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+DEFAULT_SIZE_BUCKETS = (1000, 10000, 100000, 1000000, 10000000)
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+BUCKET_SETTINGS = {
+    'latency': ('METRICS_LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS),
+    'queries': ('METRICS_QUERY_BUCKETS', DEFAULT_QUERY_BUCKETS),
+    'size': ('METRICS_SIZE_BUCKETS', DEFAULT_SIZE_BUCKETS),
+}
+
+# Nome -> (ajuda, tipo, buckets dos histogramas).
+METRICS = {
+    'fazpramim_http_requests_total': ('Requests atendidos.', 'counter', None),
+    'fazpramim_http_request_duration_seconds': ('Duração total do request.', 'histogram', 'latency'),
+    'fazpramim_http_request_view_seconds': ('Tempo dentro da view.', 'histogram', 'latency'),
+    'fazpramim_http_request_render_seconds': ('Renderização de templates e da resposta.', 'histogram', 'latency'),
+    'fazpramim_http_request_db_seconds': ('Tempo total em consultas SQL.', 'histogram', 'latency'),
+    'fazpramim_http_request_queries': ('Consultas SQL por request.', 'histogram', 'queries'),
+    'fazpramim_http_response_bytes': ('Tamanho do corpo da resposta.', 'histogram', 'size'),
+}
+
+
+def histogram_buckets(name):
+    setting, default = BUCKET_SETTINGS[METRICS[name][2]]
+    return tuple(getattr(settings, setting, default))
+
+
+# =======================================================
+# 📊 REGISTRO DE MÉTRICAS
+# =======================================================
+
+class InMemoryRegistry:
+    """Contadores e histogramas do processo, protegidos por um lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        # (nome, rótulos) -> [contagem por bucket..., +Inf], soma
+        self._histograms = {}
+        self._buckets = {name: histogram_buckets(name) for name, spec in METRICS.items() if spec[1] == 'histogram'}
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[name, labels] += amount
+
+    def observe(self, name, labels, value):
+        buckets = self._buckets[name]
+        # Primeiro bucket com limite >= valor; len(buckets) é o +Inf.
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self._lock:
+            series = self._histograms.get((name, labels))
+            if series is None:
+                series = self._histograms[name, labels] = [[0] * (len(buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self):
+        """``{nome: [(rótulos, valor)]}`` para contadores e ``(rótulos, buckets, contagens, soma)`` para histogramas."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+        families = defaultdict(list)
+        for (name, labels), value in counters.items():
+            families[name].append((labels, value))
+        for (name, labels), (counts, total) in histograms.items():
+            families[name].append((labels, self._buckets[name], counts, total))
+        return families
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = import_string(getattr(settings, 'METRICS_REGISTRY', 'accounts.metrics.InMemoryRegistry'))()
+    return _registry
+
+
+# =======================================================
+# ⏱️ MEDIÇÃO DO REQUEST
+# =======================================================
+
+_current = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.phases = defaultdict(float)
+        # Tempo de banco dentro de cada fase, para não contá-lo duas vezes em ``app``.
+        self.phase_db = defaultdict(float)
+        self.view_start = self.view_end = self.rendered = None
+        self.view_db = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: conta a consulta e o tempo, mesmo se ela falhar.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def begin_view(self):
+        self.view_start = time.perf_counter()
+        self._db_before_view = self.db
+        self._outside_db_before_view = self._outside_db()
+
+    def end_view(self):
+        if self.view_start is None or self.view_end is not None:
+            return
+        self.view_end = time.perf_counter()
+        self.view_db = self.db - self._db_before_view
+        self.view_phases = self._outside_db() - self._outside_db_before_view
+
+    def _outside_db(self):
+        return sum(self.phases.values()) - sum(self.phase_db.values())
+
+    def mark_rendered(self, response=None):
+        self.rendered = time.perf_counter()
+
+    def timings(self):
+        """Fases em segundos, na ordem do header."""
+        end = time.perf_counter()
+        result = {'db': self.db}
+        result.update(self.phases)
+        if self.view_start is not None:
+            view = self.view_end - self.view_start
+            result['view'] = view
+            result['app'] = max(0.0, view - self.view_db - self.view_phases)
+            if self.rendered is not None:
+                result['render'] = self.rendered - self.view_end
+        result['total'] = end - self.start
+        return result
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Soma o tempo do bloco na fase ``name`` do request atual (se houver)."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start, db = time.perf_counter(), timer.db
+    try:
+        yield
+    finally:
+        timer.phases[name] += time.perf_counter() - start
+        timer.phase_db[name] += timer.db - db
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def _server_timing(timings, queries, size):
+    descriptions = {'db': f'{queries} consultas'}
+    entries = [
+        f'{name};dur={seconds * 1000:.1f}' + (f';desc="{descriptions[name]}"' if name in descriptions else '')
+        for name, seconds in timings.items()
+    ]
+    if size is not None:
+        entries.append(f'resp;desc="{size} B"')
+    return ', '.join(entries)
+
+
+class PerformanceMiddleware:
+    """Mede cada request; deve ficar no topo de ``MIDDLEWARE``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+            timer.end_view()
+        finally:
+            _current.reset(token)
+
+        timings = timer.timings()
+        size = None if response.streaming else len(response.content)
+        if self.server_timing:
+            response['Server-Timing'] = _server_timing(timings, timer.queries, size)
+        self.record(request, response, timer, timings, size)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = _current.get()
+        if timer is not None:
+            timer.begin_view()
+
+    def process_template_response(self, request, response):
+        # Chamado depois da view e antes de response.render().
+        timer = _current.get()
+        if timer is not None:
+            timer.end_view()
+            response.add_post_render_callback(timer.mark_rendered)
+        return response
+
+    def record(self, request, response, timer, timings, size):
+        registry = get_registry()
+        method = request.method if request.method in KNOWN_METHODS else 'other'
+        labels = (('route', route_name(request)), ('method', method))
+        registry.inc('fazpramim_http_requests_total', labels + (('status', str(response.status_code)),))
+        registry.observe('fazpramim_http_request_duration_seconds', labels, timings['total'])
+        registry.observe('fazpramim_http_request_db_seconds', labels, timer.db)
+        registry.observe('fazpramim_http_request_queries', labels, timer.queries)
+        if 'view' in timings:
+            registry.observe('fazpramim_http_request_view_seconds', labels, timings['view'])
+        # TemplateResponse renderiza o template dentro de ``render``; render()
+        # nas views de função, dentro da view.
+        render = max(timings.get('render', 0.0), timings.get('template', 0.0))
+        registry.observe('fazpramim_http_request_render_seconds', labels, render)
+        if size is not None:
+            registry.observe('fazpramim_http_response_bytes', labels, size)
+
+
+# =======================================================
+# 🧩 TEMPLATES COM MEDIÇÃO
+# =======================================================
+
+class Template(BaseTemplate):
+    def render(self, context=None, request=None):
+        with phase('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """``DjangoTemplates`` que soma a renderização na fase ``template``."""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+# =======================================================
+# 📈 EXPOSIÇÃO (PROMETHEUS)
+# =======================================================
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics(families):
+    lines = []
+    for name, (help_text, kind, _) in METRICS.items():
+        series = families.get(name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for entry in sorted(series, key=lambda item: item[0]):
+            if kind == 'counter':
+                labels, value = entry
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            labels, buckets, counts, total = entry
+            cumulative = 0
+            for bound, count in zip(buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _allowed(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    networks = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if not any(address in ipaddress.ip_network(network) for network in networks):
+        return False
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return 'HTTP_X_FORWARDED_FOR' not in request.META
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+
+def metrics_view(request):
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(get_registry().collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,154 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:43
+
+import re
+import sqlite3
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Cópia congelada da normalização de accounts/search.py no momento desta
+# migration: o índice gravado aqui precisa continuar igual mesmo que o
+# módulo mude depois (aí quem muda roda ``manage.py rebuild_search_index``).
+FIELDS = ('full_name', 'technical_qualification', 'service_address')
+WEIGHTS = (3.0, 2.0, 1.0)
+STOPWORDS = frozenset("""
+    a ao aos as com como da das de do dos e em entre na nas no nos o os ou
+    para pela pelas pelo pelos por que se sem sob sobre um uma umas uns
+""".split())
+FTS_TABLE = 'accounts_providersearch_fts'
+GIN_INDEX = 'accounts_providersearch_gin'
+GIN_VECTOR = (
+    "setweight(to_tsvector('simple', full_name), 'A') || "
+    "setweight(to_tsvector('simple', technical_qualification), 'B') || "
+    "setweight(to_tsvector('simple', service_address), 'C')"
+)
+
+
+def fold(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def stem(token):
+    if len(token) <= 3 or not token.endswith('s'):
+        return token
+    if token.endswith(('oes', 'aes')):
+        return token[:-3] + 'ao'
+    if token.endswith('ais'):
+        return token[:-3] + 'al'
+    if token.endswith('eis'):
+        return token[:-3] + 'el'
+    if token.endswith(('res', 'zes')):
+        return token[:-2]
+    if token.endswith('ns'):
+        return token[:-2] + 'm'
+    if token.endswith('ss'):
+        return token
+    return token[:-1]
+
+
+def tokenize(text):
+    return [stem(token)[:64] for token in re.findall(r"\w+", fold(text)) if token not in STOPWORDS]
+
+
+def search_backend(connection):
+    """'fts5', 'postgres' ou 'inverted', com a mesma escolha de ``get_backend``."""
+    path = getattr(settings, 'PROVIDER_SEARCH_BACKEND', None) or ''
+    for name, backend in (('FTS5', 'fts5'), ('Postgres', 'postgres'), ('InvertedIndex', 'inverted')):
+        if path.endswith(f'.{name}SearchBackend'):
+            return backend
+    if connection.vendor == 'postgresql':
+        return 'postgres'
+    if connection.vendor == 'sqlite':
+        probe = sqlite3.connect(':memory:')
+        try:
+            if any(row[0] == 'ENABLE_FTS5' for row in probe.execute("PRAGMA compile_options")):
+                return 'fts5'
+        finally:
+            probe.close()
+    return 'inverted'
+
+
+def build_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    backend = search_backend(connection)
+    ProviderProfile = apps.get_model('accounts', 'ProviderProfile')
+    rows = ProviderProfile.objects.using(connection.alias).values_list('pk', *FIELDS).iterator(chunk_size=500)
+    with connection.cursor() as cursor:
+        if backend == 'fts5':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5({', '.join(FIELDS)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        elif backend == 'postgres':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON accounts_providersearchdocument USING GIN (({GIN_VECTOR}))"
+            )
+        for pk, *texts in rows:
+            if backend == 'inverted':
+                weights = {}
+                for text, weight in zip(texts, WEIGHTS):
+                    for term in tokenize(text):
+                        weights[term] = weights.get(term, 0.0) + weight
+                cursor.executemany(
+                    "INSERT INTO accounts_providersearchterm (term, provider_id, weight) VALUES (%s, %s, %s)",
+                    [(term, pk, weight) for term, weight in weights.items()],
+                )
+                continue
+            values = [' '.join(tokenize(text)) for text in texts]
+            if backend == 'fts5':
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FIELDS)}) VALUES (%s, %s, %s, %s)", [pk, *values],
+                )
+            else:
+                cursor.execute(
+                    f"INSERT INTO accounts_providersearchdocument (provider_id, {', '.join(FIELDS)}) "
+                    "VALUES (%s, %s, %s, %s)", [pk, *values],
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    # As tabelas dos modelos somem ao desfazer os CreateModel; aqui saem as
+    # estruturas criadas em SQL (FTS5 ou índice GIN), se existirem.
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {GIN_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_providerprofile_phone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderSearchDocument',
+            fields=[
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='accounts.providerprofile')),
+                ('full_name', models.TextField(blank=True, default='')),
+                ('technical_qualification', models.TextField(blank=True, default='')),
+                ('service_address', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProviderSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField(default=1.0)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.providerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'provider'], name='providersearch_term_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def markers_from_is_read(apps, schema_editor):
+    """A marca de cada participante é a maior mensagem recebida já marcada como lida."""
+    ChatMessage = apps.get_model('accounts', 'ChatMessage')
+    ChatReadMarker = apps.get_model('accounts', 'ChatReadMarker')
+    rows = (
+        ChatMessage.objects.filter(is_read=True)
+        .values('service_request', 'sender', 'service_request__client', 'service_request__provider__user')
+        .annotate(last_read=Max('id'))
+        .order_by()
+    )
+    markers = {}
+    for row in rows:
+        client_id = row['service_request__client']
+        reader = row['service_request__provider__user'] if row['sender'] == client_id else client_id
+        key = (row['service_request'], reader)
+        markers[key] = max(markers.get(key, 0), row['last_read'])
+    ChatReadMarker.objects.bulk_create(
+        [
+            ChatReadMarker(service_request_id=sr_id, user_id=user_id, last_read_message_id=last_read)
+            for (sr_id, user_id), last_read in markers.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadMarker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('service_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_markers', to='accounts.servicerequest')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('service_request', 'user'), name='unique_chat_read_marker')],
+            },
+        ),
+        migrations.RunPython(markers_from_is_read, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='chatmessage',
+            name='is_read',
+        ),
+    ]
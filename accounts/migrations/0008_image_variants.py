@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_broker_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientprofile',
+            name='profile_photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='portfoliophoto',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='providerprofile',
+            name='profile_photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='client_photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_review_parties(apps, schema_editor):
+    Review = apps.get_model('accounts', 'Review')
+    ServiceRequest = apps.get_model('accounts', 'ServiceRequest')
+    requests = ServiceRequest.objects.filter(pk=OuterRef('service_request_id'))
+    Review.objects.update(
+        provider_id=Subquery(requests.values('provider_id')[:1]),
+        client_id=Subquery(requests.values('client_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_job_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='client',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='provider',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.providerprofile'),
+        ),
+        migrations.RunPython(copy_review_parties, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='review',
+            name='client',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='provider',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.providerprofile'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='service_request',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='accounts.servicerequest'),
+        ),
+        migrations.AlterField(
+            model_name='portfoliophoto',
+            name='provider',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_photos', to='accounts.providerprofile'),
+        ),
+        migrations.AlterField(
+            model_name='servicerequest',
+            name='client',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sent_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='servicerequest',
+            name='provider',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='accounts.providerprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['service_request', 'created_at', 'id'], name='chat_request_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='portfoliophoto',
+            index=models.Index(fields=['provider', '-created_at'], name='portfolio_provider_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('client_rating__isnull', False)), fields=['provider', '-client_reviewed_at', '-id'], name='review_provider_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('provider_rating__isnull', False)), fields=['client', '-provider_reviewed_at', '-id'], name='review_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['provider', '-created_at', '-id'], name='sr_provider_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['provider', 'status', '-created_at', '-id'], name='sr_provider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['provider', 'status', '-updated_at'], name='sr_provider_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['client', '-created_at', '-id'], name='sr_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['client', 'status', '-updated_at'], name='sr_client_updated_idx'),
+        ),
+    ]
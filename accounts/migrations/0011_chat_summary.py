@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_chat_summaries(apps, schema_editor):
+    from accounts.chat import refresh_chat_summaries
+
+    refresh_chat_summaries(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(build_chat_summaries, migrations.RunPython.noop),
+    ]
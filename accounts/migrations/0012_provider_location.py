@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def geocode_existing(apps, schema_editor):
+    from accounts.geo import geocode_providers
+
+    geocode_providers(apps.get_model('accounts', 'ProviderProfile').objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_chat_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='providerprofile',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='providerprofile',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='providerprofile',
+            index=models.Index(fields=['latitude', 'longitude'], name='provider_geo_idx'),
+        ),
+        migrations.RunPython(geocode_existing, migrations.RunPython.noop),
+    ]
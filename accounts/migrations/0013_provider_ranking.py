@@ -0,0 +1,117 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:11
+
+import math
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+
+# Cópia congelada de accounts/ranking.py no momento desta migration: o
+# cálculo inicial não pode depender de como o módulo evoluir depois.
+DEFAULT_WEIGHTS = {'rating': 0.4, 'completed': 0.25, 'acceptance': 0.2, 'response': 0.15}
+
+
+def compute_score(rating_sum, rating_count, completed, accepted, rejected, response_seconds):
+    weights = {**DEFAULT_WEIGHTS, **getattr(settings, 'RANKING_WEIGHTS', {})}
+    prior = getattr(settings, 'RANKING_RATING_PRIOR', 3.5)
+    prior_weight = getattr(settings, 'RANKING_RATING_PRIOR_WEIGHT', 5)
+    saturation = getattr(settings, 'RANKING_COMPLETED_SATURATION', 50)
+    half_life = getattr(settings, 'RANKING_RESPONSE_HALF_LIFE', 24) * 3600
+
+    signals = {
+        'rating': (prior * prior_weight + rating_sum) / (prior_weight + rating_count) / 5,
+        'completed': min(1.0, math.log1p(completed) / math.log1p(saturation)),
+        'acceptance': (accepted + 1) / (accepted + rejected + 2),
+        'response': 0.5 if response_seconds is None else half_life / (half_life + response_seconds),
+    }
+    total = sum(weights.values()) or 1
+    return sum(weights[name] * value for name, value in signals.items()) / total
+
+
+def compute_rankings(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    ServiceRequest = apps.get_model('accounts', 'ServiceRequest')
+    ProviderProfile = apps.get_model('accounts', 'ProviderProfile')
+    ProviderRanking = apps.get_model('accounts', 'ProviderRanking')
+
+    # Sem histórico de quando houve a resposta: a última alteração é a melhor aproximação.
+    ServiceRequest.objects.using(alias).exclude(status='pending').update(responded_at=F('updated_at'))
+
+    response_time = ExpressionWrapper(F('responded_at') - F('created_at'), output_field=DurationField())
+    stats = {
+        row.pop('provider_id'): row
+        for row in ServiceRequest.objects.using(alias).values('provider_id').annotate(
+            completed=Count('pk', filter=Q(status='completed')),
+            accepted=Count('pk', filter=Q(status__in=['accepted', 'completed'])),
+            rejected=Count('pk', filter=Q(status='rejected')),
+            response=Avg(response_time, filter=Q(responded_at__isnull=False)),
+        ).order_by()
+    }
+    now = timezone.now()
+    rankings, profiles = [], []
+    providers = ProviderProfile.objects.using(alias).values_list('pk', 'rating_sum', 'rating_count')
+    for provider_id, rating_sum, rating_count in providers.iterator(chunk_size=500):
+        row = stats.get(provider_id, {})
+        response = row.get('response')
+        ranking = ProviderRanking(
+            provider_id=provider_id,
+            completed_count=row.get('completed', 0),
+            accepted_count=row.get('accepted', 0),
+            rejected_count=row.get('rejected', 0),
+            response_seconds=response.total_seconds() if response is not None else None,
+            stale=False,
+            computed_at=now,
+        )
+        ranking.score = compute_score(
+            rating_sum, rating_count, ranking.completed_count, ranking.accepted_count,
+            ranking.rejected_count, ranking.response_seconds,
+        )
+        rankings.append(ranking)
+        profiles.append(ProviderProfile(pk=provider_id, ranking_score=ranking.score))
+    ProviderRanking.objects.using(alias).bulk_create(rankings, batch_size=500)
+    ProviderProfile.objects.using(alias).bulk_update(profiles, ['ranking_score'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_provider_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderRanking',
+            fields=[
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='accounts.providerprofile')),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('accepted_count', models.PositiveIntegerField(default=0, help_text='Aceitas ou concluídas')),
+                ('rejected_count', models.PositiveIntegerField(default=0)),
+                ('response_seconds', models.FloatField(blank=True, help_text='Tempo médio até aceitar/rejeitar', null=True)),
+                ('score', models.FloatField(default=0)),
+                ('stale', models.BooleanField(default=True)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='providerprofile',
+            name='ranking_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='responded_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='providerprofile',
+            index=models.Index(fields=['-ranking_score', 'id'], name='provider_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='providerranking',
+            index=models.Index(condition=models.Q(('stale', True)), fields=['provider'], name='ranking_stale_idx'),
+        ),
+        migrations.RunPython(compute_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_media_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(condition=models.Q(('last_message_at__isnull', False)), fields=['provider', '-last_message_at', '-id'], name='sr_provider_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(condition=models.Q(('last_message_at__isnull', False)), fields=['client', '-last_message_at', '-id'], name='sr_client_inbox_idx'),
+        ),
+    ]
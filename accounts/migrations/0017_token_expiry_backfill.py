@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_token_expiry(apps, schema_editor):
+    # Tokens criados sem TOKEN_TTL nunca expiravam: passam a valer até created + TOKEN_TTL.
+    ttl = getattr(settings, 'REST_KNOX', {}).get('TOKEN_TTL', timedelta(hours=10))
+    if ttl is None:
+        return
+    AuthToken = apps.get_model('knox', 'AuthToken')
+    AuthToken.objects.using(schema_editor.connection.alias).filter(expiry__isnull=True).update(
+        expiry=F('created') + ttl,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_inbox_indexes'),
+        ('knox', '0009_extend_authtoken_field'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_token_expiry, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,38 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .geo import geocode
+
 
+class RatingSummary(models.Model):
+    """
+    Agregados de avaliação mantidos incrementalmente (ver accounts/ratings.py).
+    O histograma guarda uma contagem por nota, de 0 a 5 estrelas.
+    """
+    RATING_VALUES = range(0, 6)
+
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(null=True, blank=True)
+    rating_0 = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
 
-class ClientProfile(models.Model):
+    @property
+    def rating_histogram(self):
+        return {value: getattr(self, f'rating_{value}') for value in self.RATING_VALUES}
+
+
+class ClientProfile(RatingSummary):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -20,6 +50,7 @@ class ClientProfile(models.Model):
         null=True,
         help_text="Foto de perfil"
     )
+    profile_photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     identity_document = models.FileField(
         upload_to="documents/clients/",
         blank=True,
@@ -30,7 +61,7 @@ class ClientProfile(models.Model):
         return f"ClientProfile({self.user.username})"
 
 
-class ProviderProfile(models.Model):
+class ProviderProfile(RatingSummary):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -49,6 +80,7 @@ class ProviderProfile(models.Model):
         null=True,
         help_text="Foto de perfil"
     )
+    profile_photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     identity_document = models.FileField(
         upload_to="documents/providers/identity/",
         blank=True,
@@ -59,27 +91,51 @@ class ProviderProfile(models.Model):
         blank=True,
         null=True,
     )
+    # Coordenadas do município (city/state), preenchidas no save() pelo gazetteer.
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    # Cópia de ProviderRanking.score, para ordenar a lista sem JOIN (ver accounts/ranking.py).
+    ranking_score = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='provider_geo_idx'),
+            models.Index(fields=['-ranking_score', 'id'], name='provider_ranking_idx'),
+        ]
 
     def __str__(self):
         return f"ProviderProfile({self.user.username})"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'city', 'state'} & set(update_fields):
+            self.latitude, self.longitude = geocode(self.city, self.state) or (None, None)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'latitude', 'longitude'}
+        super().save(*args, **kwargs)
+
 
 class PortfolioPhoto(models.Model):
     provider = models.ForeignKey(
         ProviderProfile,
         on_delete=models.CASCADE,
-        related_name='portfolio_photos'
+        related_name='portfolio_photos',
+        db_index=False,  # coberto por portfolio_provider_idx
     )
     photo = models.ImageField(
         upload_to="portfolio/",
         help_text="Foto do portfólio"
     )
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     title = models.CharField(max_length=200, blank=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['provider', '-created_at'], name='portfolio_provider_idx'),
+        ]
 
     def __str__(self):
         return f"Portfolio({self.provider.full_name} - {self.created_at.date()})"
@@ -98,11 +154,13 @@ class ServiceRequest(models.Model):
         (STATUS_COMPLETED, 'Concluído'),
     ]
 
+    # Os índices simples das FKs são substituídos pelos compostos do Meta,
+    # que começam pelas mesmas colunas.
     provider = models.ForeignKey(
-        ProviderProfile, on_delete=models.CASCADE, related_name='requests'
+        ProviderProfile, on_delete=models.CASCADE, related_name='requests', db_index=False
     )
     client = models.ForeignKey(
-        'auth.User', on_delete=models.CASCADE, related_name='sent_requests'
+        'auth.User', on_delete=models.CASCADE, related_name='sent_requests', db_index=False
     )
     description = models.TextField()
     desired_datetime = models.DateTimeField(blank=True, null=True)
@@ -112,33 +170,111 @@ class ServiceRequest(models.Model):
     completed_by_provider = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Quando o prestador aceitou ou rejeitou (primeira saída de "pendente").
+    responded_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Resumo do chat, mantido pelos signals de ChatMessage (caixa de entrada).
+    last_message = models.ForeignKey(
+        'ChatMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Listas do prestador/cliente (API e HTML): mais recentes primeiro,
+            # com ou sem filtro de status; concluídas por data de atualização.
+            models.Index(fields=['provider', '-created_at', '-id'], name='sr_provider_created_idx'),
+            models.Index(fields=['provider', 'status', '-created_at', '-id'], name='sr_provider_status_idx'),
+            models.Index(fields=['provider', 'status', '-updated_at'], name='sr_provider_updated_idx'),
+            models.Index(fields=['client', '-created_at', '-id'], name='sr_client_created_idx'),
+            models.Index(fields=['client', 'status', '-updated_at'], name='sr_client_updated_idx'),
+            # Caixa de entrada: conversas com mensagem, da mais recente, por lado.
+            models.Index(
+                fields=['provider', '-last_message_at', '-id'], name='sr_provider_inbox_idx',
+                condition=models.Q(last_message_at__isnull=False),
+            ),
+            models.Index(
+                fields=['client', '-last_message_at', '-id'], name='sr_client_inbox_idx',
+                condition=models.Q(last_message_at__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"ServiceRequest(provider={self.provider.user.username}, client={self.client.username}, status={self.status})"
 
+    def save(self, *args, **kwargs):
+        if self.status != self.STATUS_PENDING and self.responded_at is None:
+            self.responded_at = timezone.now()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'responded_at'}
+        super().save(*args, **kwargs)
+
 
 class ChatMessage(models.Model):
     service_request = models.ForeignKey(
-        ServiceRequest, on_delete=models.CASCADE, related_name='messages'
+        ServiceRequest, on_delete=models.CASCADE, related_name='messages', db_index=False
     )
     sender = models.ForeignKey(
         'auth.User', on_delete=models.CASCADE, related_name='sent_messages'
     )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['service_request', 'created_at', 'id'], name='chat_request_created_idx'),
+        ]
 
     def __str__(self):
         return f"ChatMessage(request={self.service_request.id}, sender={self.sender.username}, at={self.created_at})"
 
 
+class ChatReadMarker(models.Model):
+    """Última mensagem lida por cada participante do chat (marca d'água de leitura)."""
+    service_request = models.ForeignKey(
+        ServiceRequest, on_delete=models.CASCADE, related_name='read_markers'
+    )
+    user = models.ForeignKey(
+        'auth.User', on_delete=models.CASCADE, related_name='+'
+    )
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service_request', 'user'], name='unique_chat_read_marker'),
+        ]
+
+    def __str__(self):
+        return f"ChatReadMarker(request={self.service_request_id}, user={self.user_id}, upto={self.last_read_message_id})"
+
+    @classmethod
+    def advance(cls, service_request, user, message_id):
+        """Move a marca para ``message_id`` se ela estiver atrás (nunca retrocede)."""
+        updated = cls.objects.filter(
+            service_request=service_request, user=user, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id, updated_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(
+                service_request=service_request, user=user,
+                defaults={'last_read_message_id': message_id},
+            )
+
+
 class Review(models.Model):
     service_request = models.OneToOneField(
         ServiceRequest, on_delete=models.CASCADE, related_name='review'
     )
+    # Copiados de service_request no save(), para que as listas de avaliações
+    # de um prestador/cliente usem um índice só, sem JOIN nem ordenação extra.
+    provider = models.ForeignKey(
+        ProviderProfile, on_delete=models.CASCADE, related_name='+', db_index=False
+    )
+    client = models.ForeignKey(
+        'auth.User', on_delete=models.CASCADE, related_name='+', db_index=False
+    )
     # Avaliação do cliente sobre o prestador
     client_rating = models.IntegerField(null=True, blank=True, help_text="Avaliação do cliente (0-5 estrelas)")
     client_comment = models.TextField(blank=True, help_text="Comentário do cliente")
@@ -148,6 +284,7 @@ class Review(models.Model):
         null=True,
         help_text="Foto do trabalho realizado"
     )
+    client_photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     client_reviewed_at = models.DateTimeField(null=True, blank=True)
     
     # Avaliação do prestador sobre o cliente
@@ -158,8 +295,29 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['provider', '-client_reviewed_at', '-id'], name='review_provider_idx',
+                condition=models.Q(client_rating__isnull=False),
+            ),
+            models.Index(
+                fields=['client', '-provider_reviewed_at', '-id'], name='review_client_idx',
+                condition=models.Q(provider_rating__isnull=False),
+            ),
+        ]
+
     def __str__(self):
         return f"Review(request={self.service_request.id})"
+
+    def save(self, *args, **kwargs):
+        if self.provider_id is None or self.client_id is None:
+            self.provider_id = self.service_request.provider_id
+            self.client_id = self.service_request.client_id
+        # Os agregados de avaliação (accounts/signals.py) travam a linha no
+        # pre_save e aplicam a diferença no post_save: os dois na mesma transação.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
     
     @property
     def client_has_reviewed(self):
@@ -168,3 +326,147 @@ class Review(models.Model):
     @property
     def provider_has_reviewed(self):
         return self.provider_rating is not None
+
+
+class ProviderSearchTerm(models.Model):
+    """Índice invertido da busca de prestadores (ver accounts/search.py)."""
+    term = models.CharField(max_length=64)
+    provider = models.ForeignKey(
+        ProviderProfile, on_delete=models.CASCADE, related_name='+'
+    )
+    weight = models.FloatField(default=1.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'provider'], name='providersearch_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"ProviderSearchTerm({self.term}, provider={self.provider_id})"
+
+
+class ProviderSearchDocument(models.Model):
+    """Texto normalizado do prestador, indexado via tsvector/GIN no Postgres."""
+    provider = models.OneToOneField(
+        ProviderProfile, on_delete=models.CASCADE, primary_key=True, related_name='+'
+    )
+    full_name = models.TextField(blank=True, default='')
+    technical_qualification = models.TextField(blank=True, default='')
+    service_address = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"ProviderSearchDocument(provider={self.provider_id})"
+
+
+class ProviderRanking(models.Model):
+    """
+    Sinais de qualidade do prestador e o score combinado (accounts/ranking.py).
+    ``stale`` é marcado pelos signals de solicitações e avaliações; o comando
+    ``refresh_provider_rankings`` recalcula só as linhas marcadas.
+    """
+    provider = models.OneToOneField(
+        ProviderProfile, on_delete=models.CASCADE, primary_key=True, related_name='ranking'
+    )
+    completed_count = models.PositiveIntegerField(default=0)
+    accepted_count = models.PositiveIntegerField(default=0, help_text="Aceitas ou concluídas")
+    rejected_count = models.PositiveIntegerField(default=0)
+    response_seconds = models.FloatField(null=True, blank=True, help_text="Tempo médio até aceitar/rejeitar")
+    score = models.FloatField(default=0)
+    stale = models.BooleanField(default=True)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['provider'], name='ranking_stale_idx', condition=models.Q(stale=True)),
+        ]
+
+    def __str__(self):
+        return f"ProviderRanking(provider={self.provider_id}, score={self.score:.3f})"
+
+
+class BrokerEvent(models.Model):
+    """Evento publicado pelo DatabaseBroker (accounts/broker.py); removido após alguns minutos."""
+    channel = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"BrokerEvent({self.channel}, id={self.id})"
+
+
+class Job(models.Model):
+    """Tarefa em segundo plano da fila em banco (accounts/jobs.py)."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Na fila'),
+        (STATUS_RUNNING, 'Executando'),
+        (STATUS_DONE, 'Concluída'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    task = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text="Maior executa primeiro")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job({self.task}, {self.status}, id={self.id})"
+
+
+class Upload(models.Model):
+    """Upload em partes, retomável (accounts/uploads.py)."""
+    STATUS_PENDING = 'pending'
+    STATUS_COMPLETE = 'complete'
+    STATUS_ATTACHED = 'attached'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Recebendo partes'),
+        (STATUS_COMPLETE, 'Concluído'),
+        (STATUS_ATTACHED, 'Anexado'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    target = models.CharField(max_length=50, help_text="Modelo e campo de destino, ex.: provider.certifications")
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    crc32 = models.BigIntegerField(default=0, help_text="CRC32 acumulado dos bytes recebidos")
+    parts = models.JSONField(default=list, blank=True)
+    file = models.CharField(max_length=255, blank=True, help_text="Nome no storage, depois de finalizado")
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Upload({self.target}, {self.filename}, {self.offset}/{self.size})"
+
+
+class MediaBlob(models.Model):
+    """Arquivo de mídia deduplicado e quantas referências ele tem (accounts/storage.py)."""
+    name = models.CharField(max_length=255, primary_key=True, help_text="Nome no storage, derivado do SHA-256")
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"MediaBlob({self.name}, refs={self.refcount})"
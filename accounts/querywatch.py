@@ -0,0 +1,205 @@
+"""
+Detector de N+1 e de consultas lentas.
+
+``QueryWatch`` instala um ``execute_wrapper`` em todas as conexões e agrupa
+as consultas pelo formato (``fingerprint``: o SQL sem literais e com listas
+``IN (...)`` colapsadas). São apontados:
+
+- ``repeated``: o mesmo formato executado ``QUERY_WATCH_REPEAT_THRESHOLD``
+  vezes ou mais no request (o sintoma de N+1, como um campo
+  ``source='service_request.client.username'`` sem ``select_related``);
+- ``slow``: consultas acima de ``QUERY_WATCH_SLOW_MS``.
+
+Cada problema leva a pilha Python do código do projeto que disparou a
+consulta, sem os frames do Django e do DRF, mais os campos de serializer
+(``ReviewPublicSerializer.client_name``) e a linha do template em execução.
+
+Uso:
+
+- ``QueryWatchMiddleware`` (opt-in em ``MIDDLEWARE``): observa uma fração
+  ``QUERY_WATCH_SAMPLE_RATE`` dos requests e registra os problemas no logger
+  ``accounts.querywatch``;
+- em testes, ``with assert_no_query_problems(): ...`` falha com o relatório.
+"""
+import contextlib
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import Field
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\$\d+)\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+_LIBRARY_DIRS = ('site-packages', 'dist-packages')
+_FIELD_METHODS = ('get_attribute', 'to_representation')
+_INSTRUMENTATION = {__file__, metrics.__file__}
+
+
+def fingerprint(sql):
+    """Formato da consulta: literais viram ``?`` e listas ``IN`` viram ``IN (...)``."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _is_project_frame(filename):
+    base = str(settings.BASE_DIR)
+    return (
+        filename.startswith(base)
+        and not any(part in filename for part in _LIBRARY_DIRS)
+        and filename not in _INSTRUMENTATION
+    )
+
+
+def project_stack(depth):
+    """Até ``depth`` frames do projeto, do mais interno para o mais externo."""
+    frames = []
+    in_template = False
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < depth:
+        code = frame.f_code
+        if code.co_name == 'render_annotated' and not in_template:
+            # Nó de template em renderização: aponta o arquivo e a linha da tag.
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                frames.append((origin.template_name or origin.name, token.lineno, 'template'))
+                in_template = True
+        elif code.co_name in _FIELD_METHODS and isinstance(frame.f_locals.get('self'), Field):
+            # Campo do DRF lendo o atributo (source='a.b.c') ou serializando um aninhado.
+            field = frame.f_locals['self']
+            if field.field_name and field.parent is not None:
+                serializer = type(field.parent)
+                filename = os.path.relpath(sys.modules[serializer.__module__].__file__, settings.BASE_DIR)
+                frames.append((filename, None, f'{serializer.__name__}.{field.field_name}'))
+        elif _is_project_frame(code.co_filename):
+            frames.append((os.path.relpath(code.co_filename, settings.BASE_DIR), frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    return tuple(frames)
+
+
+def format_stack(stack):
+    lines = [
+        f'    {filename}:{lineno} em {function}' if lineno is not None else f'    {filename} em {function}'
+        for filename, lineno, function in stack
+    ]
+    return '\n'.join(lines) or '    (fora do projeto)'
+
+
+class QueryShape:
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.callsites = Counter()
+
+
+class Problem:
+    def __init__(self, kind, sql, count, duration, stack):
+        self.kind = kind
+        self.sql = sql
+        self.count = count
+        self.duration = duration
+        self.stack = stack
+
+    def __str__(self):
+        if self.kind == 'repeated':
+            header = f'{self.count} consultas com o mesmo formato ({self.duration * 1000:.1f} ms no total)'
+        else:
+            header = f'consulta lenta ({self.duration * 1000:.1f} ms)'
+        return f'{header}:\n    {self.sql}\n{format_stack(self.stack)}'
+
+
+class QueryWatch:
+    """Contexto que observa as consultas de todas as conexões."""
+
+    def __init__(self, repeat_threshold=None, slow_ms=None, stack_depth=None):
+        self.repeat_threshold = repeat_threshold or getattr(settings, 'QUERY_WATCH_REPEAT_THRESHOLD', 5)
+        slow_ms = getattr(settings, 'QUERY_WATCH_SLOW_MS', 100) if slow_ms is None else slow_ms
+        self.slow = slow_ms / 1000
+        self.stack_depth = stack_depth or getattr(settings, 'QUERY_WATCH_STACK_DEPTH', 6)
+        self.shapes = {}
+        self.slow_queries = []
+        self._stack = contextlib.ExitStack()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            key = fingerprint(sql)
+            shape = self.shapes.get(key)
+            if shape is None:
+                shape = self.shapes[key] = QueryShape(key)
+            shape.count += 1
+            shape.total += duration
+            stack = project_stack(self.stack_depth)
+            shape.callsites[stack] += 1
+            if duration >= self.slow:
+                self.slow_queries.append(Problem('slow', key, 1, duration, stack))
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def problems(self):
+        repeated = [
+            # A pilha mais comum entre as repetições aponta o campo/linha culpado.
+            Problem('repeated', shape.sql, shape.count, shape.total, shape.callsites.most_common(1)[0][0])
+            for shape in self.shapes.values() if shape.count >= self.repeat_threshold
+        ]
+        repeated.sort(key=lambda problem: -problem.count)
+        return repeated + self.slow_queries
+
+    def report(self):
+        return '\n\n'.join(str(problem) for problem in self.problems())
+
+
+@contextlib.contextmanager
+def assert_no_query_problems(**options):
+    """Falha (``AssertionError``) se o bloco repetir formatos de consulta ou tiver consultas lentas."""
+    with QueryWatch(**options) as watch:
+        yield watch
+    problems = watch.problems()
+    if problems:
+        raise AssertionError(f'{len(problems)} problema(s) de consulta:\n\n' + watch.report())
+
+
+class QueryWatchMiddleware:
+    """Observa uma amostra dos requests e registra N+1 e consultas lentas."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_WATCH_SAMPLE_RATE', 1.0 if settings.DEBUG else 0.01)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        with QueryWatch() as watch:
+            response = self.get_response(request)
+        problems = watch.problems()
+        if problems:
+            logger.warning(
+                '%s %s (%s): %d problema(s) de consulta\n\n%s',
+                request.method, request.path, metrics.route_name(request), len(problems), watch.report(),
+            )
+        return response
@@ -0,0 +1,140 @@
+"""
+Score de ranking dos prestadores, pré-calculado.
+
+O score (0 a 1) combina, com os pesos de ``RANKING_WEIGHTS``:
+
+- ``rating``: nota média bayesiana, puxada para ``RANKING_RATING_PRIOR``
+  enquanto há poucas avaliações;
+- ``completed``: serviços concluídos, em escala log até
+  ``RANKING_COMPLETED_SATURATION``;
+- ``acceptance``: aceitas / respondidas, suavizada (0,5 sem histórico);
+- ``response``: tempo médio até aceitar/rejeitar; vale 0,5 em
+  ``RANKING_RESPONSE_HALF_LIFE`` horas.
+
+Os sinais ficam em ``ProviderRanking`` e o score é copiado para
+``ProviderProfile.ranking_score``, indexado: a lista ordena com um ORDER BY
+no índice, sem agregar solicitações e avaliações na hora. Os signals marcam a
+linha como ``stale`` e ``refresh_rankings`` (comando
+``refresh_provider_rankings``, via cron) recalcula só as marcadas. Na busca
+textual, ``search_providers`` mistura a relevância com o score.
+"""
+import math
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+from .api.cache import LIST, bump
+from .models import ServiceRequest
+
+
+DEFAULT_WEIGHTS = {'rating': 0.4, 'completed': 0.25, 'acceptance': 0.2, 'response': 0.15}
+
+
+def compute_score(rating_sum, rating_count, completed, accepted, rejected, response_seconds):
+    weights = {**DEFAULT_WEIGHTS, **getattr(settings, 'RANKING_WEIGHTS', {})}
+    prior = getattr(settings, 'RANKING_RATING_PRIOR', 3.5)
+    prior_weight = getattr(settings, 'RANKING_RATING_PRIOR_WEIGHT', 5)
+    saturation = getattr(settings, 'RANKING_COMPLETED_SATURATION', 50)
+    half_life = getattr(settings, 'RANKING_RESPONSE_HALF_LIFE', 24) * 3600
+
+    signals = {
+        'rating': (prior * prior_weight + rating_sum) / (prior_weight + rating_count) / 5,
+        'completed': min(1.0, math.log1p(completed) / math.log1p(saturation)),
+        'acceptance': (accepted + 1) / (accepted + rejected + 2),
+        'response': 0.5 if response_seconds is None else half_life / (half_life + response_seconds),
+    }
+    total = sum(weights.values()) or 1
+    return sum(weights[name] * value for name, value in signals.items()) / total
+
+
+def mark_stale(provider_id):
+    ProviderRanking = global_apps.get_model('accounts', 'ProviderRanking')
+    ProviderRanking.objects.filter(provider_id=provider_id, stale=False).update(stale=True)
+
+
+def _request_stats(requests, provider_ids):
+    response_time = ExpressionWrapper(F('responded_at') - F('created_at'), output_field=DurationField())
+    rows = (
+        requests.filter(provider_id__in=provider_ids)
+        .values('provider_id')
+        .annotate(
+            completed=Count('pk', filter=Q(status=ServiceRequest.STATUS_COMPLETED)),
+            accepted=Count('pk', filter=Q(status__in=[ServiceRequest.STATUS_ACCEPTED, ServiceRequest.STATUS_COMPLETED])),
+            rejected=Count('pk', filter=Q(status=ServiceRequest.STATUS_REJECTED)),
+            response=Avg(response_time, filter=Q(responded_at__isnull=False)),
+        )
+        .order_by()
+    )
+    return {row.pop('provider_id'): row for row in rows}
+
+
+def _refresh(provider_ids, apps):
+    ProviderProfile = apps.get_model('accounts', 'ProviderProfile')
+    ProviderRanking = apps.get_model('accounts', 'ProviderRanking')
+    requests = apps.get_model('accounts', 'ServiceRequest').objects.all()
+
+    stats = _request_stats(requests, provider_ids)
+    ratings = ProviderProfile.objects.filter(pk__in=provider_ids).values_list('pk', 'rating_sum', 'rating_count', 'ranking_score')
+    now = timezone.now()
+    rankings, profiles = [], []
+    for provider_id, rating_sum, rating_count, previous in ratings:
+        row = stats.get(provider_id, {})
+        response = row.get('response')
+        ranking = ProviderRanking(
+            provider_id=provider_id,
+            completed_count=row.get('completed', 0),
+            accepted_count=row.get('accepted', 0),
+            rejected_count=row.get('rejected', 0),
+            response_seconds=response.total_seconds() if response is not None else None,
+            computed_at=now,
+        )
+        ranking.score = compute_score(
+            rating_sum, rating_count, ranking.completed_count, ranking.accepted_count,
+            ranking.rejected_count, ranking.response_seconds,
+        )
+        rankings.append(ranking)
+        if ranking.score != previous:
+            profiles.append(ProviderProfile(pk=provider_id, ranking_score=ranking.score))
+    ProviderRanking.objects.bulk_update(
+        rankings, ['completed_count', 'accepted_count', 'rejected_count', 'response_seconds', 'score', 'computed_at'],
+    )
+    ProviderProfile.objects.bulk_update(profiles, ['ranking_score'])
+    return len(rankings), len(profiles)
+
+
+def refresh_rankings(full=False, batch_size=500, apps=global_apps):
+    """
+    Recalcula os rankings marcados como ``stale`` (todos, com ``full``), em
+    lotes. Retorna ``(recalculados, scores alterados)``. Aceita modelos históricos.
+    """
+    ProviderProfile = apps.get_model('accounts', 'ProviderProfile')
+    ProviderRanking = apps.get_model('accounts', 'ProviderRanking')
+    if full:
+        ProviderRanking.objects.bulk_create(
+            [ProviderRanking(provider_id=pk) for pk in ProviderProfile.objects.filter(ranking__isnull=True).values_list('pk', flat=True)],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        ProviderRanking.objects.update(stale=True)
+
+    refreshed = changed = 0
+    last_id = 0
+    while True:
+        ids = list(
+            ProviderRanking.objects.filter(stale=True, provider_id__gt=last_id)
+            .order_by('provider_id').values_list('provider_id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        last_id = ids[-1]
+        # Desmarca antes de calcular: uma mudança durante o cálculo marca de novo
+        # e entra na próxima execução.
+        ProviderRanking.objects.filter(provider_id__in=ids).update(stale=False)
+        batch_refreshed, batch_changed = _refresh(ids, apps)
+        refreshed += batch_refreshed
+        changed += batch_changed
+    if changed:
+        # A ordem da lista pública mudou; os detalhes não mostram o score.
+        bump(LIST)
+    return refreshed, changed
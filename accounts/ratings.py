@@ -0,0 +1,111 @@
+"""
+Agregados de avaliação de prestadores e clientes.
+
+``client_rating`` (nota dada pelo cliente) alimenta o ``ProviderProfile`` do
+serviço; ``provider_rating`` (nota dada pelo prestador) alimenta o
+``ClientProfile`` do cliente. Cada escrita de ``Review`` aplica apenas a
+diferença em relação à nota anterior, com expressões F(), então escritas
+concorrentes não se sobrescrevem. A nota anterior é lida com
+``select_for_update`` na mesma transação do save (``Review.save``), então
+dois saves da mesma review não aplicam a diferença a partir da mesma nota.
+"""
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, NullIf
+
+from .models import RatingSummary
+
+
+RATING_FIELDS = ['rating_count', 'rating_sum', 'rating_average'] + [
+    f'rating_{value}' for value in RatingSummary.RATING_VALUES
+]
+
+
+def _rating_delta(old, new):
+    """Expressões de UPDATE para trocar a nota ``old`` por ``new`` (ambas podem ser None)."""
+    if old == new:
+        return {}
+    count = (new is not None) - (old is not None)
+    total = (new or 0) - (old or 0)
+    changes = {
+        'rating_count': F('rating_count') + count,
+        'rating_sum': F('rating_sum') + total,
+        'rating_average': Cast(F('rating_sum') + total, FloatField()) / NullIf(F('rating_count') + count, 0),
+    }
+    if old is not None:
+        changes[f'rating_{old}'] = F(f'rating_{old}') - 1
+    if new is not None:
+        changes[f'rating_{new}'] = F(f'rating_{new}') + 1
+    return changes
+
+
+def apply_review_change(review, previous_client_rating, previous_provider_rating):
+    """Aplica nos perfis a diferença entre as notas anteriores e as atuais da review."""
+    ProviderProfile = global_apps.get_model('accounts', 'ProviderProfile')
+    ClientProfile = global_apps.get_model('accounts', 'ClientProfile')
+    provider_changes = _rating_delta(previous_client_rating, review.client_rating)
+    client_changes = _rating_delta(previous_provider_rating, review.provider_rating)
+    if not (provider_changes or client_changes):
+        return
+    sr = review.service_request
+    with transaction.atomic():
+        if provider_changes:
+            ProviderProfile.objects.filter(pk=sr.provider_id).update(**provider_changes)
+        if client_changes:
+            ClientProfile.objects.filter(user_id=sr.client_id).update(**client_changes)
+
+
+def _aggregate(reviews, rating_field, group_field):
+    histogram = {
+        f'rating_{value}': Count('pk', filter=Q(**{rating_field: value}))
+        for value in RatingSummary.RATING_VALUES
+    }
+    return (
+        reviews.filter(**{f'{rating_field}__isnull': False})
+        .values(group_field)
+        .annotate(rating_count=Count('pk'), rating_sum=Sum(rating_field), **histogram)
+        .order_by()
+    )
+
+
+def _store(model, rows, key_field, group_field, batch_size):
+    reset = dict.fromkeys(RATING_FIELDS, 0)
+    reset['rating_average'] = None
+    model.objects.update(**reset)
+    values = {}
+    for row in rows:
+        key = row.pop(group_field)
+        row['rating_average'] = row['rating_sum'] / row['rating_count']
+        values[key] = row
+    keys = list(values)
+    updated = 0
+    for start in range(0, len(keys), batch_size):
+        profiles = list(
+            model.objects.filter(**{f'{key_field}__in': keys[start:start + batch_size]}).only('pk', key_field)
+        )
+        for profile in profiles:
+            for field, value in values[getattr(profile, key_field)].items():
+                setattr(profile, field, value)
+        model.objects.bulk_update(profiles, RATING_FIELDS)
+        updated += len(profiles)
+    return updated
+
+
+def rebuild_rating_aggregates(apps=global_apps, batch_size=500):
+    """Recalcula todos os agregados a partir das reviews. Retorna (prestadores, clientes)."""
+    Review = apps.get_model('accounts', 'Review')
+    ProviderProfile = apps.get_model('accounts', 'ProviderProfile')
+    ClientProfile = apps.get_model('accounts', 'ClientProfile')
+    with transaction.atomic():
+        providers = _store(
+            ProviderProfile,
+            _aggregate(Review.objects.all(), 'client_rating', 'service_request__provider'),
+            'pk', 'service_request__provider', batch_size,
+        )
+        clients = _store(
+            ClientProfile,
+            _aggregate(Review.objects.all(), 'provider_rating', 'service_request__client'),
+            'user_id', 'service_request__client', batch_size,
+        )
+    return providers, clients
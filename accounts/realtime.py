@@ -0,0 +1,222 @@
+"""
+Canal de push por conversa (``ServiceRequest``), servido pelo ASGI.
+
+- SSE: ``GET /api/accounts/requests/<pk>/events/`` (view ``chat_events``);
+- WebSocket: ``/ws/requests/<pk>/`` (``websocket_application``, roteado em
+  ``fazpramim/asgi.py``).
+
+Ambos aceitam token knox no header ``Authorization: Token ...``, a sessão
+do Django ou ``?ticket=``. EventSource e WebSocket do navegador não enviam
+headers, e um token knox na URL acabaria nos logs de acesso e do proxy: o
+app pede um ticket (``issue_ticket``, POST em ``.../events/ticket/``), que
+vale ``REALTIME_TICKET_TTL`` segundos, para uma conversa e uma única conexão.
+
+No WebSocket autenticado pela sessão o ``Origin`` precisa ser o próprio host
+ou estar em ``CSRF_TRUSTED_ORIGINS``: sem isso qualquer página de terceiros
+abriria o socket com o cookie da vítima e leria o chat (cross-site WebSocket
+hijacking). Os eventos vêm do broker (accounts/broker.py): ``chat.message``
+e ``request.status``.
+
+O SSE só é servido sob ASGI (``push_available``): no WSGI o stream sem fim
+prenderia um worker e ficaria no buffer, então a view responde 204 (o
+EventSource para de reconectar) e a página do chat consulta
+``?since=`` da API de mensagens a cada ``CHAT_POLL_INTERVAL`` segundos.
+"""
+import asyncio
+import json
+import re
+import secrets
+from http.cookies import SimpleCookie
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+
+from .api.authentication import CachedTokenAuthentication
+from .broker import get_broker, request_channel
+from .models import ServiceRequest
+
+
+KEEPALIVE_SECONDS = getattr(settings, 'REALTIME_KEEPALIVE', 25)
+_WEBSOCKET_PATH = re.compile(r'^/ws/requests/(?P<pk>\d+)/$')
+
+
+def _token_user(token):
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(token.encode())
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+def _session_user(session_key):
+    store_class = import_string(settings.SESSION_ENGINE + '.SessionStore')
+    session = store_class(session_key)
+    user = get_user(SimpleNamespace(session=session))
+    return user if user.is_authenticated else None
+
+
+def _ticket_key(ticket):
+    return f'realtime:ticket:{ticket}'
+
+
+def issue_ticket(user, pk):
+    """Ticket de uso único para abrir o SSE/WebSocket da conversa ``pk``."""
+    ticket = secrets.token_urlsafe(24)
+    cache.set(_ticket_key(ticket), (user.pk, pk), timeout=getattr(settings, 'REALTIME_TICKET_TTL', 30))
+    return ticket
+
+
+def _ticket_user(ticket, pk):
+    key = _ticket_key(ticket)
+    value = cache.get(key)
+    # Só quem consegue apagar a chave usa o ticket: duas conexões com o mesmo ticket, uma entra.
+    if value is None or not cache.delete(key) or value[1] != pk:
+        return None
+    return User.objects.filter(pk=value[0], is_active=True).first()
+
+
+def _resolve_user(token, ticket, session_key, pk):
+    close_old_connections()
+    if token:
+        return _token_user(token)
+    if ticket:
+        return _ticket_user(ticket, pk)
+    if session_key:
+        return _session_user(session_key)
+    return None
+
+
+def _can_access(user, pk):
+    """Só o cliente e o prestador da solicitação recebem os eventos dela."""
+    return ServiceRequest.objects.filter(Q(client=user) | Q(provider__user=user), pk=pk).exists()
+
+
+def _authorize(token, ticket, session_key, pk):
+    user = _resolve_user(token, ticket, session_key, pk)
+    if user is None:
+        return None, False
+    return user, _can_access(user, pk)
+
+
+def _extract_token(authorization):
+    if authorization and authorization.lower().startswith('token '):
+        return authorization.split(None, 1)[1].strip()
+    return None
+
+
+def _origin_allowed(origin, host):
+    """``Origin`` do mesmo host da requisição ou listado em ``CSRF_TRUSTED_ORIGINS``."""
+    if not origin or origin == 'null':
+        return False
+    if origin in getattr(settings, 'CSRF_TRUSTED_ORIGINS', ()):
+        return True
+    return bool(host) and urlsplit(origin).netloc.lower() == host.lower()
+
+
+def push_available(request):
+    """Se a requisição chegou pelo ASGI, o único servidor que segura streams abertos."""
+    return isinstance(request, ASGIRequest)
+
+
+def _encode(event):
+    return json.dumps(event, ensure_ascii=False)
+
+
+async def _events(channel):
+    """Itera os eventos do canal; ``None`` sinaliza keepalive."""
+    async with get_broker().subscribe(channel) as queue:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+
+
+# =======================================================
+# 📡 SERVER-SENT EVENTS
+# =======================================================
+
+async def chat_events(request, pk):
+    if not push_available(request):
+        return HttpResponse(status=204)
+    token = _extract_token(request.headers.get('Authorization'))
+    ticket = request.GET.get('ticket')
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    user, allowed = await sync_to_async(_authorize)(token, ticket, session_key, pk)
+    if user is None:
+        return JsonResponse({"error": "Não autenticado"}, status=401)
+    if not allowed:
+        return JsonResponse({"error": "Não permitido"}, status=403)
+
+    async def stream():
+        yield f"retry: {KEEPALIVE_SECONDS * 1000}\n\n"
+        async for event in _events(request_channel(pk)):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event['type']}\ndata: {_encode(event)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# =======================================================
+# 🔌 WEBSOCKET
+# =======================================================
+
+async def websocket_application(scope, receive, send):
+    """App ASGI de WebSocket: só envia eventos; mensagens do cliente são ignoradas."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = _WEBSOCKET_PATH.match(scope['path'])
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+    cookies = SimpleCookie(headers.get('cookie', ''))
+    session = cookies.get(settings.SESSION_COOKIE_NAME)
+    token = _extract_token(headers.get('authorization'))
+    ticket = parse_qs(scope.get('query_string', b'').decode()).get('ticket', [None])[0]
+    if match is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    if not (token or ticket):
+        # Só o cookie autentica: o navegador o envia para qualquer página que abra o socket.
+        if not _origin_allowed(headers.get('origin'), headers.get('host')):
+            await send({'type': 'websocket.close', 'code': 4403})
+            return
+    pk = int(match['pk'])
+    user, allowed = await sync_to_async(_authorize)(token, ticket, session.value if session else None, pk)
+    if not allowed:
+        await send({'type': 'websocket.close', 'code': 4401 if user is None else 4403})
+        return
+
+    await send({'type': 'websocket.accept'})
+    async with get_broker().subscribe(request_channel(pk)) as queue:
+        receiver = asyncio.ensure_future(receive())
+        getter = asyncio.ensure_future(queue.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    await send({'type': 'websocket.send', 'text': _encode(getter.result())})
+                    getter = asyncio.ensure_future(queue.get())
+                if receiver in done:
+                    if receiver.result()['type'] == 'websocket.disconnect':
+                        break
+                    receiver = asyncio.ensure_future(receive())
+        finally:
+            receiver.cancel()
+            getter.cancel()
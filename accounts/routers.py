@@ -0,0 +1,127 @@
+"""
+Leituras na réplica, com read-your-writes.
+
+``ReplicaRouter`` (em ``DATABASE_ROUTERS``) manda as leituras para o alias
+``REPLICA_DATABASE_ALIAS`` só quando o código em execução pediu
+(``use_replica``) e a réplica está configurada; todo o resto, inclusive
+escritas, migrações e leituras dentro de transação, fica no ``default``.
+
+``ReadReplicaMixin`` liga a réplica nos GET/HEAD de views da API somente
+leitura. Réplicas atrasam: depois de um POST/PUT/PATCH/DELETE o usuário fica
+preso ao primário por ``REPLICA_PIN_SECONDS`` (``ReplicaPinMiddleware``
+grava a marca no cache ``REPLICA_PIN_CACHE``), e assim enxerga a própria
+escrita. A marca precisa valer para todos os processos: com réplica
+configurada, um cache local (LocMem) ou dummy é recusado na inicialização.
+"""
+import contextlib
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+_replica_enabled = ContextVar('replica_enabled', default=False)
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def reading_replica():
+    """Se as leituras do contexto atual podem ir para a réplica."""
+    return _replica_enabled.get() and replica_alias() is not None
+
+
+@contextlib.contextmanager
+def use_replica(enabled=True):
+    token = _replica_enabled.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_enabled.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if not _replica_enabled.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Mesmos dados nos dois aliases.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+# =======================================================
+# 📌 READ-YOUR-WRITES
+# =======================================================
+
+def _pin_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE', 'default')]
+
+
+def _pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin_to_primary(user):
+    seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+    if user.is_authenticated and seconds > 0:
+        _pin_cache().set(_pin_key(user.pk), 1, timeout=seconds)
+
+
+def is_pinned(user):
+    return user.is_authenticated and _pin_cache().get(_pin_key(user.pk)) is not None
+
+
+class ReplicaPinMiddleware:
+    """Depois de uma requisição que escreve, prende o usuário ao primário por alguns segundos."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if replica_alias() and isinstance(_pin_cache(), (LocMemCache, DummyCache)):
+            # Cada processo veria só as próprias marcas: a escrita feita num
+            # worker e lida em outro sairia da réplica atrasada.
+            raise ImproperlyConfigured(
+                "REPLICA_PIN_CACHE precisa ser um cache compartilhado entre os processos "
+                "(ex.: Redis ou Memcached) quando há réplica de leitura."
+            )
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # request.user já é o usuário do token: o DRF repassa a autenticação ao HttpRequest.
+        if request.method not in SAFE_METHODS and replica_alias() and hasattr(request, 'user'):
+            pin_to_primary(request.user)
+        return response
+
+
+class ReadReplicaMixin:
+    """Para views DRF somente leitura: GET/HEAD vão para a réplica, salvo usuário preso ao primário."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._replica = None
+        if request.method in SAFE_METHODS and replica_alias() and not is_pinned(request.user):
+            self._replica = use_replica()
+            self._replica.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        try:
+            return super().finalize_response(request, response, *args, **kwargs)
+        finally:
+            if getattr(self, '_replica', None) is not None:
+                self._replica.__exit__(None, None, None)
+                self._replica = None
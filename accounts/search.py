@@ -0,0 +1,322 @@
+"""
+Busca textual de prestadores.
+
+O texto é normalizado em Python (minúsculas, sem acentos, sem stopwords e com
+plural reduzido), então "Eletricístas" e "eletricista" geram o mesmo termo.
+O armazenamento do índice é plugável:
+
+- ``FTS5SearchBackend``: tabela virtual FTS5 (SQLite), ranking por bm25;
+- ``PostgresSearchBackend``: ``tsvector`` com índice GIN, ranking por ts_rank;
+- ``InvertedIndexSearchBackend``: índice invertido em tabela comum, para
+  bancos sem busca textual nativa.
+
+O backend pode ser forçado com ``PROVIDER_SEARCH_BACKEND`` (caminho
+pontuado da classe); por padrão é escolhido pelo banco em uso. O índice é
+mantido pelos signals de ``ProviderProfile`` (ver ``accounts/signals.py``).
+"""
+import functools
+import re
+import sqlite3
+import unicodedata
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Case, IntegerField, Value, When
+from django.utils.module_loading import import_string
+
+
+# Campos indexados e seus pesos no ranking.
+INDEXED_FIELDS = (
+    ('full_name', 3.0),
+    ('technical_qualification', 2.0),
+    ('service_address', 1.0),
+)
+
+STOPWORDS = frozenset("""
+    a ao aos as com como da das de do dos e em entre na nas no nos o os ou
+    para pela pelas pelo pelos por que se sem sob sobre um uma umas uns
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+")
+_MAX_TERM_LENGTH = 64
+
+
+def fold(text):
+    """Remove acentos e normaliza caixa ("Eletricísta" -> "eletricista")."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def stem(token):
+    """Redução de plural no estilo do passo inicial do RSLP."""
+    if len(token) <= 3 or not token.endswith('s'):
+        return token
+    if token.endswith(('oes', 'aes')):
+        return token[:-3] + 'ao'
+    if token.endswith('ais'):
+        return token[:-3] + 'al'
+    if token.endswith('eis'):
+        return token[:-3] + 'el'
+    if token.endswith(('res', 'zes')):
+        return token[:-2]
+    if token.endswith('ns'):
+        return token[:-2] + 'm'
+    if token.endswith('ss'):
+        return token
+    return token[:-1]
+
+
+def tokenize(text):
+    """Quebra o texto em termos normalizados, na ordem em que aparecem."""
+    return [
+        stem(token)[:_MAX_TERM_LENGTH]
+        for token in _TOKEN_RE.findall(fold(text))
+        if token not in STOPWORDS
+    ]
+
+
+def query_terms(query):
+    """Termos distintos da consulta (cada um é tratado como prefixo)."""
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def _field_text(provider, field):
+    return ' '.join(tokenize(getattr(provider, field, '') or ''))
+
+
+class SearchBackend:
+    """
+    Interface dos backends. ``provider`` é qualquer objeto com ``pk`` e os
+    campos de ``INDEXED_FIELDS`` (inclusive modelos históricos de migrations),
+    por isso todo acesso ao índice é feito em SQL direto.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        """Cria as estruturas específicas do backend (idempotente)."""
+
+    def index(self, provider):
+        raise NotImplementedError
+
+    def remove(self, provider_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, terms, limit):
+        """Retorna ``[(provider_id, score), ...]`` do mais relevante ao menos."""
+        raise NotImplementedError
+
+    def rebuild(self, providers, batch_size=500):
+        self.install()
+        self.clear()
+        count = 0
+        for provider in providers.iterator(chunk_size=batch_size):
+            self.index(provider)
+            count += 1
+        return count
+
+
+class FTS5SearchBackend(SearchBackend):
+    table = 'accounts_providersearch_fts'
+
+    def install(self):
+        columns = ', '.join(field for field, _ in INDEXED_FIELDS)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                f"USING fts5({columns}, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def index(self, provider):
+        columns = [field for field, _ in INDEXED_FIELDS]
+        values = [_field_text(provider, field) for field in columns]
+        placeholders = ', '.join(['%s'] * (len(columns) + 1))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [provider.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, {', '.join(columns)}) VALUES ({placeholders})",
+                [provider.pk, *values],
+            )
+
+    def remove(self, provider_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [provider_id])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, terms, limit):
+        match = ' AND '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for _, weight in INDEXED_FIELDS)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({self.table}, {weights}) AS score FROM {self.table} "
+                f"WHERE {self.table} MATCH %s ORDER BY score, rowid LIMIT %s",
+                [match, limit],
+            )
+            # bm25 é negativo: quanto menor, mais relevante.
+            return [(row[0], -row[1]) for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    table = 'accounts_providersearchdocument'
+    index_name = 'accounts_providersearch_gin'
+    # A expressão precisa ser idêntica no índice e na consulta para o GIN ser usado.
+    vector_sql = (
+        "setweight(to_tsvector('simple', full_name), 'A') || "
+        "setweight(to_tsvector('simple', technical_qualification), 'B') || "
+        "setweight(to_tsvector('simple', service_address), 'C')"
+    )
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.index_name} ON {self.table} "
+                f"USING GIN (({self.vector_sql}))"
+            )
+
+    def index(self, provider):
+        values = [_field_text(provider, field) for field, _ in INDEXED_FIELDS]
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} (provider_id, full_name, technical_qualification, service_address) "
+                "VALUES (%s, %s, %s, %s) ON CONFLICT (provider_id) DO UPDATE SET "
+                "full_name = EXCLUDED.full_name, "
+                "technical_qualification = EXCLUDED.technical_qualification, "
+                "service_address = EXCLUDED.service_address",
+                [provider.pk, *values],
+            )
+
+    def remove(self, provider_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE provider_id = %s", [provider_id])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, terms, limit):
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT provider_id, ts_rank({self.vector_sql}, q) AS score "
+                f"FROM {self.table}, to_tsquery('simple', %s) q "
+                f"WHERE ({self.vector_sql}) @@ q ORDER BY score DESC, provider_id LIMIT %s",
+                [tsquery, limit],
+            )
+            return cursor.fetchall()
+
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """Índice invertido portátil: uma linha por (termo, prestador)."""
+    table = 'accounts_providersearchterm'
+    # Limite superior para transformar prefixo em intervalo (usa o índice de term).
+    _PREFIX_END = '\U0010ffff'
+
+    def index(self, provider):
+        weights = {}
+        for field, weight in INDEXED_FIELDS:
+            for term in tokenize(getattr(provider, field, '') or ''):
+                weights[term] = weights.get(term, 0.0) + weight
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE provider_id = %s", [provider.pk])
+            if weights:
+                cursor.executemany(
+                    f"INSERT INTO {self.table} (term, provider_id, weight) VALUES (%s, %s, %s)",
+                    [(term, provider.pk, weight) for term, weight in weights.items()],
+                )
+
+    def remove(self, provider_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE provider_id = %s", [provider_id])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, terms, limit):
+        ranges, matched, params, case_params = [], [], [], []
+        for position, term in enumerate(terms):
+            ranges.append("(term >= %s AND term < %s)")
+            params += [term, term + self._PREFIX_END]
+            matched.append(f"WHEN term >= %s AND term < %s THEN {position}")
+            case_params += [term, term + self._PREFIX_END]
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT provider_id, SUM(weight) AS score FROM {self.table} "
+                f"WHERE {' OR '.join(ranges)} GROUP BY provider_id "
+                f"HAVING COUNT(DISTINCT CASE {' '.join(matched)} END) = %s "
+                "ORDER BY score DESC, provider_id LIMIT %s",
+                [*params, *case_params, len(terms), limit],
+            )
+            return cursor.fetchall()
+
+
+@functools.lru_cache(maxsize=None)
+def _sqlite_has_fts5():
+    # Depende apenas da biblioteca SQLite carregada, então basta testar uma vez.
+    probe = sqlite3.connect(':memory:')
+    try:
+        return any(row[0] == 'ENABLE_FTS5' for row in probe.execute("PRAGMA compile_options"))
+    finally:
+        probe.close()
+
+
+def get_backend(connection=None):
+    connection = connection or connections[DEFAULT_DB_ALIAS]
+    path = getattr(settings, 'PROVIDER_SEARCH_BACKEND', None)
+    if path:
+        backend_class = import_string(path)
+    elif connection.vendor == 'postgresql':
+        backend_class = PostgresSearchBackend
+    elif connection.vendor == 'sqlite' and _sqlite_has_fts5():
+        backend_class = FTS5SearchBackend
+    else:
+        backend_class = InvertedIndexSearchBackend
+    return backend_class(connection)
+
+
+def search_providers(queryset, query):
+    """
+    Filtra ``queryset`` pelos prestadores que casam com ``query``, anotando
+    ``search_rank`` (0 = mais relevante) e ordenando por ele. A relevância
+    textual (normalizada pelo melhor resultado) é misturada ao
+    ``ranking_score`` pré-calculado, com peso ``RANKING_TEXT_WEIGHT``.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none()
+    limit = getattr(settings, 'PROVIDER_SEARCH_MAX_RESULTS', 200)
+    ranked = get_backend(connections[queryset.db]).search(terms, limit)
+    if not ranked:
+        return queryset.none()
+    ids = blend_ranking(queryset, ranked)
+    return queryset.filter(pk__in=ids).annotate(
+        search_rank=Case(
+            *[When(pk=provider_id, then=Value(position)) for position, provider_id in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    ).order_by('search_rank', 'pk')
+
+
+def blend_ranking(queryset, ranked):
+    """
+    Ids de ``ranked`` (``[(id, score textual)]``) reordenados pela nota
+    combinada. As notas vêm do mesmo banco de ``queryset`` (réplica, se for
+    o caso), sem os filtros dele.
+    """
+    text_weight = getattr(settings, 'RANKING_TEXT_WEIGHT', 0.7)
+    top = max((score for _, score in ranked), default=0) or 1
+    manager = queryset.model._default_manager.using(queryset.db)
+    quality = dict(manager.filter(pk__in=[pk for pk, _ in ranked]).values_list('pk', 'ranking_score'))
+
+    def combined(item):
+        provider_id, score = item
+        return text_weight * score / top + (1 - text_weight) * quality.get(provider_id, 0)
+
+    return [provider_id for provider_id, _ in sorted(ranked, key=lambda item: (-combined(item), item[0]))]
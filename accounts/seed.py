@@ -0,0 +1,364 @@
+"""
+Massa de dados sintética para testes de carga (``manage.py seed_marketplace``).
+
+Gera prestadores, clientes, solicitações em todos os status, chats (com
+marcas de leitura) e avaliações, em lotes de ``bulk_create``. Tudo sai de um
+``random.Random(seed)`` e as datas são relativas a ``end``, não ao relógio:
+a mesma semente e os mesmos parâmetros geram o mesmo banco, então resultados
+de benchmark são comparáveis entre execuções.
+
+``bulk_create`` não dispara signals, então o que eles manteriam é feito aqui:
+índice de busca e linhas de ranking por lote; resumo do chat por lote;
+agregados de avaliação e scores de ranking no final. Variantes de imagem não
+são geradas (rode ``generate_image_variants`` depois, se precisar).
+"""
+import contextlib
+import random
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageDraw
+
+from .chat import refresh_chat_summaries
+from .geo import municipalities
+from .models import (
+    ChatMessage, ChatReadMarker, ClientProfile, PortfolioPhoto, ProviderProfile, ProviderRanking,
+    Review, ServiceRequest,
+)
+from .ranking import refresh_rankings
+from .ratings import rebuild_rating_aggregates
+from .search import get_backend
+from .storage import retain
+
+
+FIRST_NAMES = (
+    "Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+    "Karina", "Lucas", "Mariana", "Nicolas", "Olívia", "Pedro", "Rafaela", "Samuel", "Tatiane", "Vinícius",
+    "Beatriz", "Caio", "Débora", "Enzo", "Fernanda", "Gustavo", "Helena", "Igor", "Júlia", "Leonardo",
+)
+LAST_NAMES = (
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+)
+TRADES = (
+    ("Eletricista", "instalação elétrica, troca de disjuntores, chuveiros e tomadas"),
+    ("Encanador", "vazamentos, desentupimento, instalação de torneiras e caixas d'água"),
+    ("Pintor", "pintura residencial e comercial, textura e grafiato"),
+    ("Pedreiro", "reformas, alvenaria, reboco e assentamento de pisos"),
+    ("Diarista", "limpeza residencial, pós-obra e passadoria"),
+    ("Jardineiro", "poda, corte de grama e paisagismo"),
+    ("Marceneiro", "móveis planejados, reparos e restauração de madeira"),
+    ("Técnico de ar-condicionado", "instalação, limpeza e manutenção de split"),
+    ("Montador de móveis", "montagem e desmontagem de móveis de loja"),
+    ("Chaveiro", "abertura de portas, cópias e troca de fechaduras"),
+    ("Gesseiro", "forro de gesso, drywall e sancas"),
+    ("Vidraceiro", "box, espelhos e janelas de vidro temperado"),
+)
+STREETS = ("Rua das Flores", "Av. Brasil", "Rua XV de Novembro", "Rua São João", "Av. Paulista", "Rua Sete de Setembro")
+REQUEST_TEXTS = (
+    "Preciso de um orçamento para {servico}.",
+    "Gostaria de agendar uma visita: {servico}.",
+    "Serviço urgente de {servico}, de preferência esta semana.",
+    "Vocês atendem no fim de semana? Preciso de {servico}.",
+)
+CHAT_TEXTS = (
+    "Olá! Tudo bem?", "Qual seria o valor?", "Posso ir amanhã às 9h.", "Consegue me mandar uma foto do local?",
+    "Combinado, até lá.", "O material está incluso?", "Chego em 20 minutos.", "Obrigado pelo serviço!",
+    "Pode ser na parte da tarde?", "Vou precisar de mais um dia para terminar.",
+)
+REVIEW_TEXTS = (
+    "Excelente profissional, recomendo.", "Pontual e caprichoso.", "Resolveu o problema rapidinho.",
+    "Bom serviço, mas atrasou um pouco.", "Preço justo e trabalho limpo.", "Não ficou como combinado.",
+)
+
+# Proporção de cada status entre as solicitações geradas.
+STATUS_WEIGHTS = (
+    (ServiceRequest.STATUS_PENDING, 15),
+    (ServiceRequest.STATUS_ACCEPTED, 20),
+    (ServiceRequest.STATUS_REJECTED, 15),
+    (ServiceRequest.STATUS_COMPLETED, 50),
+)
+HISTORY_DAYS = 365
+DEFAULT_PASSWORD = 'fazpramim123'
+
+
+@contextlib.contextmanager
+def explicit_timestamps(*models):
+    """Desliga ``auto_now``/``auto_now_add`` para gravar as datas geradas."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _chunks(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+class MarketplaceSeeder:
+    def __init__(self, *, providers, clients, requests, messages=6, seed=1, batch_size=2000,
+                 media=False, media_variety=12, password=DEFAULT_PASSWORD, prefix='seed', end, log=None):
+        self.provider_total = providers
+        self.client_total = clients
+        self.request_total = requests
+        self.messages = messages
+        self.batch_size = batch_size
+        self.media = media
+        self.media_variety = media_variety
+        self.prefix = prefix
+        self.end = end
+        self.rng = random.Random(seed)
+        # Um hash só: PBKDF2 por usuário dominaria o tempo de geração.
+        self.password = make_password(password)
+        self.log = log or (lambda message: None)
+        self.places = municipalities()
+        self.counts = dict.fromkeys(
+            ['providers', 'clients', 'portfolio', 'requests', 'messages', 'reviews'], 0
+        )
+        # Placeholders gravados nesta execução: a referência do save ainda não tem dono.
+        self.unclaimed = set()
+
+    # ---- utilitários ----
+
+    def _moment(self, days=HISTORY_DAYS):
+        return self.end - timedelta(seconds=self.rng.uniform(0, days * 86400))
+
+    def _person(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def _users(self, kind, start, count):
+        users = []
+        for i in range(start, start + count):
+            first, last = self._person().split(' ', 1)
+            username = f'{self.prefix}_{kind}{i}'
+            users.append(User(
+                username=username, email=f'{username}@example.com', password=self.password,
+                first_name=first, last_name=last, date_joined=self._moment(HISTORY_DAYS * 2),
+            ))
+        return User.objects.bulk_create(users, batch_size=self.batch_size)
+
+    def _placeholders(self, field, count):
+        """Gera (ou reaproveita) ``count`` imagens lisas com gradiente no ``upload_to`` do campo."""
+        names = []
+        for n in range(count):
+            name = f'{field.upload_to}{self.prefix}_placeholder_{n}.jpg'
+            top = tuple(self.rng.randrange(40, 220) for _ in range(3))
+            bottom = tuple(max(0, channel - 60) for channel in top)
+            if not default_storage.exists(name):
+                image = Image.new('RGB', (800, 600), top)
+                draw = ImageDraw.Draw(image)
+                for y in range(600):
+                    mix = y / 599
+                    draw.line([(0, y), (800, y)], fill=tuple(round(a + (b - a) * mix) for a, b in zip(top, bottom)))
+                buffer = BytesIO()
+                image.save(buffer, 'JPEG', quality=70)
+                name = default_storage.save(name, ContentFile(buffer.getvalue()))
+                self.unclaimed.add(name)
+            names.append(name)
+        return names
+
+    def _retain(self, objects, field_name):
+        """Soma as referências dos placeholders reaproveitados (``bulk_create`` não passa pelo storage)."""
+        for name, count in Counter(getattr(obj, field_name).name for obj in objects if getattr(obj, field_name)).items():
+            if name in self.unclaimed:
+                # A primeira linha fica com a referência criada pelo save.
+                self.unclaimed.discard(name)
+                count -= 1
+            retain(name, count)
+
+    # ---- etapas ----
+
+    def seed_providers(self):
+        backend = get_backend()
+        backend.install()
+        photos = self._placeholders(ProviderProfile._meta.get_field('profile_photo'), self.media_variety) if self.media else []
+        portfolio = self._placeholders(PortfolioPhoto._meta.get_field('photo'), self.media_variety) if self.media else []
+        self.provider_ids = []
+        # Popularidade em lei de potência: poucos prestadores recebem muitos pedidos.
+        self.provider_weights = []
+        for start, count in _chunks(self.provider_total, self.batch_size):
+            with transaction.atomic():
+                users = self._users('p', start, count)
+                profiles = []
+                for user in users:
+                    uf, city, latitude, longitude = self.rng.choice(self.places)
+                    trade, skills = self.rng.choice(TRADES)
+                    profiles.append(ProviderProfile(
+                        user=user, full_name=f'{user.first_name} {user.last_name}',
+                        professional_email=user.email, phone=f'({self.rng.randint(11, 99)}) 9{self.rng.randint(1000, 9999)}-{self.rng.randint(1000, 9999)}',
+                        service_address=f'{self.rng.choice(STREETS)}, {self.rng.randint(1, 3000)}',
+                        city=city, state=uf, latitude=latitude, longitude=longitude,
+                        technical_qualification=f'{trade}: {skills}.',
+                        profile_photo=self.rng.choice(photos) if photos and self.rng.random() < 0.8 else None,
+                    ))
+                profiles = ProviderProfile.objects.bulk_create(profiles, batch_size=self.batch_size)
+                self._retain(profiles, 'profile_photo')
+                ProviderRanking.objects.bulk_create(
+                    [ProviderRanking(provider=profile) for profile in profiles], batch_size=self.batch_size,
+                )
+                for profile in profiles:
+                    backend.index(profile)
+                if portfolio:
+                    with explicit_timestamps(PortfolioPhoto):
+                        created = PortfolioPhoto.objects.bulk_create([
+                            PortfolioPhoto(
+                                provider=profile, photo=self.rng.choice(portfolio),
+                                title=f'Trabalho {n + 1}', created_at=self._moment(),
+                            )
+                            for profile in profiles for n in range(self.rng.randint(0, 6))
+                        ], batch_size=self.batch_size)
+                    self._retain(created, 'photo')
+                    self.counts['portfolio'] += len(created)
+            for profile in profiles:
+                self.provider_ids.append(profile.pk)
+                self.provider_weights.append(1 / (len(self.provider_weights) + 1) ** 0.8)
+            self.counts['providers'] += len(profiles)
+            self.log(f"prestadores: {self.counts['providers']}/{self.provider_total}")
+        # Embaralha para a popularidade não seguir a ordem de criação.
+        self.rng.shuffle(self.provider_weights)
+        self.provider_cum_weights = []
+        total = 0
+        for weight in self.provider_weights:
+            total += weight
+            self.provider_cum_weights.append(total)
+
+    def seed_clients(self):
+        self.client_ids = []
+        for start, count in _chunks(self.client_total, self.batch_size):
+            with transaction.atomic():
+                users = self._users('c', start, count)
+                profiles = []
+                for n, user in enumerate(users, start):
+                    uf, city, _, _ = self.rng.choice(self.places)
+                    profiles.append(ClientProfile(
+                        user=user, full_name=f'{user.first_name} {user.last_name}', cpf=f'{n:011d}',
+                        city=city, state=uf, address=f'{self.rng.choice(STREETS)}, {self.rng.randint(1, 3000)}',
+                    ))
+                ClientProfile.objects.bulk_create(profiles, batch_size=self.batch_size)
+            self.client_ids.extend(user.pk for user in users)
+            self.counts['clients'] += len(users)
+            self.log(f"clientes: {self.counts['clients']}/{self.client_total}")
+
+    def _request(self):
+        provider_id = self.rng.choices(self.provider_ids, cum_weights=self.provider_cum_weights)[0]
+        status = self.rng.choices([s for s, _ in STATUS_WEIGHTS], weights=[w for _, w in STATUS_WEIGHTS])[0]
+        created = self._moment()
+        responded = None
+        updated = created
+        if status != ServiceRequest.STATUS_PENDING:
+            responded = created + timedelta(hours=self.rng.expovariate(1 / 12))
+            updated = responded
+        if status == ServiceRequest.STATUS_COMPLETED:
+            updated = responded + timedelta(days=self.rng.uniform(1, 20))
+        completed = status == ServiceRequest.STATUS_COMPLETED
+        trade = self.rng.choice(TRADES)[0].lower()
+        return ServiceRequest(
+            provider_id=provider_id, client_id=self.rng.choice(self.client_ids),
+            description=self.rng.choice(REQUEST_TEXTS).format(servico=trade),
+            desired_datetime=created + timedelta(days=self.rng.randint(1, 30)) if self.rng.random() < 0.6 else None,
+            proposed_value=Decimal(self.rng.randint(8000, 250000)) / 100 if self.rng.random() < 0.5 else None,
+            status=status, completed_by_client=completed, completed_by_provider=completed,
+            created_at=created, updated_at=updated, responded_at=responded,
+        )
+
+    def _chat(self, request, provider_user_id):
+        """Mensagens alternadas entre cliente e prestador, entre a criação e a última atualização."""
+        if request.status == ServiceRequest.STATUS_REJECTED or self.rng.random() < 0.2:
+            return []
+        count = min(int(self.rng.expovariate(1 / self.messages)) + 1, self.messages * 10)
+        span = max((request.updated_at - request.created_at).total_seconds(), 3600)
+        moments = sorted(self.rng.uniform(0, span) for _ in range(count))
+        return [
+            ChatMessage(
+                service_request=request, content=self.rng.choice(CHAT_TEXTS),
+                sender_id=request.client_id if n % 2 == 0 else provider_user_id,
+                created_at=request.created_at + timedelta(seconds=moment),
+            )
+            for n, moment in enumerate(moments)
+        ]
+
+    def _review(self, request, photos):
+        if request.status != ServiceRequest.STATUS_COMPLETED or self.rng.random() > 0.75:
+            return None
+        reviewed = request.updated_at + timedelta(hours=self.rng.uniform(1, 72))
+        provider_reviews = self.rng.random() < 0.6
+        return Review(
+            service_request=request, provider_id=request.provider_id, client_id=request.client_id,
+            client_rating=self.rng.choices(range(6), weights=(2, 3, 5, 12, 30, 48))[0],
+            client_comment=self.rng.choice(REVIEW_TEXTS) if self.rng.random() < 0.7 else '',
+            client_photo=self.rng.choice(photos) if photos and self.rng.random() < 0.2 else None,
+            client_reviewed_at=reviewed,
+            provider_rating=self.rng.choices(range(6), weights=(1, 2, 4, 10, 33, 50))[0] if provider_reviews else None,
+            provider_comment='',
+            provider_reviewed_at=reviewed + timedelta(hours=2) if provider_reviews else None,
+            created_at=reviewed, updated_at=reviewed,
+        )
+
+    def seed_requests(self):
+        photos = self._placeholders(Review._meta.get_field('client_photo'), self.media_variety) if self.media else []
+        provider_users = dict(
+            ProviderProfile.objects.filter(pk__in=self.provider_ids).values_list('pk', 'user_id').iterator()
+        )
+        for _, count in _chunks(self.request_total, self.batch_size):
+            with transaction.atomic(), explicit_timestamps(ServiceRequest, ChatMessage, ChatReadMarker, Review):
+                requests = ServiceRequest.objects.bulk_create(
+                    [self._request() for _ in range(count)], batch_size=self.batch_size,
+                )
+                chats = [(request, self._chat(request, provider_users[request.provider_id])) for request in requests]
+                messages = ChatMessage.objects.bulk_create(
+                    [message for _, chat in chats for message in chat], batch_size=self.batch_size,
+                )
+                markers = []
+                for request, chat in chats:
+                    if not chat:
+                        continue
+                    # Quem participou leu quase tudo; parte das conversas fica com não lidas.
+                    for user_id in (request.client_id, provider_users[request.provider_id]):
+                        upto = chat[-1] if self.rng.random() < 0.8 else self.rng.choice(chat)
+                        markers.append(ChatReadMarker(
+                            service_request=request, user_id=user_id,
+                            last_read_message_id=upto.pk, updated_at=upto.created_at,
+                        ))
+                ChatReadMarker.objects.bulk_create(markers, batch_size=self.batch_size)
+                reviews = [review for request in requests if (review := self._review(request, photos))]
+                Review.objects.bulk_create(reviews, batch_size=self.batch_size)
+                self._retain(reviews, 'client_photo')
+                refresh_chat_summaries(ServiceRequest.objects.filter(pk__in=[r.pk for r, chat in chats if chat]))
+            self.counts['requests'] += len(requests)
+            self.counts['messages'] += len(messages)
+            self.counts['reviews'] += len(reviews)
+            self.log(f"solicitações: {self.counts['requests']}/{self.request_total}")
+
+    def finish(self):
+        """Agregados que os signals manteriam: médias de avaliação e ranking."""
+        self.log("recalculando agregados de avaliação e ranking...")
+        rebuild_rating_aggregates(batch_size=self.batch_size)
+        refresh_rankings(batch_size=self.batch_size)
+        # Placeholders que nenhuma linha usou.
+        for name in self.unclaimed:
+            default_storage.delete(name)
+        self.unclaimed.clear()
+
+    def run(self):
+        self.seed_providers()
+        self.seed_clients()
+        if self.request_total and self.provider_ids and self.client_ids:
+            self.seed_requests()
+        self.finish()
+        return self.counts
@@ -0,0 +1,245 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from knox.models import get_token_model
+
+from .api.authentication import revoke
+from .api.cache import invalidate_provider
+from .broker import publish_on_commit, request_channel
+from .chat import record_message, refresh_chat_summaries
+from .images import IMAGE_FIELDS, schedule_variants, variants_stored
+from .media import delete_on_commit, instance_files, remember_files, replaced_files
+from .models import (
+    ChatMessage, ClientProfile, PortfolioPhoto, ProviderProfile, ProviderRanking, Review, ServiceRequest,
+)
+from .ranking import mark_stale
+from .ratings import apply_review_change
+from .search import INDEXED_FIELDS, get_backend
+
+
+# =======================================================
+# 🔍 ÍNDICE DE BUSCA DE PRESTADORES
+# =======================================================
+
+@receiver(post_save, sender=ProviderProfile)
+def index_provider(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {field for field, _ in INDEXED_FIELDS} & set(update_fields):
+        return
+    get_backend().index(instance)
+
+
+@receiver(post_delete, sender=ProviderProfile)
+def unindex_provider(sender, instance, **kwargs):
+    get_backend().remove(instance.pk)
+
+
+# =======================================================
+# ⭐ AGREGADOS DE AVALIAÇÃO
+# =======================================================
+
+@receiver(pre_save, sender=Review)
+def remember_previous_ratings(sender, instance, raw=False, **kwargs):
+    previous = None
+    if instance.pk and not raw:
+        # Travada até o commit: um save concorrente da mesma review espera e lê as notas já trocadas.
+        previous = (
+            Review.objects.select_for_update().filter(pk=instance.pk)
+            .values_list('client_rating', 'provider_rating').first()
+        )
+    instance._previous_ratings = previous or (None, None)
+
+
+@receiver(post_save, sender=Review)
+def update_rating_aggregates(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    apply_review_change(instance, *instance._previous_ratings)
+
+
+@receiver(pre_delete, sender=Review)
+def remember_deleted_ratings(sender, instance, **kwargs):
+    # O delete já roda numa transação; a cópia em memória pode ter notas antigas.
+    instance._previous_ratings = (
+        Review.objects.select_for_update().filter(pk=instance.pk)
+        .values_list('client_rating', 'provider_rating').first()
+    ) or (None, None)
+
+
+@receiver(post_delete, sender=Review)
+def remove_rating_aggregates(sender, instance, **kwargs):
+    removed = Review(service_request=instance.service_request)
+    apply_review_change(removed, *instance._previous_ratings)
+
+
+# =======================================================
+# 🏆 RANKING DE PRESTADORES
+# =======================================================
+
+@receiver(post_save, sender=ProviderProfile)
+def create_provider_ranking(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProviderRanking.objects.get_or_create(provider=instance)
+
+
+@receiver(post_save, sender=ServiceRequest)
+@receiver(post_delete, sender=ServiceRequest)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def mark_ranking_stale(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    mark_stale(instance.provider_id)
+
+
+# =======================================================
+# 💬 RESUMO DO CHAT (CAIXA DE ENTRADA)
+# =======================================================
+
+@receiver(post_save, sender=ChatMessage)
+def update_chat_summary(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    record_message(instance)
+
+
+@receiver(post_delete, sender=ChatMessage)
+def rebuild_chat_summary(sender, instance, origin=None, **kwargs):
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not ChatMessage:
+        # Cascata (solicitação, prestador ou usuário apagado): a solicitação
+        # vai junto, não há resumo para refazer.
+        return
+    refresh_chat_summaries(ServiceRequest.objects.filter(pk=instance.service_request_id))
+
+
+# =======================================================
+# 📡 EVENTOS EM TEMPO REAL
+# =======================================================
+
+@receiver(post_save, sender=ChatMessage)
+def push_chat_message(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .api.serializers import ChatMessageSerializer
+    publish_on_commit(request_channel(instance.service_request_id), {
+        'type': 'chat.message',
+        'message': ChatMessageSerializer(instance).data,
+    })
+
+
+@receiver(post_save, sender=ServiceRequest)
+def push_request_status(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    publish_on_commit(request_channel(instance.pk), {
+        'type': 'request.status',
+        'request': instance.pk,
+        'status': instance.status,
+        'completed_by_client': instance.completed_by_client,
+        'completed_by_provider': instance.completed_by_provider,
+    })
+
+
+# =======================================================
+# 🖼️ VARIANTES DE IMAGEM
+# =======================================================
+
+@receiver(post_save)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    for label, field_name in IMAGE_FIELDS:
+        if sender._meta.label == label:
+            schedule_variants(instance, field_name)
+
+
+# =======================================================
+# 🧹 ARQUIVOS SUBSTITUÍDOS OU REMOVIDOS
+# =======================================================
+
+@receiver(post_init, sender=ProviderProfile)
+@receiver(post_init, sender=ClientProfile)
+@receiver(post_init, sender=PortfolioPhoto)
+@receiver(post_init, sender=Review)
+def remember_stored_files(sender, instance, **kwargs):
+    remember_files(instance)
+
+
+@receiver(post_save, sender=ProviderProfile)
+@receiver(post_save, sender=ClientProfile)
+@receiver(post_save, sender=PortfolioPhoto)
+@receiver(post_save, sender=Review)
+def delete_replaced_files(sender, instance, raw=False, **kwargs):
+    if not raw:
+        delete_on_commit(replaced_files(instance))
+    remember_files(instance)
+
+
+@receiver(post_delete, sender=ProviderProfile)
+@receiver(post_delete, sender=ClientProfile)
+@receiver(post_delete, sender=PortfolioPhoto)
+@receiver(post_delete, sender=Review)
+def delete_removed_files(sender, instance, **kwargs):
+    delete_on_commit(instance_files(instance))
+
+
+# =======================================================
+# 🗄️ CACHE DAS RESPOSTAS DE PRESTADORES
+# =======================================================
+
+@receiver(post_save, sender=ProviderProfile)
+@receiver(post_delete, sender=ProviderProfile)
+def invalidate_provider_cache(sender, instance, **kwargs):
+    invalidate_provider(instance.pk)
+
+
+@receiver(post_save, sender=PortfolioPhoto)
+@receiver(post_delete, sender=PortfolioPhoto)
+def invalidate_portfolio_cache(sender, instance, **kwargs):
+    invalidate_provider(instance.provider_id)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_cache(sender, instance, **kwargs):
+    invalidate_provider(instance.provider_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_cache(sender, instance, created, update_fields=None, **kwargs):
+    # username/email aparecem nas respostas; o login só grava last_login.
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    provider_id = ProviderProfile.objects.filter(user=instance).values_list('pk', flat=True).first()
+    if provider_id is not None:
+        invalidate_provider(provider_id)
+
+
+@receiver(variants_stored)
+def invalidate_variants_cache(sender, pk, **kwargs):
+    if sender is ProviderProfile:
+        invalidate_provider(pk)
+    elif sender is PortfolioPhoto:
+        invalidate_provider(PortfolioPhoto.objects.filter(pk=pk).values_list('provider_id', flat=True).first())
+    elif sender is Review:
+        invalidate_provider(Review.objects.filter(pk=pk).values_list('provider_id', flat=True).first())
+
+
+# =======================================================
+# 🔐 CACHE DE TOKENS
+# =======================================================
+
+@receiver(post_delete, sender=get_token_model())
+def revoke_cached_token(sender, instance, **kwargs):
+    revoke(instance.user_id, instance.digest)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_cached_user(sender, instance, **kwargs):
+    # O cache guarda os campos do usuário junto do token (ex.: is_active).
+    revoke(instance.pk)
@@ -0,0 +1,249 @@
+"""
+Storage de mídia endereçado por conteúdo, com deduplicação.
+
+``ContentAddressedStorage`` grava cada arquivo com o nome derivado do SHA-256
+do conteúdo, no diretório pedido (o ``upload_to`` do campo)::
+
+    documents/clients/Zero_Padding.png  ->  documents/clients/3f/3fa2...c1.png
+
+Bytes idênticos no mesmo diretório viram um único arquivo. Conteúdo com
+``seek`` (uploads em memória ou em arquivo temporário) é hasheado antes de
+gravar, e um duplicado não escreve nada; streams sem ``seek`` (uploads em
+partes) passam por ``.incoming/`` e são descartados se o blob já existir.
+
+``MediaBlob`` guarda quantas referências cada blob tem: ``save`` soma uma,
+``delete`` tira uma e só apaga o arquivo quando não sobra nenhuma. Quem
+reaproveita um nome sem passar por ``save`` (ex.: várias linhas apontando
+para o mesmo arquivo) soma as referências com ``retain``. Nomes anteriores a
+este storage não têm ``MediaBlob`` e são apagados como antes;
+``dedupe_media`` (comando ``dedupe_media``) migra esses arquivos.
+"""
+import hashlib
+import os
+import posixpath
+import uuid
+from io import UnsupportedOperation
+
+from django.apps import apps
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils.functional import LazyObject, empty
+
+from .images import IMAGE_FIELDS, variants_field
+
+
+# Hex do SHA-256 no nome: 128 bits bastam contra colisão e mantêm o nome
+# dentro do max_length (100) dos FileFields.
+NAME_DIGEST_LENGTH = 32
+INCOMING_DIR = '.incoming'
+
+
+def _blob_model():
+    return apps.get_model('accounts', 'MediaBlob')
+
+
+def blob_name(directory, digest, filename):
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    short = digest[:NAME_DIGEST_LENGTH]
+    return posixpath.join(directory, short[:2], short + extension)
+
+
+class _HashingFile(File):
+    """Repassa os blocos de ``content`` calculando o SHA-256 e o tamanho."""
+
+    def __init__(self, content):
+        super().__init__(None, getattr(content, 'name', None))
+        self.content = content
+        self.digest = hashlib.sha256()
+        self.length = 0
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.content.chunks(chunk_size):
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            self.digest.update(chunk)
+            self.length += len(chunk)
+            yield chunk
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def __init__(self, *args, **kwargs):
+        # O nome final vem do conteúdo: sobrescrever um blob é gravar os mesmos bytes.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(name)
+        try:
+            content.seek(0)
+        except (AttributeError, UnsupportedOperation):
+            return self._save_stream(directory, filename, content)
+
+        hashing = _HashingFile(content)
+        for _ in hashing.chunks():
+            pass
+        blob = blob_name(directory, hashing.digest.hexdigest(), filename)
+        self._reference(blob, hashing.digest.hexdigest(), hashing.length)
+        if not super().exists(blob):
+            content.seek(0)
+            try:
+                super()._save(blob, content)
+            except Exception:
+                self.delete(blob)
+                raise
+        return blob
+
+    def _save_stream(self, directory, filename, content):
+        hashing = _HashingFile(content if hasattr(content, 'chunks') else File(content))
+        incoming = super()._save(posixpath.join(INCOMING_DIR, uuid.uuid4().hex), hashing)
+        blob = blob_name(directory, hashing.digest.hexdigest(), filename)
+        try:
+            self._reference(blob, hashing.digest.hexdigest(), hashing.length)
+        except Exception:
+            super().delete(incoming)
+            raise
+        if super().exists(blob):
+            super().delete(incoming)
+        else:
+            os.makedirs(os.path.dirname(self.path(blob)), exist_ok=True)
+            os.replace(self.path(incoming), self.path(blob))
+        return blob
+
+    def _reference(self, blob, digest, size):
+        """
+        Conta a referência antes de conferir o arquivo: com ela contada,
+        nenhum ``delete`` concorrente apaga o blob, e um ``delete`` que já
+        tinha levado a linha terminou (trava em ``delete``) antes de o
+        chamador ver que o arquivo sumiu e gravá-lo de novo.
+        """
+        if not retain(blob, storage=self):
+            self._register(blob, digest, size)
+
+    def _register(self, blob, digest, size):
+        MediaBlob = _blob_model()
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=blob, sha256=digest, size=size, refcount=1)
+        except IntegrityError:
+            # Outro processo registrou o mesmo blob ao mesmo tempo.
+            MediaBlob.objects.filter(name=blob).update(refcount=F('refcount') + 1)
+
+    def delete(self, name):
+        """Tira uma referência; o arquivo só sai quando ela era a última."""
+        MediaBlob = _blob_model()
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name)
+            refcount = blob.values_list('refcount', flat=True).first()
+            if refcount is not None and refcount > 1:
+                blob.update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            # Ainda com a linha travada: o ``retain`` de um save concorrente
+            # espera o commit, não acha a linha e o save regrava o arquivo.
+            super().delete(name)
+
+    def references(self, name):
+        row = _blob_model().objects.filter(name=name).values_list('refcount', flat=True).first()
+        return row or 0
+
+
+def is_content_addressed(storage=default_storage):
+    """Se ``storage`` (ou o storage por trás do ``default_storage`` preguiçoso) é o ``ContentAddressedStorage``."""
+    if isinstance(storage, LazyObject):
+        if storage._wrapped is empty:
+            storage._setup()
+        storage = storage._wrapped
+    return isinstance(storage, ContentAddressedStorage)
+
+
+def retain(name, count=1, storage=default_storage):
+    """
+    Soma ``count`` referências a um blob já gravado. Retorna ``False`` se o
+    nome não é um blob (storage comum ou arquivo anterior à deduplicação).
+    """
+    if count <= 0 or not is_content_addressed(storage):
+        return False
+    return bool(_blob_model().objects.filter(name=name).update(refcount=F('refcount') + count))
+
+
+def file_fields():
+    """``(modelo, campo)`` de todos os FileField/ImageField concretos do projeto."""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField) and field.concrete
+    ]
+
+
+def _legacy_names(fields, batch_size):
+    """Nomes referenciados que ainda não são blobs, em lotes ordenados."""
+    MediaBlob = _blob_model()
+    for model, field in fields:
+        last = ''
+        while True:
+            names = list(
+                model.objects.filter(**{f'{field.name}__gt': last})
+                .order_by(field.name).values_list(field.name, flat=True).distinct()[:batch_size]
+            )
+            if not names:
+                break
+            last = names[-1]
+            known = set(MediaBlob.objects.filter(name__in=names).values_list('name', flat=True))
+            yield [name for name in names if name not in known]
+
+
+def _rename(fields, old, new):
+    """Aponta todas as referências de ``old`` para ``new``; retorna quantas eram."""
+    variant_fields = {(label, field_name) for label, field_name in IMAGE_FIELDS}
+    total = 0
+    for model, field in fields:
+        total += model.objects.filter(**{field.name: old}).update(**{field.name: new})
+        if (model._meta.label, field.name) in variant_fields:
+            # Variantes continuam válidas: só a origem mudou de nome.
+            key = variants_field(field.name)
+            rows = model.objects.filter(**{field.name: new, f'{key}__source': old}).values_list('pk', key)
+            for pk, variants in rows:
+                model.objects.filter(pk=pk).update(**{key: {**variants, 'source': new}})
+    return total
+
+
+def dedupe_media(batch_size=500, dry_run=False, storage=default_storage, log=None):
+    """
+    Move os arquivos anteriores à deduplicação para nomes por conteúdo,
+    atualizando as linhas que os referenciam e as contagens. Pode ser
+    interrompido e rodado de novo: só pega nomes que ainda não são blobs.
+    Retorna ``{'files', 'references', 'missing', 'bytes_saved'}``.
+    """
+    if not is_content_addressed(storage):
+        raise TypeError("O storage padrão não é o ContentAddressedStorage (veja STORAGES).")
+    fields = file_fields()
+    stats = {'files': 0, 'references': 0, 'missing': 0, 'bytes_saved': 0}
+    for names in _legacy_names(fields, batch_size):
+        for old in names:
+            if not storage.exists(old):
+                stats['missing'] += 1
+                continue
+            if dry_run:
+                stats['files'] += 1
+                continue
+            size = storage.size(old)
+            with transaction.atomic():
+                with storage.open(old, 'rb') as file:
+                    new = storage.save(old, file)
+                if storage.references(new) > 1:
+                    stats['bytes_saved'] += size
+                count = _rename(fields, old, new)
+                # ``save`` já contou uma referência.
+                retain(new, count - 1, storage=storage)
+                if new != old:
+                    # ``old`` não tem MediaBlob: o delete remove o arquivo.
+                    transaction.on_commit(lambda name=old: storage.delete(name), robust=True)
+            stats['files'] += 1
+            stats['references'] += count
+        if log:
+            log(f"{stats['files']} arquivo(s), {stats['references']} referência(s)")
+    return stats
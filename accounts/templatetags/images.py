@@ -0,0 +1,39 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from accounts.images import placeholder, srcset
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(file, variants, sizes='100vw', **attrs):
+    """
+    ``<picture>`` com WebP e fallback JPEG das variantes geradas; sem
+    variantes (ainda não processadas), vira um ``<img>`` simples.
+
+    Com o placeholder calculado, o ``<img>`` ganha ``width``/``height`` (o
+    layout não pula) e a cor dominante com a prévia de fundo, pintados antes
+    de a imagem chegar. O ``height:auto`` mantém a proporção quando o
+    ``style`` só limita a largura; um ``height`` no ``style`` prevalece.
+
+    Uso: ``{% picture photo.photo photo.photo_variants sizes="250px" alt=photo.title style="..." %}``
+    """
+    preview = placeholder(variants)
+    if preview:
+        attrs.setdefault('width', preview['width'])
+        attrs.setdefault('height', preview['height'])
+        attrs['style'] = (
+            f"background:{preview['color']} url({preview['preview']}) center/cover no-repeat;height:auto;"
+            + attrs.get('style', '')
+        )
+    attributes = format_html_join('', ' {}="{}"', ((name.replace('_', '-'), value) for name, value in attrs.items()))
+    webp = srcset(variants, 'webp')
+    if not webp:
+        return format_html('<img src="{}"{}>', file.url, attributes)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        webp, sizes, file.url, srcset(variants, 'jpeg', include_source=True), sizes, attributes,
+    )
@@ -1,3 +1,1574 @@
-from django.test import TestCase
+"""
+Regressão de plano de consulta.
 
-# Create your tests here.
+Com uma massa de dados grande (e ANALYZE, para o planejador ter
+estatísticas), cada consulta que as views quentes de ``accounts/views.py`` e
+``accounts/api/views.py`` executam sobre as tabelas grandes precisa usar um
+índice: nada de varrer a tabela inteira nem ordenar numa tabela temporária.
+As consultas são capturadas executando a view de verdade, então um filtro ou
+``order_by`` novo sem índice correspondente quebra o teste.
+
+Os cenários do benchmark (accounts/benchmark.py) também rodam aqui, numa
+massa pequena, contra os orçamentos de consultas de ``BENCHMARK_BUDGETS`` e
+o detector de N+1 (accounts/querywatch.py); a latência fica para
+``manage.py benchmark_endpoints``.
+"""
+import asyncio
+import hashlib
+import io
+import math
+import os
+import re
+import tempfile
+import time
+import zlib
+from collections import Counter
+from importlib import import_module
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.utils import ConnectionDoesNotExist
+from django.db.models import ImageField
+from django.db.models.fields.files import FieldFile
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import empty
+from knox.models import AuthToken
+from PIL import Image
+
+from . import images
+from .api.authentication import CachedTokenAuthentication, bump_revocation, revocation_version, token_cache
+from .api.cache import LIST, bump, get_cache, stats
+from .benchmark import SCENARIOS, Subjects, check, measure, missing_scenarios
+from .chat import refresh_chat_summaries
+from .geo import geocode, municipalities
+from .images import process_image, render_variants, store_variants
+from .jobs import Heartbeat, Worker, enqueue
+from .media import instance_files, replaced_files, sweep_media, variant_names
+from .metrics import InMemoryRegistry, get_registry
+from .models import (
+    ChatMessage, ChatReadMarker, ClientProfile, Job, MediaBlob, PortfolioPhoto, ProviderProfile, ProviderRanking,
+    RatingSummary, Review, ServiceRequest, Upload,
+)
+from .querywatch import QueryWatch
+from .ranking import compute_score, refresh_rankings
+from .ratings import rebuild_rating_aggregates
+from .realtime import _ticket_user, issue_ticket, push_available, websocket_application
+from .routers import ReplicaPinMiddleware, is_pinned
+from .search import blend_ranking, fold, get_backend, search_providers, tokenize
+from .seed import MarketplaceSeeder
+from .storage import dedupe_media, retain
+from .uploads import UploadError, attach
+
+
+HOT_MODELS = (ServiceRequest, ChatMessage, Review, PortfolioPhoto, ProviderProfile)
+
+
+def explain(sql):
+    """Linhas do plano da consulta, no formato do banco em uso."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            # Com seqscan/sort "desligados" o Postgres só os usa se não houver
+            # alternativa indexada, o que torna o teste independente do tamanho.
+            cursor.execute('SET enable_seqscan = off; SET enable_sort = off')
+            try:
+                cursor.execute('EXPLAIN ' + sql)
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan; RESET enable_sort')
+    raise NotImplementedError(f"EXPLAIN não suportado para {connection.vendor}")
+
+
+def plan_problems(plan, tables, ordered_scan=False):
+    """
+    Varreduras completas de ``tables`` e ordenações fora de índice. Com
+    ``ordered_scan``, percorrer um índice na ordem do ORDER BY (lista sem
+    filtro, cortada pelo LIMIT) é aceito.
+    """
+    names = '|'.join(re.escape(table) for table in tables)
+    bad = re.compile(
+        rf'^SCAN ({names})\b|USE TEMP B-TREE'  # SQLite
+        rf'|Seq Scan on ({names})\b|(^|->\s+)(Incremental )?Sort\b'  # Postgres
+    )
+    allowed = re.compile(rf'^SCAN ({names}) USING (COVERING )?INDEX\b')
+    return [
+        line for line in plan
+        if bad.search(line.strip()) and not (ordered_scan and allowed.search(line.strip()))
+    ]
+
+
+class QueryPlanAssertions:
+    hot_tables = tuple(model._meta.db_table for model in HOT_MODELS)
+
+    def assertUsesIndexes(self, method, url, ordered_scan=False, **extra):
+        """Executa a requisição e verifica o plano de cada SELECT nas tabelas quentes."""
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(url, **extra)
+        self.assertLess(response.status_code, 400, f"{url} respondeu {response.status_code}")
+        checked = 0
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or not any(f'"{table}"' in sql for table in self.hot_tables):
+                continue
+            plan = explain(sql)
+            problems = plan_problems(plan, self.hot_tables, ordered_scan)
+            self.assertFalse(problems, f"{url}: consulta sem índice\n{sql}\n\nPlano:\n" + '\n'.join(plan))
+            checked += 1
+        self.assertTrue(checked, f"{url} não consultou nenhuma tabela quente")
+        return response
+
+
+class HotQueryPlanTests(QueryPlanAssertions, TestCase):
+    PROVIDERS = 60
+    CLIENTS = 300
+    REQUESTS = 12000
+    MESSAGES_PER_CHAT = 40
+    CHATS = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password('senha-de-teste')
+        users = User.objects.bulk_create(
+            [User(username=f'prestador{i}', email=f'p{i}@ex.com', password=password) for i in range(cls.PROVIDERS)]
+            + [User(username=f'cliente{i}', email=f'c{i}@ex.com', password=password) for i in range(cls.CLIENTS)]
+        )
+        provider_users, client_users = users[:cls.PROVIDERS], users[cls.PROVIDERS:]
+        providers = ProviderProfile.objects.bulk_create([
+            ProviderProfile(user=user, full_name=f'Prestador {i}', professional_email=user.email, ranking_score=(i % 7) / 7)
+            for i, user in enumerate(provider_users)
+        ])
+        ClientProfile.objects.bulk_create([
+            ClientProfile(user=user, full_name=f'Cliente {i}', cpf=f'{i:011d}') for i, user in enumerate(client_users)
+        ])
+        PortfolioPhoto.objects.bulk_create([
+            PortfolioPhoto(provider=provider, photo=f'portfolio/{provider.pk}_{n}.jpg')
+            for provider in providers for n in range(10)
+        ], batch_size=500)
+
+        statuses = [choice for choice, _ in ServiceRequest.STATUS_CHOICES]
+        requests = ServiceRequest.objects.bulk_create([
+            ServiceRequest(
+                provider=providers[i % cls.PROVIDERS], client=client_users[i % cls.CLIENTS],
+                description=f'Serviço {i}', status=statuses[(i // cls.PROVIDERS) % len(statuses)],
+            )
+            for i in range(cls.REQUESTS)
+        ], batch_size=1000)
+
+        now = timezone.now()
+        Review.objects.bulk_create([
+            Review(
+                service_request=sr, provider_id=sr.provider_id, client_id=sr.client_id,
+                client_rating=n % 6, client_reviewed_at=now,
+                provider_rating=(n % 6) if n % 2 else None, provider_reviewed_at=now if n % 2 else None,
+            )
+            for n, sr in enumerate(requests) if sr.status == ServiceRequest.STATUS_COMPLETED
+        ], batch_size=1000)
+
+        ChatMessage.objects.bulk_create([
+            ChatMessage(service_request=sr, sender_id=sr.client_id if n % 2 else providers[0].user_id, content=f'msg {n}')
+            for sr in requests[:cls.CHATS] for n in range(cls.MESSAGES_PER_CHAT)
+        ], batch_size=2000)
+
+        refresh_chat_summaries()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.provider = providers[0]
+        cls.provider_user = provider_users[0]
+        cls.client_user = client_users[0]
+        cls.service_request = requests[0]
+        cls.provider_token = AuthToken.objects.create(cls.provider_user)[1]
+        cls.client_token = AuthToken.objects.create(cls.client_user)[1]
+
+    def api(self, url, token):
+        return self.assertUsesIndexes('get', url, HTTP_AUTHORIZATION=f'Token {token}')
+
+    # ---- HTML ----
+
+    def test_provider_detail_page(self):
+        self.assertUsesIndexes('get', reverse('provider_detail', args=[self.provider.pk]))
+
+    def test_client_detail_page(self):
+        self.assertUsesIndexes('get', reverse('client_detail', args=[self.client_user.username]))
+
+    def test_provider_request_lists_page(self):
+        self.client.force_login(self.provider_user)
+        self.assertUsesIndexes('get', reverse('provider_requests'))
+
+    def test_client_request_lists_page(self):
+        self.client.force_login(self.client_user)
+        self.assertUsesIndexes('get', reverse('client_requests'))
+
+    def test_chat_page(self):
+        self.client.force_login(self.client_user)
+        self.assertUsesIndexes('get', reverse('chat_view', args=[self.service_request.pk]))
+
+    def test_manage_portfolio_page(self):
+        self.client.force_login(self.provider_user)
+        self.assertUsesIndexes('get', reverse('manage_portfolio'))
+
+    # ---- API ----
+
+    def test_api_provider_requests(self):
+        url = reverse('api_provider_requests')
+        response = self.api(url, self.provider_token)
+        self.api(response.json()['next'], self.provider_token)
+        self.api(url + '?status=completed', self.provider_token)
+
+    def test_api_client_requests(self):
+        url = reverse('api_client_requests')
+        response = self.api(url, self.client_token)
+        self.api(response.json()['next'], self.client_token)
+        self.api(url + '?status=pending', self.client_token)
+
+    def test_api_chat(self):
+        url = reverse('api_chat', args=[self.service_request.pk])
+        response = self.api(url, self.client_token)
+        self.api(response.json()['next'], self.client_token)
+        self.api(url + '?since=10', self.client_token)
+
+    def test_api_provider_reviews(self):
+        response = self.api(reverse('provider-reviews'), self.provider_token)
+        self.api(response.json()['next'], self.provider_token)
+
+    def test_api_provider_list(self):
+        # A lista inteira sai do índice de ranking_score, na ordem, até o LIMIT.
+        response = self.assertUsesIndexes('get', reverse('api_provider_list') + '?page_size=5', ordered_scan=True)
+        self.assertUsesIndexes('get', response.json()['next'], ordered_scan=True)
+
+    def test_api_provider_detail(self):
+        self.assertUsesIndexes('get', reverse('api_provider_detail', args=[self.provider.pk]))
+
+    def test_api_inbox(self):
+        self.api(reverse('api_inbox'), self.client_token)
+        self.api(reverse('api_inbox'), self.provider_token)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        MarketplaceSeeder(providers=8, clients=30, requests=300, messages=4, end=timezone.now()).run()
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(missing_scenarios(), [])
+
+    def test_query_budgets(self):
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            subjects = Subjects()
+            results = [
+                {**measure(scenario, subjects, iterations=1, warmup=1), 'size': 'teste'}
+                for scenario in SCENARIOS
+            ]
+        self.assertEqual(check(results, metrics=('queries',)), [])
+
+    def test_no_repeated_queries(self):
+        # Latência não entra aqui: só consultas repetidas (N+1).
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            subjects = Subjects()
+            reports = []
+            for scenario in SCENARIOS:
+                with QueryWatch(slow_ms=math.inf) as watch:
+                    measure(scenario, subjects, iterations=1, warmup=0)
+                if watch.problems():
+                    reports.append(f'{scenario.key}:\n{watch.report()}')
+        self.assertFalse(reports, '\n\n'.join(reports))
+
+
+class ProviderDistanceFilterTests(TestCase):
+    url = reverse('api_provider_list')
+
+    @classmethod
+    def setUpTestData(cls):
+        for username, city, state in [('campinas', 'Campinas', 'SP'), ('jundiai', 'Jundiaí', 'SP'),
+                                      ('saopaulo', 'São Paulo', 'SP'), ('recife', 'Recife', 'PE')]:
+            user = User.objects.create_user(username)
+            ProviderProfile.objects.create(user=user, full_name=username, professional_email=f'{username}@ex.com',
+                                           city=city, state=state)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_gazetteer_covers_every_municipality(self):
+        self.assertEqual(len(municipalities()), 5570)
+        self.assertIsNotNone(geocode('Paraty', 'RJ'))
+        self.assertIsNotNone(geocode('sao joao del rei', 'mg'))
+
+    def test_orders_by_distance(self):
+        response = self.client.get(self.url, {'near': 'Campinas, SP', 'radius': 100})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([row['username'] for row in results], ['campinas', 'jundiai', 'saopaulo'])
+        distances = [row['distance_km'] for row in results]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_invalid_point_is_a_bad_request(self):
+        for params in [{'lat': '-22.9'}, {'lng': '-47.06'}, {'lat': 'nan', 'lng': '-47.06'},
+                       {'lat': '-22.9', 'lng': 'inf'}, {'lat': 'abc', 'lng': '1'}, {'lat': '91', 'lng': '0'},
+                       {'near': 'Campinas, SP', 'radius': '0'}, {'near': 'Campinas, SP', 'radius': 'nan'},
+                       {'near': 'Cidade Inexistente, SP'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class PictureTagTests(TestCase):
+    variants = {
+        'source': 'reviews/ab/abc.jpg', 'width': 1200, 'height': 800,
+        'webp': {'400': 'reviews/variants/abc-400.webp'}, 'jpeg': {'400': 'reviews/variants/abc-400.jpg'},
+        'placeholder': {'color': '#808080', 'preview': 'data:image/jpeg;base64,AAAA'},
+    }
+
+    def render(self, style):
+        template = Template('{% load images %}{% picture file variants alt="Foto" style=style %}')
+        return template.render(Context({'file': FieldFile(None, ImageField(), 'reviews/ab/abc.jpg'),
+                                        'variants': self.variants, 'style': style}))
+
+    def test_keeps_aspect_ratio_when_only_width_is_styled(self):
+        html = self.render('width:100%; max-width:400px;')
+        self.assertIn('width="1200" height="800"', html)
+        self.assertIn('background:#808080 url(data:image/jpeg;base64,AAAA) center/cover no-repeat;'
+                      'height:auto;width:100%; max-width:400px;', html)
+        self.assertIn('<source type="image/webp" srcset="/media/reviews/variants/abc-400.webp 400w"', html)
+
+    def test_explicit_height_wins(self):
+        html = self.render('width:100%; height:250px;')
+        self.assertLess(html.index('height:auto'), html.index('height:250px'))
+
+    def test_without_variants_is_a_plain_img(self):
+        self.variants = None
+        self.assertEqual(self.render(''), '<img src="/media/reviews/ab/abc.jpg" alt="Foto" style="">')
+
+
+class MediaFilesMixin:
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings = self.settings(MEDIA_ROOT=self.media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, name, content):
+        path = os.path.join(self.media.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        return name
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.media.name, name))
+
+
+class MediaViewTests(MediaFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write('portfolio/foto nova.jpg', b'0123456789')
+        self.write('documents/providers/identity/rg.pdf', b'%PDF')
+        self.owner = User.objects.create_user('dono')
+        ProviderProfile.objects.create(user=self.owner, full_name='Dono', professional_email='dono@ex.com',
+                                       identity_document='documents/providers/identity/rg.pdf')
+
+    def get(self, name, **headers):
+        response = self.client.get(reverse('media', args=[name]), headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_private_file_is_only_served_to_the_owner(self):
+        name = 'documents/providers/identity/rg.pdf'
+        self.assertEqual(self.get(name).status_code, 404)
+        self.client.force_login(User.objects.create_user('outro'))
+        self.assertEqual(self.get(name).status_code, 404)
+        self.client.force_login(self.owner)
+        response = self.get(name)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_conditional_get(self):
+        etag = self.get('portfolio/foto nova.jpg')['ETag']
+        response = self.get('portfolio/foto nova.jpg', If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.getvalue(), b'')
+
+    def test_range(self):
+        response = self.get('portfolio/foto nova.jpg', Range='bytes=2-5')
+        self.assertEqual((response.status_code, response.getvalue()), (206, b'2345'))
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(self.get('portfolio/foto nova.jpg', Range='bytes=-3').getvalue(), b'789')
+        response = self.get('portfolio/foto nova.jpg', Range='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        # If-Range com outra versão: arquivo inteiro.
+        response = self.get('portfolio/foto nova.jpg', Range='bytes=2-5', If_Range='"outro"')
+        self.assertEqual((response.status_code, response.getvalue()), (200, b'0123456789'))
+
+    def test_path_traversal(self):
+        for name in ['../manage.py', 'portfolio/../../manage.py', '.media_sweep.json', 'portfolio/']:
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
+
+    def test_active_content_is_downloaded_not_rendered(self):
+        backends = ['PythonSendfile', 'NginxSendfile', 'ApacheSendfile']
+        for backend in backends:
+            with self.subTest(backend=backend), self.settings(MEDIA_SENDFILE_BACKEND=f'accounts.delivery.{backend}'):
+                for filename in ('cert.html', 'cert.svg', 'cert.xml'):
+                    name = self.write(f'documents/providers/certifications/{filename}', b'<script>alert(1)</script>')
+                    response = self.get(name)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response['Content-Disposition'], f'attachment; filename="{filename}"')
+                    self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+                response = self.get('portfolio/foto nova.jpg')
+                self.assertFalse(response.get('Content-Disposition', '').startswith('attachment'))
+                self.assertEqual((response['Content-Type'], response['Content-Security-Policy']), ('image/jpeg', 'sandbox'))
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='accounts.delivery.NginxSendfile')
+    def test_nginx_redirect_is_quoted(self):
+        response = self.get('portfolio/foto nova.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/portfolio/foto%20nova.jpg')
+
+
+class _Stream:
+    """Conteúdo sem ``seek``, como um upload em partes."""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+class ContentAddressedStorageTests(MediaFilesMixin, TestCase):
+
+    def refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def test_duplicates_share_one_counted_blob(self):
+        first = default_storage.save('portfolio/a.jpg', ContentFile(b'mesmos bytes'))
+        second = default_storage.save('portfolio/b.JPG', _Stream(b'mesmos bytes'))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^portfolio/[0-9a-f]{2}/[0-9a-f]{32}\.jpg$')
+        self.assertEqual(self.refcount(first), 2)
+        self.assertEqual(os.listdir(os.path.join(self.media.name, '.incoming')), [])
+
+        default_storage.delete(first)
+        self.assertTrue(self.exists(first))
+        self.assertEqual(self.refcount(first), 1)
+        default_storage.delete(first)
+        self.assertFalse(self.exists(first))
+        self.assertFalse(MediaBlob.objects.filter(name=first).exists())
+
+    def test_lost_file_is_written_again(self):
+        # Um delete concorrente levou o arquivo depois de o save achar a linha.
+        name = default_storage.save('portfolio/a.jpg', ContentFile(b'conteudo'))
+        os.remove(os.path.join(self.media.name, name))
+        self.assertEqual(default_storage.save('portfolio/a.jpg', _Stream(b'conteudo')), name)
+        self.assertTrue(self.exists(name))
+        self.assertEqual(self.refcount(name), 2)
+
+    def test_legacy_names_are_deleted_directly(self):
+        name = self.write('portfolio/antigo.jpg', b'antigo')
+        default_storage.delete(name)
+        self.assertFalse(self.exists(name))
+
+    def test_retain_sets_up_the_lazy_default_storage(self):
+        name = default_storage.save('portfolio/a.jpg', ContentFile(b'conteudo'))
+        default_storage._wrapped = empty
+        self.assertTrue(retain(name, 2))
+        self.assertEqual(self.refcount(name), 3)
+        self.assertFalse(retain('portfolio/antigo.jpg'))
+
+    def test_dedupe_media(self):
+        provider = ProviderProfile.objects.create(user=User.objects.create_user('p'), full_name='P',
+                                                  professional_email='p@ex.com')
+        for n, name in enumerate(['portfolio/um.jpg', 'portfolio/dois.jpg', 'portfolio/um.jpg']):
+            PortfolioPhoto.objects.create(provider=provider, photo=self.write(name, b'igual'), title=str(n))
+        default_storage._wrapped = empty
+
+        self.assertEqual(dedupe_media(dry_run=True)['files'], 2)
+        self.assertTrue(self.exists('portfolio/um.jpg'))
+        self.assertFalse(MediaBlob.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = dedupe_media(batch_size=1)
+        self.assertEqual(stats, {'files': 2, 'references': 3, 'missing': 0, 'bytes_saved': 5})
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.refcount, 3)
+        self.assertEqual(set(PortfolioPhoto.objects.values_list('photo', flat=True)), {blob.name})
+        self.assertFalse(self.exists('portfolio/um.jpg') or self.exists('portfolio/dois.jpg'))
+        self.assertEqual(dedupe_media()['files'], 0)
+
+
+class MediaCleanupTests(MediaFilesMixin, TestCase):
+    OLD = time.time() - 2 * 24 * 3600
+
+    def setUp(self):
+        super().setUp()
+        self.provider = ProviderProfile.objects.create(user=User.objects.create_user('p'), full_name='P',
+                                                       professional_email='p@ex.com')
+
+    def photo(self, name):
+        variants = {'source': name, 'width': 800, 'height': 600,
+                    'webp': {'400': name.replace('portfolio/', 'portfolio/variants/') + '-400.webp'}}
+        for file in [name, *variant_names(variants)]:
+            self.write(file, file.encode())
+        photo = PortfolioPhoto.objects.create(provider=self.provider, photo=name)
+        PortfolioPhoto.objects.filter(pk=photo.pk).update(photo_variants=variants)
+        return PortfolioPhoto.objects.get(pk=photo.pk)
+
+    def age(self, *names):
+        for name in names:
+            os.utime(os.path.join(self.media.name, name), (self.OLD, self.OLD))
+
+    def test_replaced_and_instance_files(self):
+        photo = self.photo('portfolio/a.jpg')
+        self.assertEqual(instance_files(photo), ['portfolio/a.jpg', 'portfolio/variants/a.jpg-400.webp'])
+        self.assertEqual(replaced_files(photo), [])
+        photo.photo = 'portfolio/b.jpg'
+        self.assertEqual(replaced_files(photo), ['portfolio/a.jpg', 'portfolio/variants/a.jpg-400.webp'])
+        # Variantes de outra origem não são da linha.
+        photo.photo_variants = {**photo.photo_variants, 'source': 'portfolio/c.jpg'}
+        self.assertEqual(instance_files(photo), ['portfolio/b.jpg'])
+
+    def test_signals_delete_after_commit(self):
+        photo = self.photo('portfolio/a.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.photo = self.write('portfolio/b.jpg', b'b')
+            photo.save()
+        self.assertFalse(self.exists('portfolio/a.jpg') or self.exists('portfolio/variants/a.jpg-400.webp'))
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        self.assertFalse(self.exists('portfolio/b.jpg'))
+
+    def test_sweep_respects_references_and_grace(self):
+        self.photo('portfolio/usada.jpg')
+        orphan = self.write('portfolio/orfa.jpg', b'orfa')
+        recent = self.write('portfolio/recente.jpg', b'recente')
+        blob = default_storage.save('portfolio/blob.jpg', ContentFile(b'blob'))
+        fresh_blob = default_storage.save('portfolio/novo.jpg', ContentFile(b'novo'))
+        self.age('portfolio/usada.jpg', 'portfolio/variants/usada.jpg-400.webp', orphan, blob)
+        MediaBlob.objects.filter(name=blob).update(refcount=5)
+
+        stats = sweep_media(dry_run=True)
+        self.assertEqual((stats['scanned'], stats['deleted'], stats['finished']), (6, 2, True))
+        self.assertTrue(self.exists(orphan) and self.exists(blob))
+        self.assertFalse(os.path.exists(os.path.join(self.media.name, '.media_sweep.json')))
+
+        stats = sweep_media()
+        self.assertEqual((stats['deleted'], stats['bytes']), (2, 8))
+        self.assertFalse(self.exists(orphan) or self.exists(blob))
+        self.assertFalse(MediaBlob.objects.filter(name=blob).exists())
+        for name in ['portfolio/usada.jpg', 'portfolio/variants/usada.jpg-400.webp', recent, fresh_blob]:
+            self.assertTrue(self.exists(name), name)
+        self.assertEqual(MediaBlob.objects.get(name=fresh_blob).refcount, 1)
+
+    def test_sweep_recounts_blobs(self):
+        name = default_storage.save('portfolio/a.jpg', ContentFile(b'a'))
+        PortfolioPhoto.objects.bulk_create([PortfolioPhoto(provider=self.provider, photo=name) for _ in range(3)])
+        self.assertEqual(sweep_media()['recounted'], 1)
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 3)
+
+    def test_sweep_resumes_where_it_stopped(self):
+        names = [self.write(f'portfolio/{n}.jpg', b'x') for n in range(5)]
+        self.age(*names)
+        first = sweep_media(batch_size=2, max_batches=1)
+        self.assertEqual((first['scanned'], first['finished']), (2, False))
+        self.assertEqual([self.exists(name) for name in names], [False, False, True, True, True])
+        rest = sweep_media(batch_size=2)
+        self.assertEqual((rest['scanned'], rest['deleted'], rest['finished']), (3, 3, True))
+        # Terminada a volta, a próxima recomeça do início.
+        self.assertEqual(sweep_media()['finished'], True)
+        self.assertFalse(os.path.exists(os.path.join(self.media.name, '.media_sweep.json')))
+
+
+class ImageVariantTests(MediaFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        provider = ProviderProfile.objects.create(user=User.objects.create_user('p'), full_name='P',
+                                                  professional_email='p@ex.com')
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 300), 'teal').save(buffer, 'PNG')
+        self.source = default_storage.save('portfolio/foto.png', ContentFile(buffer.getvalue()))
+        self.photo = PortfolioPhoto.objects.create(provider=provider, photo=self.source)
+
+    def variants(self):
+        return PortfolioPhoto.objects.get(pk=self.photo.pk).photo_variants
+
+    def refcounts(self, names):
+        return [MediaBlob.objects.get(name=name).refcount for name in names]
+
+    def test_rendering_again_does_not_add_references(self):
+        # Como o ``generate_image_variants --force``.
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                store_variants('accounts.PortfolioPhoto', self.photo.pk, 'photo', render_variants(self.source))
+        names = variant_names(self.variants())
+        self.assertEqual(len(names), 4)  # 160 e 320 px, em WebP e JPEG
+        self.assertEqual(self.refcounts(names), [1] * 4)
+        self.assertTrue(all(self.exists(name) for name in names))
+
+    def test_failed_render_leaves_nothing_behind(self):
+        encode = images._encode
+
+        def flaky(image, pil_format, quality=None):
+            if image.width == 320:
+                raise OSError('disco cheio')
+            return encode(image, pil_format, quality)
+
+        with mock.patch.object(images, '_encode', flaky), self.assertRaises(OSError):
+            process_image('accounts.PortfolioPhoto', self.photo.pk, 'photo', self.source)
+        self.assertEqual(list(MediaBlob.objects.values_list('name', flat=True)), [self.source])
+        variants_dir = os.path.join(self.media.name, 'portfolio', 'variants')
+        self.assertEqual([file for _, _, files in os.walk(variants_dir) for file in files], [])
+
+        # A nova tentativa grava tudo; repetida, não faz nada.
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                process_image('accounts.PortfolioPhoto', self.photo.pk, 'photo', self.source)
+        self.assertEqual(self.refcounts(variant_names(self.variants())), [1] * 4)
+
+    def test_result_for_a_replaced_file_is_released(self):
+        variants = render_variants(self.source)
+        PortfolioPhoto.objects.filter(pk=self.photo.pk).update(photo='portfolio/outra.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(store_variants('accounts.PortfolioPhoto', self.photo.pk, 'photo', variants), 0)
+        self.assertFalse(MediaBlob.objects.filter(name__in=variant_names(variants)).exists())
+        self.assertFalse(any(self.exists(name) for name in variant_names(variants)))
+
+
+class ReadReplicaTests(TestCase):
+    """O próprio ``default`` faz o papel da réplica (``REPLICA_DATABASE_ALIAS``)."""
+    url = reverse('api_provider_list')
+
+    def setUp(self):
+        pins = tempfile.TemporaryDirectory()
+        self.addCleanup(pins.cleanup)
+        settings = self.settings(REPLICA_DATABASE_ALIAS='default', CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': pins.name},
+            'providers': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'replica-tests'},
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        ProviderProfile.objects.create(user=User.objects.create_user('p'), full_name='P', professional_email='p@ex.com')
+
+    def test_local_pin_cache_is_rejected(self):
+        ReplicaPinMiddleware(lambda request: None)
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                ReplicaPinMiddleware(lambda request: None)
+        with self.settings(REPLICA_DATABASE_ALIAS='sem-replica', CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        }):
+            ReplicaPinMiddleware(lambda request: None)
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        user = User.objects.create_user('cliente')
+        token = AuthToken.objects.create(user)[1]
+        self.assertFalse(is_pinned(user))
+        self.client.post(self.url, HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertTrue(is_pinned(user))
+
+    def x_cache(self):
+        return self.client.get(self.url)['X-Cache']
+
+    def test_replica_reads_do_not_fill_the_cache_right_after_a_bump(self):
+        self.assertEqual([self.x_cache(), self.x_cache()], ['MISS', 'HIT'])
+        bump(LIST)
+        # A réplica pode ainda não ter a escrita: nada é guardado sob a versão nova.
+        self.assertEqual([self.x_cache(), self.x_cache()], ['MISS', 'MISS'])
+        get_cache().delete(f'providers:bumped:{LIST}')
+        self.assertEqual([self.x_cache(), self.x_cache()], ['MISS', 'HIT'])
+
+
+class ChatPushTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        provider_user = User.objects.create_user('prestador')
+        provider = ProviderProfile.objects.create(user=provider_user, full_name='Prestador', professional_email='p@ex.com')
+        cls.client_user = User.objects.create_user('cliente')
+        cls.service_request = ServiceRequest.objects.create(provider=provider, client=cls.client_user, description='x',
+                                                            status=ServiceRequest.STATUS_ACCEPTED)
+        cls.message = ChatMessage.objects.create(service_request=cls.service_request, sender=provider_user, content='oi')
+
+    def setUp(self):
+        self.client.force_login(self.client_user)
+
+    def test_push_only_under_asgi(self):
+        self.assertFalse(push_available(RequestFactory().get('/')))
+        self.assertTrue(push_available(AsyncRequestFactory().get('/')))
+
+    def test_sse_is_not_served_under_wsgi(self):
+        response = self.client.get(reverse('api_request_events', args=[self.service_request.pk]))
+        self.assertEqual(response.status_code, 204)
+
+    def test_chat_page_falls_back_to_polling(self):
+        response = self.client.get(reverse('chat_view', args=[self.service_request.pk]))
+        self.assertNotContains(response, 'new EventSource')
+        self.assertContains(response, reverse('api_chat', args=[self.service_request.pk]) + '?since=')
+        self.assertContains(response, f'let since = {self.message.pk};')
+
+        # A consulta usa a sessão da página.
+        url = reverse('api_chat', args=[self.service_request.pk])
+        self.assertEqual([m['content'] for m in self.client.get(url, {'since': 0}).json()['results']], ['oi'])
+        self.assertEqual(self.client.get(url, {'since': self.message.pk}).json()['results'], [])
+
+    def connect(self, query='', **headers):
+        """Handshake no ``websocket_application``; devolve a primeira mensagem enviada."""
+        incoming = [{'type': 'websocket.connect'}, {'type': 'websocket.disconnect'}]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0) if incoming else await asyncio.Future()
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            'type': 'websocket', 'path': f'/ws/requests/{self.service_request.pk}/', 'query_string': query.encode(),
+            'headers': [(name.encode(), value.encode()) for name, value in {'host': 'testserver', **headers}.items()],
+        }
+        async_to_sync(websocket_application)(scope, receive, send)
+        return sent[0]
+
+    def test_websocket_session_requires_same_origin(self):
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        self.assertEqual(self.connect(cookie=cookie, origin='http://testserver')['type'], 'websocket.accept')
+        self.assertEqual(self.connect(cookie=cookie, origin='https://fazpramim-front.onrender.com')['type'],
+                         'websocket.accept')
+        for origin in ('https://evil.example', 'null', None):
+            with self.subTest(origin=origin):
+                headers = {'cookie': cookie, **({'origin': origin} if origin else {})}
+                self.assertEqual(self.connect(**headers), {'type': 'websocket.close', 'code': 4403})
+
+    def test_tickets_are_single_use_and_scoped(self):
+        token = AuthToken.objects.create(self.client_user)[1]
+        url = reverse('api_request_events_ticket', args=[self.service_request.pk])
+        self.client.logout()
+        response = self.client.post(url, HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 201)
+        ticket = response.data['ticket']
+        # Um ticket autentica sem cookie e sem Origin, uma vez só.
+        self.assertEqual(self.connect(f'ticket={ticket}')['type'], 'websocket.accept')
+        self.assertEqual(self.connect(f'ticket={ticket}'), {'type': 'websocket.close', 'code': 4401})
+        self.assertIsNone(_ticket_user(issue_ticket(self.client_user, self.service_request.pk + 1),
+                                       self.service_request.pk))
+        # ?token= não autentica mais.
+        self.assertEqual(self.connect(f'token={token}'), {'type': 'websocket.close', 'code': 4403})
+
+        outsider = User.objects.create_user('outro')
+        outsider_token = AuthToken.objects.create(outsider)[1]
+        self.assertEqual(self.client.post(url, HTTP_AUTHORIZATION=f'Token {outsider_token}').status_code, 403)
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider_user = User.objects.create_user('prestador')
+        provider = ProviderProfile.objects.create(user=cls.provider_user, full_name='P', professional_email='p@ex.com')
+        client = User.objects.create_user('cliente')
+        now = timezone.now()
+        # Empates na data e avaliações sem data (linhas antigas).
+        dates = [now, now, None, now - timezone.timedelta(days=1), None, now, None, now - timezone.timedelta(days=1)]
+        for n, reviewed_at in enumerate(dates):
+            sr = ServiceRequest.objects.create(provider=provider, client=client, description=str(n),
+                                               status=ServiceRequest.STATUS_COMPLETED)
+            Review.objects.create(service_request=sr, provider=provider, client=client, client_rating=n % 5 + 1,
+                                  client_reviewed_at=reviewed_at)
+        cls.token = AuthToken.objects.create(cls.provider_user)[1]
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_through_ties_and_nulls(self):
+        expected = list(Review.objects.order_by('-client_reviewed_at', '-id').values_list('id', flat=True))
+        seen, pages = [], []
+        page = self.get(reverse('provider-reviews') + '?page_size=3')
+        while True:
+            pages.append(page)
+            seen.extend(review['id'] for review in page['results'])
+            if not page['next']:
+                break
+            page = self.get(page['next'])
+        self.assertEqual(seen, expected)
+
+        # De volta pelos links "previous", a partir da última página.
+        back = []
+        for page in reversed(pages[1:]):
+            back = self.get(page['previous'])['results'] + back
+        self.assertEqual([review['id'] for review in back], expected[:len(back)])
+        self.assertEqual(len(back), len(expected) - len(pages[-1]['results']))
+
+    def test_invalid_cursor_and_page_size(self):
+        url = reverse('provider-reviews')
+        self.assertEqual(self.client.get(url + '?cursor=xyz', HTTP_AUTHORIZATION=f'Token {self.token}').status_code, 404)
+        self.assertEqual(len(self.get(url + '?page_size=0')['results']), 8)
+        self.assertEqual(len(self.get(url + '?page_size=abc')['results']), 8)
+
+
+class RatingAggregateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = ProviderProfile.objects.create(user=User.objects.create_user('prestador'), full_name='P',
+                                                      professional_email='p@ex.com')
+        cls.client_user = User.objects.create_user('cliente')
+        cls.client_profile = ClientProfile.objects.create(user=cls.client_user, full_name='C', cpf='1')
+
+    def review(self, **ratings):
+        sr = ServiceRequest.objects.create(provider=self.provider, client=self.client_user, description='x',
+                                           status=ServiceRequest.STATUS_COMPLETED)
+        return Review.objects.create(service_request=sr, **ratings)
+
+    def summary(self, profile):
+        profile.refresh_from_db()
+        return (profile.rating_count, profile.rating_sum, profile.rating_average,
+                [getattr(profile, f'rating_{value}') for value in RatingSummary.RATING_VALUES])
+
+    def test_incremental_aggregates(self):
+        first = self.review(client_rating=5)
+        self.review(client_rating=2, provider_rating=4)
+        self.assertEqual(self.summary(self.provider), (2, 7, 3.5, [0, 0, 1, 0, 0, 1]))
+        self.assertEqual(self.summary(self.client_profile), (1, 4, 4.0, [0, 0, 0, 0, 1, 0]))
+
+        first.client_rating = 3
+        first.save()
+        self.assertEqual(self.summary(self.provider), (2, 5, 2.5, [0, 0, 1, 1, 0, 0]))
+        # Salvar de novo a partir de uma cópia antiga usa a nota do banco, não a da cópia.
+        stale = Review.objects.get(pk=first.pk)
+        first.client_rating = 1
+        first.save()
+        stale.client_rating = 4
+        stale.save()
+        self.assertEqual(self.summary(self.provider), (2, 6, 3.0, [0, 0, 1, 0, 1, 0]))
+
+        first.delete()
+        self.assertEqual(self.summary(self.provider), (1, 2, 2.0, [0, 0, 1, 0, 0, 0]))
+
+    def test_rebuild_matches_incremental(self):
+        reviews = [self.review(client_rating=n % 6, provider_rating=(n % 5) or None) for n in range(9)]
+        reviews[0].delete()
+        incremental = self.summary(self.provider), self.summary(self.client_profile)
+        ProviderProfile.objects.update(rating_count=0, rating_sum=0, rating_average=None)
+        self.assertEqual(rebuild_rating_aggregates(), (1, 1))
+        self.assertEqual((self.summary(self.provider), self.summary(self.client_profile)), incremental)
+
+    def test_search_results_pluralize(self):
+        html = render_to_string('fazpramim/_search_results.html', {'results': [self.provider]})
+        self.assertNotIn('avaliação', html)
+        self.review(client_rating=4)
+        self.provider.refresh_from_db()
+        html = render_to_string('fazpramim/_search_results.html', {'results': [self.provider]})
+        self.assertIn('(1 avaliação)', html)
+        self.review(client_rating=5)
+        self.provider.refresh_from_db()
+        html = render_to_string('fazpramim/_search_results.html', {'results': [self.provider]})
+        self.assertIn('(2 avaliações)', html)
+
+
+class ChatSummaryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider_user = User.objects.create_user('prestador')
+        provider = ProviderProfile.objects.create(user=cls.provider_user, full_name='P', professional_email='p@ex.com')
+        cls.client_user = User.objects.create_user('cliente')
+        cls.service_request = ServiceRequest.objects.create(provider=provider, client=cls.client_user, description='x')
+        cls.messages = [
+            ChatMessage.objects.create(service_request=cls.service_request, sender=cls.client_user, content=str(n))
+            for n in range(5)
+        ]
+
+    def test_summary_follows_messages(self):
+        self.service_request.refresh_from_db()
+        self.assertEqual((self.service_request.message_count, self.service_request.last_message_id), (5, self.messages[-1].pk))
+        self.messages[-1].delete()
+        self.service_request.refresh_from_db()
+        self.assertEqual((self.service_request.message_count, self.service_request.last_message_id), (4, self.messages[-2].pk))
+
+    def test_cascade_does_not_rebuild_per_message(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.service_request.delete()
+        summary_updates = [q['sql'] for q in captured if q['sql'].startswith('UPDATE "accounts_servicerequest"')]
+        self.assertLessEqual(len(summary_updates), 1, summary_updates)
+        self.assertFalse(ServiceRequest.objects.exists())
+
+
+class TokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        cache.clear()
+        self.user = User.objects.create_user('usuario')
+        self.tokens = [AuthToken.objects.create(self.user)[1] for _ in range(2)]
+
+    def get(self, token):
+        return self.client.get(reverse('api_me'), HTTP_AUTHORIZATION=f'Token {token}')
+
+    def test_cache_hit_does_not_query(self):
+        self.get(self.tokens[0])
+        auth = CachedTokenAuthentication()
+        with self.assertNumQueries(0):
+            user, _ = auth.authenticate_credentials(self.tokens[0].encode())
+        self.assertEqual((user.pk, user.username), (self.user.pk, 'usuario'))
+
+    def test_user_changes_invalidate_the_cache(self):
+        self.assertEqual(self.get(self.tokens[0]).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(self.tokens[0]).status_code, 401)
+
+    def test_logout_revokes_the_token(self):
+        self.assertEqual(self.get(self.tokens[0]).status_code, 200)
+        response = self.client.post(reverse('api-logout'), HTTP_AUTHORIZATION=f'Token {self.tokens[0]}')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get(self.tokens[0]).status_code, 401)
+        self.assertEqual(self.get(self.tokens[1]).status_code, 200)
+
+    def test_logoutall_revokes_every_token(self):
+        for token in self.tokens:
+            self.assertEqual(self.get(token).status_code, 200)
+        response = self.client.post(reverse('api-logoutall'), HTTP_AUTHORIZATION=f'Token {self.tokens[1]}')
+        self.assertEqual(response.status_code, 204)
+        for token in self.tokens:
+            self.assertEqual(self.get(token).status_code, 401)
+
+    def test_revocation_reaches_other_processes(self):
+        self.assertEqual(self.get(self.tokens[0]).status_code, 200)
+        # Outro processo desativou o usuário: o banco mudou e, depois do
+        # commit, a versão compartilhada subiu; o LRU daqui não foi tocado.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(len(token_cache), 1)
+        bump_revocation(self.user.pk)
+        self.assertEqual(self.get(self.tokens[0]).status_code, 401)
+
+    def test_logout_bumps_the_shared_version_after_commit(self):
+        self.get(self.tokens[0])
+        version = revocation_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('api-logout'), HTTP_AUTHORIZATION=f'Token {self.tokens[0]}')
+        self.assertNotEqual(revocation_version(self.user.pk), version)
+        # Logo depois da revogação o que vem do banco não é guardado.
+        self.assertEqual(self.get(self.tokens[1]).status_code, 200)
+        self.assertEqual(len(token_cache), 0)
+        cache.delete(f'auth:settling:{self.user.pk}')
+        self.assertEqual(self.get(self.tokens[1]).status_code, 200)
+        self.assertEqual(len(token_cache), 1)
+
+    def test_expired_token(self):
+        AuthToken.objects.filter(user=self.user).update(expiry=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertEqual(self.get(self.tokens[0]).status_code, 401)
+
+    def test_expiry_backfill(self):
+        AuthToken.objects.filter(user=self.user).update(expiry=None)
+        migration = import_module('accounts.migrations.0017_token_expiry_backfill')
+        migration.backfill_token_expiry(django_apps, connection.schema_editor())
+        for token in AuthToken.objects.filter(user=self.user):
+            self.assertEqual(token.expiry, token.created + timezone.timedelta(days=14))
+
+
+JOB_CALLS = []
+
+
+def record_job(**kwargs):
+    JOB_CALLS.append(kwargs)
+
+
+def failing_job(**kwargs):
+    raise RuntimeError('falhou')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        JOB_CALLS.clear()
+        self.worker = Worker(concurrency=1, name='teste')
+
+    def test_claim_takes_ready_jobs_by_priority(self):
+        low = enqueue(record_job, n=1)
+        high = enqueue(record_job, priority=5, n=2)
+        enqueue(record_job, priority=9, delay=timezone.timedelta(hours=1), n=3)
+        job = self.worker.claim('teste/0')
+        self.assertEqual(job.pk, high.pk)
+        self.assertEqual((job.status, job.locked_by, job.attempts), (Job.STATUS_RUNNING, 'teste/0', 1))
+        self.assertEqual(self.worker.claim('teste/1').pk, low.pk)
+        self.assertIsNone(self.worker.claim('teste/2'))
+
+    def test_successful_job_is_done(self):
+        job = enqueue(record_job, n=1)
+        self.assertTrue(self.worker.run_one('teste/0'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.locked_at), (Job.STATUS_DONE, '', None))
+        self.assertEqual(JOB_CALLS, [{'n': 1}])
+        self.assertFalse(self.worker.run_one('teste/0'))
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        job = enqueue(failing_job, max_attempts=2)
+        with self.assertLogs('accounts.jobs', 'WARNING'):
+            self.worker.run_one('teste/0')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('RuntimeError', job.last_error)
+        self.assertFalse(self.worker.run_one('teste/0'))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('accounts.jobs', 'ERROR'):
+            self.worker.run_one('teste/0')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_release_stale_requeues_only_expired_leases(self):
+        stale, alive, exhausted = (enqueue(record_job, max_attempts=2) for _ in range(3))
+        for _ in range(3):
+            self.worker.claim('teste/0')
+        old = timezone.now() - timezone.timedelta(hours=1)
+        Job.objects.filter(pk__in=[stale.pk, exhausted.pk]).update(locked_at=old)
+        Job.objects.filter(pk=exhausted.pk).update(attempts=2)
+        self.assertEqual(self.worker.release_stale(), 1)
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            stale.pk: Job.STATUS_QUEUED, alive.pk: Job.STATUS_RUNNING, exhausted.pk: Job.STATUS_FAILED,
+        })
+
+    def test_heartbeat_keeps_long_jobs_leased(self):
+        enqueue(record_job)
+        job = self.worker.claim('teste/0')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timezone.timedelta(hours=1))
+        self.assertEqual(Heartbeat(job).beat(), 1)
+        self.assertEqual(self.worker.release_stale(), 0)
+
+    def test_lost_lease_is_not_overwritten(self):
+        enqueue(record_job)
+        job = self.worker.claim('teste/0')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timezone.timedelta(hours=1))
+        self.worker.release_stale()
+        self.assertEqual(self.worker.claim('teste/1').pk, job.pk)
+        self.assertEqual(Heartbeat(job).beat(), 0)
+        with self.assertLogs('accounts.jobs', 'WARNING'):
+            self.worker.execute(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.STATUS_RUNNING, 'teste/1'))
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        get_registry().clear()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('login'))
+        phases = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertTrue({'db', 'template', 'view', 'app', 'total', 'resp'} <= set(phases), phases)
+        self.assertRegex(phases['db'], r'^dur=[\d.]+;desc="\d+ consultas"$')
+        self.assertEqual(phases['resp'], f'desc="{len(response.content)} B"')
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('login')))
+
+    def test_prometheus_output(self):
+        self.client.get(reverse('login'))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        labels = 'route="login",method="GET"'
+        self.assertIn('# TYPE fazpramim_http_requests_total counter', text)
+        self.assertIn(f'fazpramim_http_requests_total{{{labels},status="200"}} 1', text)
+        self.assertIn('# TYPE fazpramim_http_request_duration_seconds histogram', text)
+        self.assertIn(f'fazpramim_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1', text)
+        self.assertIn(f'fazpramim_http_request_duration_seconds_count{{{labels}}} 1', text)
+        self.assertRegex(text, rf'fazpramim_http_request_queries_sum{{{re.escape(labels)}}} \d+')
+
+    @override_settings(METRICS_QUERY_BUCKETS=(0, 3))
+    def test_bucket_settings(self):
+        registry = InMemoryRegistry()
+        for value in (0, 2, 7):
+            registry.observe('fazpramim_http_request_queries', (), value)
+        (_, buckets, counts, total), = registry.collect()['fazpramim_http_request_queries']
+        self.assertEqual((buckets, counts, total), ((0, 3), [1, 1, 1], 9))
+
+    def test_access_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 403)
+        with self.settings(METRICS_TOKEN='segredo'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer errado').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo', HTTP_X_FORWARDED_FOR='203.0.113.7')
+            self.assertEqual(response.status_code, 200)
+
+
+class ChunkedUploadTests(MediaFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('prestador')
+        ProviderProfile.objects.create(user=user, full_name='P', professional_email='p@ex.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {AuthToken.objects.create(user)[1]}'}
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'teal').save(buffer, 'PNG')
+        self.data = buffer.getvalue()
+        response = self.client.post(reverse('api_upload_start'), {
+            'target': 'portfolio.photo', 'filename': 'foto.png', 'size': len(self.data),
+        }, **self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.data['id']
+
+    def put(self, offset, chunk, **headers):
+        return self.client.put(
+            reverse('api_upload_chunk', args=[self.upload_id]), chunk, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), **headers, **self.auth,
+        )
+
+    def upload_all(self):
+        half = len(self.data) // 2
+        self.assertEqual(self.put(0, self.data[:half]).status_code, 200)
+        response = self.put(half, self.data[half:])
+        self.assertEqual(response['Upload-Offset'], str(len(self.data)))
+
+    def finalize(self, **data):
+        return self.client.post(reverse('api_upload_finalize', args=[self.upload_id]), data, **self.auth)
+
+    def test_offset_mismatch_is_rejected(self):
+        response = self.put(10, self.data[:10])
+        self.assertEqual((response.status_code, response.data['offset']), (409, 0))
+
+    def test_duplicate_chunk_is_rejected(self):
+        self.assertEqual(self.put(0, self.data[:100]).status_code, 200)
+        response = self.put(0, self.data[:100])
+        self.assertEqual((response.status_code, response.data['offset']), (409, 100))
+        self.assertEqual(len(Upload.objects.get(pk=self.upload_id).parts), 1)
+
+    def test_chunk_sha256_mismatch(self):
+        response = self.put(0, self.data[:100], HTTP_X_CHUNK_SHA256=hashlib.sha256(b'outra').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Upload.objects.get(pk=self.upload_id).offset, 0)
+        parts = os.path.join(self.media.name, 'uploads', 'parts', str(self.upload_id))
+        self.assertFalse([name for _, _, names in os.walk(parts) for name in names])
+        response = self.put(0, self.data[:100], HTTP_X_CHUNK_SHA256=hashlib.sha256(self.data[:100]).hexdigest())
+        self.assertEqual(response.status_code, 200)
+
+    def test_finalize_crc_mismatch(self):
+        self.upload_all()
+        response = self.finalize(crc32=format(zlib.crc32(self.data) ^ 1, 'x'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Upload.objects.get(pk=self.upload_id).status, Upload.STATUS_PENDING)
+        response = self.finalize(crc32=format(zlib.crc32(self.data), 'x'))
+        self.assertEqual(response.status_code, 200)
+        upload = Upload.objects.get(pk=self.upload_id)
+        self.assertEqual((upload.status, upload.sha256), (Upload.STATUS_COMPLETE, hashlib.sha256(self.data).hexdigest()))
+        with default_storage.open(upload.file, 'rb') as fh:
+            self.assertEqual(fh.read(), self.data)
+
+    def test_upload_is_attached_once(self):
+        self.upload_all()
+        self.assertEqual(self.finalize().status_code, 200)
+        response = self.client.post(reverse('api_portfolio_add'), {'upload': self.upload_id}, **self.auth)
+        self.assertEqual(response.status_code, 201, response.content)
+        response = self.client.post(reverse('api_portfolio_add'), {'upload': self.upload_id}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PortfolioPhoto.objects.count(), 1)
+        with self.assertRaises(UploadError) as raised:
+            attach([Upload.objects.get(pk=self.upload_id)])
+        self.assertEqual(raised.exception.status, 409)
+
+
+class ProviderSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        def provider(username, **fields):
+            user = User.objects.create_user(username)
+            return ProviderProfile.objects.create(user=user, professional_email=f'{username}@ex.com', **fields)
+
+        cls.by_name = provider('nome', full_name='Ana Eletricista', service_address='Rua A')
+        cls.by_address = provider('endereco', full_name='Bruno', service_address='Travessa dos Eletricistas')
+        cls.other = provider('outro', full_name='Carla Encanadora', service_address='Rua B')
+
+    def search(self, query):
+        return list(search_providers(ProviderProfile.objects.all(), query))
+
+    def test_accents_and_plurals_fold(self):
+        self.assertEqual(fold('ELETRICÍSTA Ção'), 'eletricista cao')
+        self.assertEqual(tokenize('Eletricístas das instalações'), ['eletricista', 'instalacao'])
+        self.assertEqual(self.search('ELETRICÍSTAS'), self.search('eletricista'))
+        self.assertEqual(self.search('encanadôra'), [self.other])
+
+    def test_prefix_and_all_terms_required(self):
+        self.assertEqual(set(self.search('eletric')), {self.by_name, self.by_address})
+        self.assertEqual(self.search('eletricista rua'), [self.by_name])
+        self.assertEqual(self.search('de'), [])
+
+    def test_name_matches_rank_above_address_matches(self):
+        self.assertEqual(self.search('eletricista'), [self.by_name, self.by_address])
+
+    def test_index_follows_profile_changes(self):
+        self.other.full_name = 'Carla Eletricista'
+        self.other.save()
+        self.assertIn(self.other, self.search('eletricista'))
+        self.other.delete()
+        self.assertEqual(self.search('encanadora'), [])
+
+    def test_migration_rebuilds_and_drops_the_index(self):
+        migration = import_module('accounts.migrations.0004_provider_search')
+        self.assertEqual(migration.tokenize('Instalações Elétricas'), tokenize('Instalações Elétricas'))
+        backend = get_backend()
+        backend.clear()
+        migration.build_search_index(django_apps, connection.schema_editor())
+        self.assertEqual(self.search('eletricista'), [self.by_name, self.by_address])
+        if migration.search_backend(connection) == 'fts5':
+            migration.drop_search_index(django_apps, connection.schema_editor())
+            self.assertNotIn(migration.FTS_TABLE, connection.introspection.table_names())
+            backend.install()
+
+
+class ProviderRankingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user('cliente')
+        cls.veteran, cls.newcomer = (
+            ProviderProfile.objects.create(user=User.objects.create_user(name), full_name=name,
+                                           professional_email=f'{name}@ex.com')
+            for name in ('veterano', 'novato')
+        )
+
+    def request(self, provider, status=ServiceRequest.STATUS_PENDING):
+        return ServiceRequest.objects.create(provider=provider, client=self.client_user, description='x', status=status)
+
+    def test_responded_at_is_set_once(self):
+        service_request = self.request(self.veteran)
+        self.assertIsNone(service_request.responded_at)
+        service_request.status = ServiceRequest.STATUS_ACCEPTED
+        service_request.save(update_fields=['status'])
+        service_request.refresh_from_db()
+        responded = service_request.responded_at
+        self.assertIsNotNone(responded)
+        service_request.status = ServiceRequest.STATUS_COMPLETED
+        service_request.save()
+        service_request.refresh_from_db()
+        self.assertEqual(service_request.responded_at, responded)
+
+    def test_compute_score(self):
+        newcomer = compute_score(0, 0, 0, 0, 0, None)
+        self.assertTrue(0 < newcomer < 1)
+        # A média bayesiana exige volume: uma nota 5 pesa menos que vinte.
+        self.assertLess(compute_score(5, 1, 1, 1, 0, 3600), compute_score(100, 20, 1, 1, 0, 3600))
+        self.assertLess(compute_score(0, 0, 0, 0, 5, None), newcomer)
+        self.assertLess(compute_score(0, 0, 0, 0, 0, 72 * 3600), compute_score(0, 0, 0, 0, 0, 600))
+        self.assertLessEqual(compute_score(250, 50, 10 ** 6, 10 ** 6, 0, 0), 1)
+
+    def test_refresh_updates_only_stale_rankings(self):
+        for status in (ServiceRequest.STATUS_COMPLETED, ServiceRequest.STATUS_COMPLETED, ServiceRequest.STATUS_ACCEPTED):
+            self.request(self.veteran, status)
+        self.request(self.newcomer, ServiceRequest.STATUS_REJECTED)
+        self.assertEqual(refresh_rankings()[0], 2)
+        self.veteran.refresh_from_db()
+        self.newcomer.refresh_from_db()
+        self.assertGreater(self.veteran.ranking_score, self.newcomer.ranking_score)
+        self.assertEqual(
+            (self.veteran.ranking.completed_count, self.veteran.ranking.accepted_count, self.veteran.ranking.stale),
+            (2, 3, False),
+        )
+        self.assertEqual(refresh_rankings(), (0, 0))
+        self.assertEqual(refresh_rankings(full=True), (2, 0))
+        ordered = list(ProviderProfile.objects.order_by('-ranking_score', 'id'))
+        self.assertEqual(ordered, [self.veteran, self.newcomer])
+
+    def test_blend_ranking(self):
+        ProviderProfile.objects.filter(pk=self.newcomer.pk).update(ranking_score=1.0)
+        ProviderProfile.objects.filter(pk=self.veteran.pk).update(ranking_score=0.0)
+        ranked = [(self.veteran.pk, 1.0), (self.newcomer.pk, 0.9)]
+        self.assertEqual(blend_ranking(ProviderProfile.objects.all(), ranked), [self.newcomer.pk, self.veteran.pk])
+        with self.settings(RANKING_TEXT_WEIGHT=1.0):
+            self.assertEqual(blend_ranking(ProviderProfile.objects.all(), ranked), [self.veteran.pk, self.newcomer.pk])
+        # As notas são lidas no banco do queryset, não no padrão.
+        with self.assertRaises(ConnectionDoesNotExist):
+            blend_ranking(ProviderProfile.objects.using('outro'), ranked)
+
+    def test_migration_matches_refresh(self):
+        self.request(self.veteran, ServiceRequest.STATUS_COMPLETED)
+        self.request(self.newcomer, ServiceRequest.STATUS_REJECTED)
+        refresh_rankings(full=True)
+        expected = dict(ProviderProfile.objects.values_list('pk', 'ranking_score'))
+        migration = import_module('accounts.migrations.0013_provider_ranking')
+        ProviderProfile.objects.update(ranking_score=0)
+        django_apps.get_model('accounts', 'ProviderRanking').objects.all().delete()
+        migration.compute_rankings(django_apps, connection.schema_editor())
+        # A migration aproxima responded_at por updated_at: diferença de microssegundos.
+        for pk, score in ProviderProfile.objects.values_list('pk', 'ranking_score'):
+            self.assertAlmostEqual(score, expected[pk], places=6)
+
+
+class ChatSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider_user = User.objects.create_user('prestador')
+        provider = ProviderProfile.objects.create(user=cls.provider_user, full_name='P', professional_email='p@ex.com')
+        cls.client_user = User.objects.create_user('cliente')
+        cls.service_request = ServiceRequest.objects.create(provider=provider, client=cls.client_user, description='x')
+        cls.messages = [
+            ChatMessage.objects.create(service_request=cls.service_request, sender=cls.client_user, content=str(n))
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        token_cache.clear()
+        self.tokens = {user.pk: AuthToken.objects.create(user)[1] for user in (self.provider_user, self.client_user)}
+
+    def get(self, user, query='', **headers):
+        url = reverse('api_chat', args=[self.service_request.pk]) + query
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Token {self.tokens[user.pk]}', **headers)
+
+    def test_since_returns_only_newer_messages(self):
+        response = self.get(self.provider_user, f'?since={self.messages[0].pk}')
+        self.assertEqual([m['id'] for m in response.data['results']], [m.pk for m in self.messages[1:]])
+        self.assertEqual(self.get(self.provider_user, f'?since={self.messages[-1].pk}').data['results'], [])
+        self.assertEqual(self.get(self.provider_user, '?since=abc').status_code, 400)
+
+    def test_etag_answers_304_until_something_changes(self):
+        etag = self.get(self.provider_user)['ETag']
+        response = self.get(self.provider_user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+        ChatMessage.objects.create(service_request=self.service_request, sender=self.client_user, content='nova')
+        response = self.get(self.provider_user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_reading_advances_the_marker_and_the_other_side_etag(self):
+        client_etag = self.get(self.client_user)['ETag']
+        self.assertFalse(any(m['is_read'] for m in self.get(self.client_user).data['results']))
+        self.get(self.provider_user)
+        with CaptureQueriesContext(connection) as captured:
+            self.get(self.provider_user)
+        # Sem mensagem nova a marca não anda: nenhuma escrita.
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in captured), [q['sql'] for q in captured])
+        response = self.get(self.client_user, HTTP_IF_NONE_MATCH=client_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(m['is_read'] for m in response.data['results']))
+
+    def test_outsiders_are_refused(self):
+        outsider = User.objects.create_user('outro')
+        self.tokens[outsider.pk] = AuthToken.objects.create(outsider)[1]
+        self.assertEqual(self.get(outsider).status_code, 403)
+
+
+class ProviderCacheTests(MediaFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.providers = [
+            ProviderProfile.objects.create(user=User.objects.create_user(name), full_name=name,
+                                           professional_email=f'{name}@ex.com')
+            for name in ('ana', 'bruno')
+        ]
+
+    def x_cache(self, provider=None):
+        url = reverse('api_provider_detail', args=[provider.pk]) if provider else reverse('api_provider_list')
+        return self.client.get(url)['X-Cache']
+
+    def warm(self):
+        self.assertEqual([self.x_cache(), self.x_cache()], ['MISS', 'HIT'])
+        for provider in self.providers:
+            self.assertEqual([self.x_cache(provider), self.x_cache(provider)], ['MISS', 'HIT'])
+
+    def test_hits_are_counted(self):
+        self.warm()
+        self.assertEqual(stats()['list'], {'hit': 1, 'miss': 1, 'ratio': 0.5})
+        self.assertEqual((stats()['detail']['hit'], stats()['detail']['miss']), (2, 2))
+
+    def test_profile_change_invalidates_detail_and_list(self):
+        self.warm()
+        ana, bruno = self.providers
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.full_name = 'Ana Maria'
+            ana.save()
+        self.assertEqual([self.x_cache(), self.x_cache(ana), self.x_cache(bruno)], ['MISS', 'MISS', 'HIT'])
+        self.assertIn('Ana Maria', self.client.get(reverse('api_provider_detail', args=[ana.pk])).content.decode())
+
+    def test_portfolio_and_review_changes_invalidate_the_provider(self):
+        self.warm()
+        ana, bruno = self.providers
+        with self.captureOnCommitCallbacks(execute=True):
+            PortfolioPhoto.objects.create(provider=ana, photo=ContentFile(b'x', name='foto.jpg'))
+        self.assertEqual([self.x_cache(ana), self.x_cache(bruno)], ['MISS', 'HIT'])
+        client_user = User.objects.create_user('cliente')
+        service_request = ServiceRequest.objects.create(provider=bruno, client=client_user, description='x',
+                                                        status=ServiceRequest.STATUS_COMPLETED)
+        self.x_cache(bruno)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(service_request=service_request, client_rating=5)
+        self.assertEqual([self.x_cache(ana), self.x_cache(bruno)], ['HIT', 'MISS'])
+
+    def test_login_does_not_invalidate(self):
+        self.warm()
+        ana = self.providers[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.user.last_login = timezone.now()
+            ana.user.save(update_fields=['last_login'])
+        self.assertEqual(self.x_cache(ana), 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.user.email = 'nova@ex.com'
+            ana.user.save()
+        self.assertEqual(self.x_cache(ana), 'MISS')
+
+    def test_rollback_keeps_the_cache(self):
+        self.warm()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.providers[0].save()
+        self.assertTrue(callbacks)
+        self.assertEqual(self.x_cache(self.providers[0]), 'HIT')
+
+
+class MeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider_user = User.objects.create_user('prestador')
+        cls.provider = ProviderProfile.objects.create(user=cls.provider_user, full_name='Ana', city='Recife',
+                                                      state='PE', professional_email='p@ex.com')
+        other = ProviderProfile.objects.create(user=User.objects.create_user('outro'), full_name='O',
+                                               professional_email='o@ex.com')
+        cls.client_user = User.objects.create_user('cliente')
+        ClientProfile.objects.create(user=cls.client_user, full_name='Caio', cpf='1')
+
+        def request(provider, client, status=ServiceRequest.STATUS_PENDING):
+            return ServiceRequest.objects.create(provider=provider, client=client, description='x', status=status)
+
+        cls.chat = request(cls.provider, cls.client_user)
+        request(cls.provider, cls.client_user)
+        request(cls.provider, cls.client_user, ServiceRequest.STATUS_ACCEPTED)
+        request(cls.provider, cls.client_user, ServiceRequest.STATUS_COMPLETED)
+        # O prestador também contrata como cliente.
+        request(other, cls.provider_user)
+        for text in ('oi', 'tudo bem?'):
+            ChatMessage.objects.create(service_request=cls.chat, sender=cls.client_user, content=text)
+        ChatMessage.objects.create(service_request=cls.chat, sender=cls.provider_user, content='sim')
+
+    def setUp(self):
+        token_cache.clear()
+
+    def me(self, user):
+        token = AuthToken.objects.create(user)[1]
+        self.client.get(reverse('api_me'), HTTP_AUTHORIZATION=f'Token {token}')
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api_me'), HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_provider(self):
+        data = self.me(self.provider_user)
+        self.assertEqual((data['user']['username'], data['role']), ('prestador', 'provider'))
+        self.assertEqual(
+            (data['profile']['id'], data['profile']['full_name'], data['profile']['city']),
+            (self.provider.pk, 'Ana', 'Recife'),
+        )
+        self.assertEqual(data['requests'], {'received': {'pending': 2, 'accepted': 1}, 'sent': {'pending': 1, 'accepted': 0}})
+        self.assertEqual(data['unread'], {'messages': 2, 'conversations': 1})
+
+    def test_client_and_read_marker(self):
+        data = self.me(self.client_user)
+        self.assertEqual((data['role'], data['profile']['full_name']), ('client', 'Caio'))
+        self.assertEqual(data['requests'], {'received': {'pending': 0, 'accepted': 0}, 'sent': {'pending': 2, 'accepted': 1}})
+        self.assertEqual(data['unread'], {'messages': 1, 'conversations': 1})
+        token = AuthToken.objects.create(self.client_user)[1]
+        self.client.get(reverse('api_chat', args=[self.chat.pk]), HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(self.me(self.client_user)['unread'], {'messages': 0, 'conversations': 0})
+
+    def test_user_without_profile(self):
+        data = self.me(User.objects.create_user('sem-perfil'))
+        self.assertEqual((data['role'], data['profile']), (None, None))
+        self.assertEqual(data['unread'], {'messages': 0, 'conversations': 0})
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get(reverse('api_me')).status_code, 401)
+
+
+class SeederTests(MediaFilesMixin, TestCase):
+    end = timezone.make_aware(timezone.datetime(2026, 1, 1))
+
+    def seed(self, **options):
+        options = {'providers': 6, 'clients': 5, 'requests': 60, 'messages': 3, 'batch_size': 7, 'end': self.end,
+                   **options}
+        return MarketplaceSeeder(**options).run()
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by('username').values_list('username', 'first_name', 'date_joined')),
+            list(ServiceRequest.objects.order_by('created_at').values_list(
+                'provider__user__username', 'client__username', 'status', 'description', 'created_at')),
+            list(ChatMessage.objects.order_by('created_at').values_list('sender__username', 'content')),
+            list(Review.objects.order_by('created_at').values_list('client_rating', 'provider_rating')),
+        )
+
+    def test_same_seed_same_data(self):
+        counts = self.seed()
+        first = self.snapshot()
+        self.assertEqual((len(first[0]), len(first[1])), (11, 60))
+        self.assertEqual(counts['messages'], ChatMessage.objects.count())
+        self.assertEqual(counts['reviews'], Review.objects.count())
+        User.objects.all().delete()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+        User.objects.all().delete()
+        self.seed(seed=2)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_derived_data_matches_what_signals_would_keep(self):
+        self.seed()
+        self.assertEqual(
+            {status for status, in ServiceRequest.objects.values_list('status')},
+            {s for s, _ in ServiceRequest.STATUS_CHOICES},
+        )
+        for sr in ServiceRequest.objects.all():
+            messages = list(sr.messages.order_by('created_at', 'id').values_list('id', flat=True))
+            self.assertEqual((sr.message_count, sr.last_message_id), (len(messages), messages[-1] if messages else None))
+            for last_read in sr.read_markers.values_list('last_read_message_id', flat=True):
+                self.assertIn(last_read, messages)
+        aggregates = list(ProviderProfile.objects.order_by('pk').values_list('rating_count', 'rating_sum'))
+        rebuild_rating_aggregates()
+        self.assertEqual(list(ProviderProfile.objects.order_by('pk').values_list('rating_count', 'rating_sum')), aggregates)
+        self.assertEqual(ProviderRanking.objects.filter(stale=False).count(), 6)
+        self.assertEqual(refresh_rankings(full=True)[1], 0)
+        provider = ProviderProfile.objects.first()
+        trade = provider.technical_qualification.split(':')[0]
+        self.assertIn(provider, search_providers(ProviderProfile.objects.all(), trade))
+
+    def test_media_placeholders_are_shared_blobs(self):
+        self.seed(media=True, media_variety=2)
+        references = Counter(
+            name for model, field in ((ProviderProfile, 'profile_photo'), (PortfolioPhoto, 'photo'),
+                                      (Review, 'client_photo'))
+            for name in model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .values_list(field, flat=True)
+        )
+        self.assertTrue(references)
+        for name, count in references.items():
+            self.assertTrue(self.exists(name), name)
+            self.assertEqual(MediaBlob.objects.get(name=name).refcount, count, name)
@@ -0,0 +1,261 @@
+"""
+Uploads em partes, retomáveis.
+
+Fluxo (``/api/accounts/uploads/``):
+
+1. ``start_upload``: declara o destino (``TARGETS``), o nome e o tamanho;
+2. ``append_chunk``: cada parte vai do corpo do request direto para o storage
+   (``uploads/parts/<id>/``), em blocos, com o CRC32 acumulado gravado no
+   ``Upload``. A parte só é aceita no ``offset`` atual: depois de uma queda o
+   cliente consulta o offset e continua dali;
+3. ``finalize_upload``: concatena as partes no diretório do campo de destino
+   (``upload_to``), calculando o SHA-256, e apaga as partes.
+
+O arquivo pronto é anexado por referência: o serializer recebe o id do upload
+(``UploadReferenceField``) e grava só o nome no campo, sem copiar bytes.
+``purge_uploads`` (comando ``purge_uploads``) remove os uploads abandonados.
+"""
+import hashlib
+import os
+import zlib
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import models
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from PIL import Image
+
+from .media import delete_on_commit
+from .models import Upload
+
+
+# Destino -> (modelo, campo de arquivo).
+TARGETS = {
+    'provider.profile_photo': ('accounts.ProviderProfile', 'profile_photo'),
+    'provider.identity_document': ('accounts.ProviderProfile', 'identity_document'),
+    'provider.certifications': ('accounts.ProviderProfile', 'certifications'),
+    'client.profile_photo': ('accounts.ClientProfile', 'profile_photo'),
+    'client.identity_document': ('accounts.ClientProfile', 'identity_document'),
+    'portfolio.photo': ('accounts.PortfolioPhoto', 'photo'),
+}
+
+READ_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    """Requisição inválida para o estado do upload; ``status`` é o código HTTP."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def target_field(target):
+    model_label, field_name = TARGETS[target]
+    return apps.get_model(model_label)._meta.get_field(field_name)
+
+
+def _part_name(upload, offset):
+    return f'uploads/parts/{upload.pk}/{offset:012d}'
+
+
+class _BodyReader:
+    """Lê até ``limit`` bytes do corpo, contando e atualizando os checksums."""
+
+    def __init__(self, stream, limit, crc, digest=None):
+        self.stream = stream
+        self.remaining = limit
+        self.length = 0
+        self.crc = crc
+        self.digest = digest
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        self.length += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        if self.digest is not None:
+            self.digest.update(data)
+        if not data:
+            self.remaining = 0
+        return data
+
+
+class _PartsReader:
+    """Concatena as partes do storage, em ordem, calculando o SHA-256."""
+
+    def __init__(self, storage, names):
+        self.storage = storage
+        self.names = list(names)
+        self.current = None
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        size = READ_BLOCK if size is None or size < 0 else size
+        while True:
+            if self.current is None:
+                if not self.names:
+                    return b''
+                self.current = self.storage.open(self.names.pop(0), 'rb')
+            data = self.current.read(size)
+            if data:
+                self.digest.update(data)
+                return data
+            self.current.close()
+            self.current = None
+
+
+def start_upload(user, target, filename, size, content_type=''):
+    if target not in TARGETS:
+        raise UploadError(f"Destino inválido. Opções: {', '.join(sorted(TARGETS))}.")
+    filename = get_valid_filename(os.path.basename(filename or ''))
+    if not filename:
+        raise UploadError("Nome de arquivo inválido.")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("Tamanho inválido.")
+    if size <= 0 or size > _setting('UPLOAD_MAX_SIZE', 50 * 1024 * 1024):
+        raise UploadError("Tamanho fora do limite.", status=413 if size > 0 else 400)
+    return Upload.objects.create(
+        user=user, target=target, filename=filename, size=size, content_type=content_type[:100],
+        expires_at=timezone.now() + timedelta(seconds=_setting('UPLOAD_EXPIRATION', 24 * 3600)),
+    )
+
+
+def append_chunk(upload, offset, stream, length, sha256=None, storage=default_storage):
+    """
+    Grava ``length`` bytes de ``stream`` como a parte em ``offset``. ``sha256``
+    (hex), se informado, é conferido. Retorna o novo offset.
+    """
+    if upload.status != Upload.STATUS_PENDING:
+        raise UploadError("Upload já finalizado.", status=409)
+    if offset != upload.offset:
+        raise UploadError(f"Offset esperado: {upload.offset}.", status=409)
+    if length <= 0:
+        raise UploadError("Parte vazia.")
+    if length > _setting('UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024) or offset + length > upload.size:
+        raise UploadError("Parte maior que o permitido.", status=413)
+
+    reader = _BodyReader(stream, length, upload.crc32, hashlib.sha256() if sha256 else None)
+    name = storage.save(_part_name(upload, offset), File(reader))
+    if reader.length != length:
+        storage.delete(name)
+        raise UploadError("Parte incompleta (conexão interrompida?).")
+    if sha256 and reader.digest.hexdigest() != sha256.lower():
+        storage.delete(name)
+        raise UploadError("SHA-256 da parte não confere.")
+
+    # Compare-and-set no offset: de duas partes simultâneas no mesmo offset, só uma entra.
+    updated = Upload.objects.filter(pk=upload.pk, offset=offset, status=Upload.STATUS_PENDING).update(
+        offset=offset + length, crc32=reader.crc, parts=[*upload.parts, name],
+        expires_at=timezone.now() + timedelta(seconds=_setting('UPLOAD_EXPIRATION', 24 * 3600)),
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        storage.delete(name)
+        upload.refresh_from_db()
+        raise UploadError(f"Offset esperado: {upload.offset}.", status=409)
+    upload.offset, upload.crc32, upload.parts = offset + length, reader.crc, [*upload.parts, name]
+    return upload.offset
+
+
+def _verify_image(storage, name):
+    try:
+        with storage.open(name, 'rb') as file:
+            Image.open(file).verify()
+    except Exception:
+        return False
+    return True
+
+
+def finalize_upload(upload, crc32=None, storage=default_storage):
+    """Junta as partes no destino. ``crc32`` (hex), se informado, é conferido."""
+    if upload.status != Upload.STATUS_PENDING:
+        raise UploadError("Upload já finalizado.", status=409)
+    if upload.offset != upload.size:
+        raise UploadError(f"Upload incompleto: {upload.offset} de {upload.size} bytes.", status=409)
+    if crc32 is not None:
+        try:
+            matches = int(str(crc32), 16) == upload.crc32
+        except ValueError:
+            matches = False
+        if not matches:
+            raise UploadError("CRC32 do arquivo não confere.")
+
+    field = target_field(upload.target)
+    reader = _PartsReader(storage, upload.parts)
+    name = storage.save(field.generate_filename(None, upload.filename), File(reader))
+    if isinstance(field, models.ImageField) and not _verify_image(storage, name):
+        storage.delete(name)
+        raise UploadError("O arquivo não é uma imagem válida.")
+
+    updated = Upload.objects.filter(pk=upload.pk, status=Upload.STATUS_PENDING).update(
+        status=Upload.STATUS_COMPLETE, file=name, sha256=reader.digest.hexdigest(), updated_at=timezone.now(),
+    )
+    if not updated:
+        storage.delete(name)
+        raise UploadError("Upload já finalizado.", status=409)
+    delete_on_commit(upload.parts, storage)
+    upload.status, upload.file, upload.sha256 = Upload.STATUS_COMPLETE, name, reader.digest.hexdigest()
+    return upload
+
+
+def completed_upload(user, pk, target):
+    """O upload concluído de ``user`` para ``target``, pronto para anexar."""
+    upload = Upload.objects.filter(pk=pk, user=user, status=Upload.STATUS_COMPLETE).first()
+    if upload is None:
+        raise UploadError("Upload não encontrado ou não finalizado.")
+    if upload.target != target:
+        raise UploadError(f"Upload enviado para {upload.target}, não para {target}.")
+    return upload
+
+
+def attach(uploads):
+    """
+    Marca os uploads como anexados; chamar na transação que grava o campo.
+    Falha se algum já foi usado (dois requests com o mesmo id).
+    """
+    for upload in uploads:
+        if not Upload.objects.filter(pk=upload.pk, status=Upload.STATUS_COMPLETE).update(
+            status=Upload.STATUS_ATTACHED, updated_at=timezone.now(),
+        ):
+            raise UploadError("Upload já utilizado.", status=409)
+        upload.status = Upload.STATUS_ATTACHED
+
+
+def discard(upload, storage=default_storage):
+    """Cancela um upload, apagando as partes e o arquivo ainda não anexado."""
+    names = list(upload.parts)
+    if upload.status == Upload.STATUS_COMPLETE:
+        names.append(upload.file)
+    upload.delete()
+    delete_on_commit(names, storage)
+
+
+def purge_uploads(batch_size=500, storage=default_storage):
+    """Remove uploads vencidos (e os anexados, só o registro). Retorna quantos."""
+    removed = 0
+    now = timezone.now()
+    while True:
+        batch = list(Upload.objects.filter(expires_at__lt=now).order_by('expires_at')[:batch_size])
+        if not batch:
+            return removed
+        for upload in batch:
+            if upload.status == Upload.STATUS_ATTACHED:
+                # O arquivo pertence ao campo que o referencia.
+                upload.delete()
+            else:
+                discard(upload, storage)
+            removed += 1
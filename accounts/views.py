@@ -10,10 +10,13 @@ from .forms import (
 )
 from .forms import ServiceRequestForm
 from .models import ClientProfile, ProviderProfile
-from .models import ServiceRequest, ChatMessage
+from .models import ServiceRequest, ChatMessage, ChatReadMarker
+from .realtime import push_available
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.http import JsonResponse
+from django.db import transaction
 try:
     from .api.views import (
         CreateServiceRequestAPIView,
@@ -109,24 +112,18 @@ def provider_detail(request, pk):
     provider = get_object_or_404(ProviderProfile, pk=pk)
     
     reviews = Review.objects.filter(
-        service_request__provider=provider,
+        provider=provider,
         client_rating__isnull=False
-    ).select_related('service_request', 'service_request__client').order_by('-client_reviewed_at')
+    ).select_related('service_request', 'service_request__client').order_by('-client_reviewed_at', '-id')
     
     portfolio_photos = PortfolioPhoto.objects.filter(provider=provider)
     
-    total_reviews = reviews.count()
-    if total_reviews > 0:
-        avg_rating = sum(r.client_rating for r in reviews) / total_reviews
-    else:
-        avg_rating = None
-    
     context = {
         "provider": provider,
         "reviews": reviews,
         "portfolio_photos": portfolio_photos,
-        "total_reviews": total_reviews,
-        "avg_rating": avg_rating,
+        "total_reviews": provider.rating_count,
+        "avg_rating": provider.rating_average,
     }
     return render(request, "accounts/provider_detail.html", context)
 
@@ -144,22 +141,16 @@ def client_detail(request, username):
     client_profile = client_user.client_profile
     
     reviews = Review.objects.filter(
-        service_request__client=client_user,
+        client=client_user,
         provider_rating__isnull=False
-    ).select_related('service_request', 'service_request__provider').order_by('-provider_reviewed_at')
-    
-    total_reviews = reviews.count()
-    if total_reviews > 0:
-        avg_rating = sum(r.provider_rating for r in reviews) / total_reviews
-    else:
-        avg_rating = None
+    ).select_related('service_request', 'service_request__provider').order_by('-provider_reviewed_at', '-id')
     
     context = {
         "client": client_user,
         "client_profile": client_profile,
         "reviews": reviews,
-        "total_reviews": total_reviews,
-        "avg_rating": avg_rating,
+        "total_reviews": client_profile.rating_count,
+        "avg_rating": client_profile.rating_average,
     }
     return render(request, "accounts/client_detail.html", context)
 
@@ -205,12 +196,12 @@ def provider_requests(request):
     provider = request.user.provider_profile
     active_requests = ServiceRequest.objects.filter(
         provider=provider
-    ).exclude(status=ServiceRequest.STATUS_COMPLETED).order_by('-created_at')
+    ).exclude(status=ServiceRequest.STATUS_COMPLETED).select_related('client').order_by('-created_at')
     
     completed_requests = ServiceRequest.objects.filter(
         provider=provider,
         status=ServiceRequest.STATUS_COMPLETED
-    ).order_by('-updated_at')
+    ).select_related('client').order_by('-updated_at')
     
     return render(request, 'accounts/request_list.html', {
         'active_requests': active_requests,
@@ -223,12 +214,12 @@ def provider_requests(request):
 def client_requests(request):
     active_requests = ServiceRequest.objects.filter(
         client=request.user
-    ).exclude(status=ServiceRequest.STATUS_COMPLETED).order_by('-created_at')
+    ).exclude(status=ServiceRequest.STATUS_COMPLETED).select_related('provider').order_by('-created_at')
     
     completed_requests = ServiceRequest.objects.filter(
         client=request.user,
         status=ServiceRequest.STATUS_COMPLETED
-    ).order_by('-updated_at')
+    ).select_related('provider').order_by('-updated_at')
     
     return render(request, 'accounts/request_list.html', {
         'active_requests': active_requests,
@@ -239,7 +230,7 @@ def client_requests(request):
 
 @login_required
 def request_detail(request, pk):
-    sr = get_object_or_404(ServiceRequest, pk=pk)
+    sr = get_object_or_404(ServiceRequest.objects.select_related('provider__user', 'client', 'review'), pk=pk)
 
     if not (hasattr(request.user, 'provider_profile') and request.user.provider_profile == sr.provider) and request.user != sr.client:
         return redirect('home')
@@ -261,7 +252,7 @@ def request_detail(request, pk):
 
 @login_required
 def chat_view(request, pk):
-    sr = get_object_or_404(ServiceRequest, pk=pk)
+    sr = get_object_or_404(ServiceRequest.objects.select_related('provider__user'), pk=pk)
 
     is_provider = hasattr(request.user, 'provider_profile') and request.user.provider_profile == sr.provider
     is_client = request.user == sr.client
@@ -274,8 +265,6 @@ def chat_view(request, pk):
         messages.warning(request, 'O chat está disponível apenas para solicitações aceitas.')
         return redirect('request_detail', pk=pk)
 
-    ChatMessage.objects.filter(service_request=sr).exclude(sender=request.user).update(is_read=True)
-
     if request.method == 'POST':
         content = request.POST.get('content', '').strip()
         if content:
@@ -286,13 +275,22 @@ def chat_view(request, pk):
             )
             return redirect('chat_view', pk=pk)
 
-    messages_qs = sr.messages.all()
+    messages_qs = list(sr.messages.select_related('sender'))
+
+    # Marcar lidas: só escreve quando a marca d'água do usuário avança
+    last_received = max((m.id for m in messages_qs if m.sender_id != request.user.pk), default=0)
+    last_read = sr.read_markers.filter(user=request.user).values_list('last_read_message_id', flat=True).first()
+    if last_received > (last_read or 0):
+        ChatReadMarker.advance(sr, request.user, last_received)
     
     context = {
         'service_request': sr,
         'messages': messages_qs,
         'is_provider': is_provider,
         'is_client': is_client,
+        'realtime_push': push_available(request),
+        'last_message_id': messages_qs[-1].id if messages_qs else 0,
+        'poll_interval': getattr(settings, 'CHAT_POLL_INTERVAL', 5),
     }
     return render(request, 'accounts/chat.html', context)
 
@@ -424,7 +422,8 @@ def review_service(request, pk):
                 if photo:
                     review.client_photo = photo
                 review.client_reviewed_at = timezone.now()
-                review.save()
+                with transaction.atomic():
+                    review.save()
                 messages.success(request, 'Sua avaliação foi registrada com sucesso!')
         
         elif is_provider:
@@ -434,7 +433,8 @@ def review_service(request, pk):
                 review.provider_rating = rating
                 review.provider_comment = comment
                 review.provider_reviewed_at = timezone.now()
-                review.save()
+                with transaction.atomic():
+                    review.save()
                 messages.success(request, 'Sua avaliação foi registrada com sucesso!')
 
         return redirect('request_detail', pk=pk)
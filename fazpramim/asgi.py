@@ -2,6 +2,8 @@
 ASGI config for fazpramim project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSocket connections go to the chat push channel
+(``accounts.realtime.websocket_application``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fazpramim.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from accounts.realtime import websocket_application  # noqa: E402  (precisa do Django configurado)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
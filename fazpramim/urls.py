@@ -1,8 +1,11 @@
 from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.urls import path, include, re_path
 from django.shortcuts import render
 from django.conf import settings
-from django.conf.urls.static import static
+from accounts.delivery import media_view
+from accounts.metrics import metrics_view
 from . import views
 
 def home(request):
@@ -15,7 +18,7 @@ urlpatterns = [
     path('api/accounts/', include('accounts.api.api_urls')),  # REST API (apenas isso)
     path('', include('fazpramim.app_urls')),
     path("pesquisar/", views.search_view, name="search"),
-]   
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics', metrics_view, name='metrics'),
+    # Mídia com controle de acesso e sendfile (accounts/delivery.py), também em produção.
+    re_path(r'^%s(?P<name>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media_view, name='media'),
+]
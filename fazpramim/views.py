@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.db.models import Q
+from accounts.geo import distance_km, geocode, parse_place, within_radius
 from accounts.models import ProviderProfile
+from accounts.search import search_providers
 from django.http import HttpResponse
 
 
@@ -10,17 +12,40 @@ def home(request):
 
 def search_view(request):
     query = request.GET.get("q", "").strip()
+    city = request.GET.get("cidade", "").strip()
+    radius = _radius(request.GET.get("raio"))
     results = []
-
-    if query:
-   
-        results = ProviderProfile.objects.filter(
-            Q(full_name__icontains=query) | Q(technical_qualification__icontains=query)
-        )
-    context = {"results": results, "query": query}
+    point = geocode(*parse_place(city)) if city else None
+    city_not_found = bool(city) and point is None
+
+    if (query or point) and not city_not_found:
+        results = ProviderProfile.objects.all()
+        if query:
+            results = search_providers(results, query)
+        if point:
+            results = within_radius(results, *point, radius, order=not query)
+        results = list(results[:getattr(settings, 'PROVIDER_SEARCH_MAX_RESULTS', 200)])
+        for provider in results:
+            provider.distance = distance_km(provider)
+    context = {
+        "results": results, "query": query, "city": city, "radius": radius,
+        "city_not_found": city_not_found,
+    }
 
 
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return render(request, 'fazpramim/_search_results.html', context)
 
     return render(request, "fazpramim/search.html", context)
+
+
+def _radius(value):
+    """Raio da busca em km (``?raio=``), limitado a ``GEO_MAX_RADIUS_KM``."""
+    default = getattr(settings, 'GEO_DEFAULT_RADIUS_KM', 50)
+    try:
+        radius = float(value) if value else default
+    except ValueError:
+        radius = default
+    if radius <= 0:
+        radius = default
+    return min(radius, getattr(settings, 'GEO_MAX_RADIUS_KM', 500))